@@ -0,0 +1,162 @@
+"""
+Qwen-TTS 合成结果缓存
+以 (规范化文本, 音色, 模型) 的哈希为键，将合成音频持久化到磁盘，按容量/时间上限进行 LRU 淘汰
+"""
+import os
+import re
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：去除首尾空白并合并连续空白"""
+    return _WHITESPACE_RE.sub(' ', text.strip())
+
+
+def make_cache_key(text: str, voice: str, model: str) -> str:
+    """根据文本、音色和模型生成缓存键"""
+    payload = "\x1f".join((model, voice, normalize_text(text)))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def link_or_copy(src: str, dst: str):
+    """优先创建硬链接，跨文件系统等情况下退回复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class AudioCache:
+    """磁盘音频缓存
+
+    缓存文件以 ``<key>.wav`` 保存在 cache_dir 中。文件的 mtime 记录写入时间（用于过期判断），
+    atime 记录最近一次命中时间（用于 LRU），因此重启后可直接通过扫描目录恢复淘汰顺序。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_age: float):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()  # key -> (size, created_at)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _load(self):
+        """扫描缓存目录，按最近访问时间恢复 LRU 顺序"""
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if not entry.name.endswith('.wav'):
+                # 清理上次异常退出残留的临时文件
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+                continue
+            stat = entry.stat()
+            found.append((stat.st_atime, entry.name[:-4], stat.st_size, stat.st_mtime))
+
+        for _, key, size, created_at in sorted(found):
+            self._entries[key] = (size, created_at)
+            self._total_bytes += size
+
+        with self._lock:
+            self._evict_locked()
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存，命中时返回缓存文件路径"""
+        path = self._path(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            size, created_at = entry
+            now = time.time()
+            if (self.max_age and now - created_at > self.max_age) or not os.path.exists(path):
+                self._remove_locked(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        try:
+            # 只更新 atime，原样保留 mtime（写入时间）；缓存文件与输出文件共享 inode，
+            # mtime 变化会使输出文件的 Last-Modified 和元数据索引失效
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+        return path
+
+    def put(self, key: str, file_path: str):
+        """将已生成的音频文件加入缓存"""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            link_or_copy(file_path, temp_path)
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"写入缓存失败: {e}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._total_bytes -= previous[0]
+            self._entries[key] = (size, time.time())
+            self._total_bytes += size
+            self._evict_locked()
+
+    def _remove_locked(self, key: str):
+        size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_locked(self):
+        """淘汰过期条目，并按 LRU 顺序淘汰直到满足容量上限"""
+        if self.max_age:
+            deadline = time.time() - self.max_age
+            for key in [k for k, (_, created_at) in self._entries.items() if created_at < deadline]:
+                self._remove_locked(key)
+
+        while self._entries and self._total_bytes > self.max_bytes:
+            self._remove_locked(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,222 @@
+"""
+Qwen-TTS 音频文件元数据索引
+在音频文件生成时记录其大小、内容哈希（SHA-256）、创建和最近访问时间以及所属的批量任务；
+哈希用作 HTTP 强校验器（ETag），提供文件时只需一次 stat 和一次主键查询，无需重新读取文件内容，
+其余信息供后台回收使用
+"""
+import os
+import stat
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audio_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL DEFAULT 0,
+    task_id TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_audio_files_inode ON audio_files (inode);
+"""
+
+# 旧版本数据库缺少的列（列名, 列定义）
+_MIGRATIONS = [
+    ("last_access", "REAL NOT NULL DEFAULT 0"),
+    ("task_id", "TEXT"),
+]
+
+# 依赖新增列的索引，在补齐列之后创建
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_audio_files_access ON audio_files (last_access, path);
+"""
+
+# 最近访问时间的更新间隔（秒），避免每次请求都写数据库
+ACCESS_UPDATE_INTERVAL = 60
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AudioIndex:
+    """音频文件元数据索引
+
+    输出目录中的文件只会通过 os.replace 或硬链接整体生成，不会原地修改，
+    因此 (inode, 大小, mtime) 与记录一致即可认为内容未变。
+    硬链接共享 inode，复用缓存或重复内容生成的文件可以直接沿用已有记录中的哈希。
+    """
+
+    def __init__(self, db_path: str, root: str):
+        self.db_path = db_path
+        self.root = root
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """为旧版本数据库补齐新增的列"""
+        with self._conn:
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(audio_files)")}
+            for column, definition in _MIGRATIONS:
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE audio_files ADD COLUMN {column} {definition}")
+            self._conn.execute("UPDATE audio_files SET last_access = created_at WHERE last_access = 0")
+        self._conn.executescript(_INDEXES)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def path_of(self, key: str) -> str:
+        """记录中的相对路径对应的文件路径"""
+        return os.path.join(self.root, key)
+
+    @staticmethod
+    def _stat(path: str) -> os.stat_result:
+        stat_result = os.stat(path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise FileNotFoundError(path)
+        return stat_result
+
+    @staticmethod
+    def _matches(row: sqlite3.Row, stat_result: os.stat_result) -> bool:
+        return (
+            row["inode"] == stat_result.st_ino
+            and row["size"] == stat_result.st_size
+            and row["mtime_ns"] == stat_result.st_mtime_ns
+        )
+
+    def _find_linked_digest(self, stat_result: os.stat_result) -> Optional[str]:
+        """查找同一 inode（硬链接）的有效记录"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT inode, size, mtime_ns, sha256 FROM audio_files WHERE inode = ?",
+                (stat_result.st_ino,)
+            ).fetchall()
+        for row in rows:
+            if self._matches(row, stat_result):
+                return row["sha256"]
+        return None
+
+    def register(self, path: str, sha256: Optional[str] = None, task_id: Optional[str] = None) -> Dict[str, Any]:
+        """记录新生成的文件；未提供哈希时优先沿用硬链接的记录，否则读取文件计算
+
+        task_id 为所属的批量任务，未提供时保留已有记录中的值。
+        """
+        stat_result = self._stat(path)
+        if sha256 is None:
+            sha256 = self._find_linked_digest(stat_result) or file_sha256(path)
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO audio_files (path, size, mtime_ns, inode, sha256, created_at, last_access, task_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                "inode = excluded.inode, sha256 = excluded.sha256, last_access = excluded.last_access, "
+                "task_id = COALESCE(excluded.task_id, audio_files.task_id)",
+                (self._key(path), stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino,
+                 sha256, now, now, task_id)
+            )
+        return {"sha256": sha256, "stat": stat_result}
+
+    def describe(self, path: str) -> Dict[str, Any]:
+        """获取文件的哈希和 stat 信息，记录缺失或过期时重新登记
+
+        文件不存在时抛出 FileNotFoundError。
+        """
+        stat_result = self._stat(path)
+        key = self._key(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT inode, size, mtime_ns, sha256, last_access FROM audio_files WHERE path = ?",
+                (key,)
+            ).fetchone()
+        if not row or not self._matches(row, stat_result):
+            return self.register(path)
+
+        now = time.time()
+        if now - row["last_access"] > ACCESS_UPDATE_INTERVAL:
+            with self._lock, self._conn:
+                self._conn.execute("UPDATE audio_files SET last_access = ? WHERE path = ?", (now, key))
+        return {"sha256": row["sha256"], "stat": stat_result}
+
+    def contains(self, path: str) -> bool:
+        """文件是否已有记录"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM audio_files WHERE path = ?", (self._key(path),)).fetchone()
+        return row is not None
+
+    def remove(self, path: str) -> bool:
+        """删除文件记录，返回是否还有其他记录与其共享 inode（硬链接）"""
+        key = self._key(path)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT inode FROM audio_files WHERE path = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("DELETE FROM audio_files WHERE path = ?", (key,))
+            linked = self._conn.execute(
+                "SELECT 1 FROM audio_files WHERE inode = ? LIMIT 1", (row["inode"],)
+            ).fetchone()
+        return linked is not None
+
+    def total_bytes(self) -> int:
+        """已记录文件占用的磁盘空间（硬链接只计算一次）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) AS total FROM "
+                "(SELECT MAX(size) AS size FROM audio_files GROUP BY inode)"
+            ).fetchone()
+        return row["total"]
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计信息"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) AS count FROM audio_files").fetchone()["count"]
+        return {"files": files, "size_bytes": self.total_bytes()}
+
+    def least_recently_used(
+        self,
+        accessed_before: float,
+        after: Optional[Tuple[float, str]] = None,
+        limit: int = 500
+    ) -> List[Dict[str, Any]]:
+        """按最近访问时间从早到晚返回记录（键集分页，after 为上一页最后一条的 (last_access, path)）"""
+        after_access, after_path = after if after else (-1.0, "")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, last_access, created_at, task_id FROM audio_files "
+                "WHERE last_access < ? AND (last_access > ? OR (last_access = ? AND path > ?)) "
+                "ORDER BY last_access, path LIMIT ?",
+                (accessed_before, after_access, after_access, after_path, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,136 @@
+"""
+Qwen-TTS 批量音频合并
+按分段顺序将 WAV 音频增量追加到同一个输出文件，分段之间插入静音，并写入章节标记（cue 点）
+"""
+import os
+import wave
+import struct
+from typing import Optional, List, Dict, Any, Tuple
+
+WAV_HEADER_SIZE = 44
+COPY_FRAMES = 64 * 1024
+
+
+class MergedAudioWriter:
+    """增量拼接 WAV 文件
+
+    输出文件始终保持为合法的 WAV（每次追加后更新头部的长度字段），
+    已写入的帧数由调用方持久化，重启后据此截断未完成的追加并继续写入。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        silence_ms: int,
+        frames_written: int = 0,
+        params: Optional[Tuple[int, int, int]] = None
+    ):
+        self.path = path
+        self.silence_ms = silence_ms
+        self.frames_written = frames_written
+        self.params = params  # (channels, sample_width, frame_rate)
+
+    @property
+    def block_align(self) -> int:
+        channels, sample_width, _ = self.params
+        return channels * sample_width
+
+    @property
+    def position_seconds(self) -> float:
+        return self.frames_written / self.params[2] if self.params else 0.0
+
+    def _write_header(self, f):
+        channels, sample_width, frame_rate = self.params
+        data_size = self.frames_written * self.block_align
+        f.seek(0)
+        f.write(b"RIFF")
+        f.write(struct.pack("<I", 36 + data_size))
+        f.write(b"WAVE")
+        f.write(b"fmt ")
+        f.write(struct.pack(
+            "<IHHIIHH", 16, 1, channels, frame_rate,
+            frame_rate * channels * sample_width, channels * sample_width, sample_width * 8
+        ))
+        f.write(b"data")
+        f.write(struct.pack("<I", data_size))
+
+    def _open_output(self):
+        """打开输出文件，并截断到已记录的长度"""
+        if self.frames_written == 0 or not os.path.exists(self.path):
+            self.frames_written = 0
+            f = open(self.path, "w+b")
+            self._write_header(f)
+            return f
+
+        f = open(self.path, "r+b")
+        f.truncate(WAV_HEADER_SIZE + self.frames_written * self.block_align)
+        return f
+
+    def append(self, segment_path: str) -> float:
+        """追加一个分段（按块复制，不整体读入内存），返回该分段在合并音频中的起始时间（秒）
+
+        追加失败时恢复到追加前的状态，下次写入会截断残留数据。
+        """
+        frames_before, params_before = self.frames_written, self.params
+        try:
+            with wave.open(segment_path, "rb") as segment:
+                params = (segment.getnchannels(), segment.getsampwidth(), segment.getframerate())
+                if self.params is None:
+                    self.params = params
+                elif params != self.params:
+                    raise ValueError(f"音频格式不一致: {params} != {self.params}")
+
+                with self._open_output() as f:
+                    f.seek(0, os.SEEK_END)
+
+                    if self.frames_written > 0 and self.silence_ms > 0:
+                        # 分段之间插入静音
+                        silence_frames = int(self.params[2] * self.silence_ms / 1000)
+                        f.write(b"\x00" * (silence_frames * self.block_align))
+                        self.frames_written += silence_frames
+
+                    start_seconds = self.position_seconds
+                    while True:
+                        frames = segment.readframes(COPY_FRAMES)
+                        if not frames:
+                            break
+                        f.write(frames)
+                        self.frames_written += len(frames) // self.block_align
+
+                    self._write_header(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        except Exception:
+            self.frames_written, self.params = frames_before, params_before
+            raise
+
+        return start_seconds
+
+    def finalize(self, chapters: List[Dict[str, Any]]):
+        """在 data 块之后写入 cue 点和章节标签（LIST/adtl），完成合并文件"""
+        if self.params is None:
+            return
+
+        frame_rate = self.params[2]
+        cue = struct.pack("<I", len(chapters))
+        labels = b""
+        for cue_id, chapter in enumerate(chapters, start=1):
+            sample_offset = int(chapter["start"] * frame_rate)
+            cue += struct.pack("<II4sIII", cue_id, sample_offset, b"data", 0, 0, sample_offset)
+
+            text = chapter["title"].encode("utf-8") + b"\x00"
+            if len(text) % 2:
+                text += b"\x00"
+            labels += b"labl" + struct.pack("<II", 4 + len(text), cue_id) + text
+
+        extra = b"cue " + struct.pack("<I", len(cue)) + cue
+        adtl = b"adtl" + labels
+        extra += b"LIST" + struct.pack("<I", len(adtl)) + adtl
+
+        with self._open_output() as f:
+            f.seek(0, os.SEEK_END)
+            f.write(extra)
+            data_size = self.frames_written * self.block_align
+            f.seek(4)
+            f.write(struct.pack("<I", 36 + data_size + len(extra)))
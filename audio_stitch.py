@@ -0,0 +1,73 @@
+"""
+Qwen-TTS 长文本音频拼接
+按顺序拼接 16bit PCM 分段，相邻分段之间做短交叉淡化，避免拼接处出现爆音
+"""
+import sys
+import struct
+from array import array
+
+# 流式 WAV 头中未知长度的占位值
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def streaming_wav_header(sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """长度未知的 WAV 头（用于边合成边输出，播放器读到数据结束为止）"""
+    return (
+        b"RIFF" + struct.pack("<I", UNKNOWN_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack(
+            "<IHHIIHH", 16, 1, channels, sample_rate,
+            sample_rate * channels * sample_width, channels * sample_width, sample_width * 8
+        )
+        + b"data" + struct.pack("<I", UNKNOWN_SIZE)
+    )
+
+
+class CrossfadeStitcher:
+    """增量交叉淡化拼接
+
+    add() 依次输入各分段的 PCM（16bit 小端），返回可以立即输出的数据；每个分段末尾
+    crossfade_ms 的数据暂不输出，与下一个分段的开头线性混合后再输出。
+    全部输入后调用 finish() 取出剩余数据。分段较短时相应缩短淡化长度。
+    """
+
+    def __init__(self, sample_rate: int, crossfade_ms: int, channels: int = 1):
+        self.channels = channels
+        self.fade_frames = int(sample_rate * crossfade_ms / 1000)
+        self._tail = array("h")
+
+    def _samples(self, pcm: bytes) -> array:
+        samples = array("h")
+        samples.frombytes(pcm[:len(pcm) - len(pcm) % (2 * self.channels)])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        return samples
+
+    def _bytes(self, samples: array) -> bytes:
+        if sys.byteorder == "big":
+            samples = array("h", samples)
+            samples.byteswap()
+        return samples.tobytes()
+
+    def add(self, pcm: bytes) -> bytes:
+        samples = self._samples(pcm)
+        channels = self.channels
+        frames = len(samples) // channels
+        # 淡化长度不超过本分段的一半
+        overlap = min(len(self._tail) // channels, frames // 2)
+
+        output = array("h")
+        keep = len(self._tail) - overlap * channels
+        output.extend(self._tail[:keep])
+        for i in range(overlap * channels):
+            weight = (i // channels + 1) / (overlap + 1)
+            mixed = int(self._tail[keep + i] * (1 - weight) + samples[i] * weight)
+            output.append(max(-32768, min(32767, mixed)))
+
+        hold = min(self.fade_frames, frames - overlap) * channels
+        output.extend(samples[overlap * channels:len(samples) - hold])
+        self._tail = samples[len(samples) - hold:]
+        return self._bytes(output)
+
+    def finish(self) -> bytes:
+        tail, self._tail = self._tail, array("h")
+        return self._bytes(tail)
@@ -0,0 +1,181 @@
+"""
+Qwen-TTS 音频文件存储
+按文件名哈希前缀将音频分散到多级子目录，避免单个目录中文件过多；
+后台回收器按最近访问时间和总容量上限清理文件，不会回收仍在处理中的批量任务引用的文件
+"""
+import os
+import time
+import hashlib
+from typing import Callable, Dict, Any, Iterable, Set, Tuple
+
+from audio_index import AudioIndex
+
+# 写入中断残留的临时文件超过该时间（秒）后清理
+STALE_TEMP_AGE = 3600
+_TEMP_SUFFIXES = (".part", ".tmp")
+
+
+class AudioStorage:
+    """分片存储：tts_xxx.wav -> <root>/ab/cd/tts_xxx.wav
+
+    分片由文件名第一个 "." 之前的部分决定，转码变体（tts_xxx.64k.mp3）与源文件位于同一目录。
+    对外仍只使用文件名，旧版本平铺在根目录的文件由 reconcile() 迁移到分片目录。
+    """
+
+    def __init__(self, root: str, levels: int = 2):
+        self.root = root
+        self.levels = levels
+        self._created_dirs: Set[str] = set()
+        # 迁移完成前，分片目录中找不到的文件回退到根目录查找
+        self._legacy_layout = True
+        os.makedirs(root, exist_ok=True)
+
+    def shard_dir(self, filename: str) -> str:
+        digest = hashlib.md5(filename.split(".", 1)[0].encode("utf-8")).hexdigest()
+        parts = [digest[i * 2:i * 2 + 2] for i in range(self.levels)]
+        return os.path.join(self.root, *parts)
+
+    def path(self, filename: str, create: bool = False) -> str:
+        """文件名对应的存储路径，create 为 True 时确保分片目录存在"""
+        directory = self.shard_dir(filename)
+        if create and directory not in self._created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._created_dirs.add(directory)
+
+        path = os.path.join(directory, filename)
+        if self._legacy_layout and not create and not os.path.exists(path):
+            legacy_path = os.path.join(self.root, filename)
+            if os.path.isfile(legacy_path):
+                return legacy_path
+        return path
+
+    def _is_shard_dir(self, name: str) -> bool:
+        return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+    def reconcile(self, index: AudioIndex, keep_prefixes: Tuple[str, ...] = ()) -> Dict[str, int]:
+        """启动时在后台执行一次：迁移根目录中的旧文件，登记索引中缺失的文件，清理残留的临时文件
+
+        以 keep_prefixes 开头的临时文件（如未完成任务的合并进度）不会被清理。
+        """
+        counts = {"migrated": 0, "registered": 0, "temp_removed": 0}
+        now = time.time()
+
+        def handle(entry: os.DirEntry, in_shard: bool):
+            if entry.name.endswith(_TEMP_SUFFIXES):
+                if not entry.name.startswith(keep_prefixes) and now - entry.stat().st_mtime > STALE_TEMP_AGE:
+                    os.unlink(entry.path)
+                    counts["temp_removed"] += 1
+                return
+
+            path = entry.path
+            if not in_shard:
+                path = self.path(entry.name, create=True)
+                os.replace(entry.path, path)
+                index.remove(entry.path)
+                counts["migrated"] += 1
+
+            if not index.contains(path):
+                index.register(path)
+                counts["registered"] += 1
+
+        def walk(directory: str, depth: int):
+            for entry in os.scandir(directory):
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth < self.levels and self._is_shard_dir(entry.name):
+                            walk(entry.path, depth + 1)
+                    elif entry.is_file(follow_symlinks=False) and (depth == 0 or depth == self.levels):
+                        handle(entry, in_shard=depth > 0)
+                except OSError as e:
+                    print(f"整理音频文件 {entry.path} 失败: {e}")
+
+        walk(self.root, 0)
+        self._legacy_layout = False
+        return counts
+
+
+class AudioCollector:
+    """音频文件回收器
+
+    依次执行：
+    - 删除超过 max_age 秒未被访问的文件
+    - 总容量超过 max_bytes 时，按最近访问时间从早到晚删除，直到满足上限
+    创建不足 grace 秒的文件（可能尚未登记所属任务）以及 protected_tasks() 返回的任务所属的文件不会被删除。
+    """
+
+    def __init__(
+        self,
+        index: AudioIndex,
+        max_age: float,
+        max_bytes: int,
+        grace: float,
+        protected_tasks: Callable[[], Iterable[str]]
+    ):
+        self.index = index
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self.protected_tasks = protected_tasks
+        self.removed_files = 0
+        self.freed_bytes = 0
+
+    def collect(self) -> Dict[str, Any]:
+        """执行一轮回收（阻塞，应在线程池中调用）"""
+        now = time.time()
+        protected = set(self.protected_tasks())
+        removed = freed = 0
+
+        def collectable(entry: Dict[str, Any]) -> bool:
+            return now - entry["created_at"] >= self.grace and entry["task_id"] not in protected
+
+        if self.max_age:
+            for entry in self._iter_lru(now - self.max_age):
+                if collectable(entry):
+                    removed += 1
+                    freed += self._remove(entry)
+
+        if self.max_bytes:
+            total = self.index.total_bytes()
+            if total > self.max_bytes:
+                for entry in self._iter_lru(now):
+                    if total <= self.max_bytes:
+                        break
+                    if collectable(entry):
+                        size = self._remove(entry)
+                        removed += 1
+                        freed += size
+                        total -= size
+
+        self.removed_files += removed
+        self.freed_bytes += freed
+        return {"removed": removed, "freed_bytes": freed}
+
+    def _iter_lru(self, accessed_before: float) -> Iterable[Dict[str, Any]]:
+        after = None
+        while True:
+            entries = self.index.least_recently_used(accessed_before, after)
+            if not entries:
+                return
+            yield from entries
+            after = (entries[-1]["last_access"], entries[-1]["path"])
+
+    def _remove(self, entry: Dict[str, Any]) -> int:
+        """删除文件及其记录，返回释放的空间（仍有其他硬链接时为 0）"""
+        path = self.index.path_of(entry["path"])
+        linked = self.index.remove(path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"删除音频文件 {path} 失败: {e}")
+            return 0
+        return 0 if linked else entry["size"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.index.stats(),
+            "max_bytes": self.max_bytes,
+            "removed_files": self.removed_files,
+            "freed_bytes": self.freed_bytes
+        }
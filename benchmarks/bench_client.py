@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+上游调用方式基准测试
+对比原生异步客户端（native）与 DashScope SDK + 线程池（sdk）两种方式：
+1. 单次请求开销：模拟服务无延迟时顺序调用的耗时分布
+2. 可持续并发：模拟服务有固定延迟时，不同并发数下的吞吐量和有效并发数
+
+用法:
+    python benchmarks/bench_client.py --requests 200 --latency 0.2 --concurrency 8,32,128,256 --json result.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault("DASHSCOPE_API_KEY", "sk-benchmark")
+
+MODES = ("native", "sdk")
+TEXT = "你好，欢迎使用 Qwen-TTS 语音合成服务！"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_server(latency: float):
+    """在独立进程中启动模拟服务，返回 (进程, 接口地址)"""
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_dashscope.py"),
+        "--port", str(port), "--latency", str(latency)
+    ])
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}/api/v1"
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("模拟服务启动失败")
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def request_func(service, mode: str):
+    return service.request_audio_url_native if mode == "native" else service.request_audio_url_sdk
+
+
+async def measure_overhead(service, mode: str, requests_count: int) -> dict:
+    """顺序调用，统计单次请求耗时（毫秒）"""
+    call = request_func(service, mode)
+    await call(TEXT, "Cherry", "qwen-tts-latest")  # 预热连接
+
+    latencies = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        await call(TEXT, "Cherry", "qwen-tts-latest")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99)
+    }
+
+
+async def measure_concurrency(service, mode: str, concurrency: int, latency: float) -> dict:
+    """同时发起 concurrency 个请求，统计吞吐量和有效并发数"""
+    call = request_func(service, mode)
+    start = time.perf_counter()
+    await asyncio.gather(*(call(TEXT, "Cherry", "qwen-tts-latest") for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    throughput = concurrency / elapsed
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": throughput,
+        # 有效并发数 = 吞吐量 × 单次上游延迟，理想情况下等于 concurrency
+        "effective_concurrency": throughput * latency
+    }
+
+
+async def run_benchmark(args) -> dict:
+    import dashscope
+    import main
+
+    service = main.tts_service
+    results = {
+        "config": {
+            "requests": args.requests,
+            "latency_s": args.latency,
+            "http_max_connections": main.config.HTTP_MAX_CONNECTIONS,
+            "executor_workers": min(32, (os.cpu_count() or 1) + 4)
+        },
+        "overhead": {},
+        "concurrency": {}
+    }
+
+    process, base_url = start_fake_server(0.0)
+    try:
+        dashscope.base_http_api_url = base_url
+        service.dashscope_client.base_url = base_url
+        for mode in MODES:
+            results["overhead"][mode] = await measure_overhead(service, mode, args.requests)
+    finally:
+        process.kill()
+
+    process, base_url = start_fake_server(args.latency)
+    try:
+        dashscope.base_http_api_url = base_url
+        service.dashscope_client.base_url = base_url
+        for mode in MODES:
+            results["concurrency"][mode] = [
+                await measure_concurrency(service, mode, concurrency, args.latency)
+                for concurrency in args.concurrency
+            ]
+    finally:
+        process.kill()
+        await service.close()
+
+    return results
+
+
+def print_report(results: dict):
+    print("单次请求开销（模拟服务无延迟）")
+    for mode, stats in results["overhead"].items():
+        print(f"  {mode:<7} mean {stats['mean_ms']:7.2f} ms  p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms")
+
+    print(f"\n可持续并发（模拟服务延迟 {results['config']['latency_s']} 秒）")
+    for mode, rows in results["concurrency"].items():
+        for row in rows:
+            print(
+                f"  {mode:<7} 并发 {row['concurrency']:4d}  耗时 {row['elapsed_s']:6.2f} s  "
+                f"吞吐 {row['throughput_rps']:8.1f} req/s  有效并发 {row['effective_concurrency']:6.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比原生异步客户端与 SDK 线程池调用方式")
+    parser.add_argument("--requests", type=int, default=200, help="单次请求开销测试的请求数")
+    parser.add_argument("--latency", type=float, default=0.2, help="并发测试时模拟服务的延迟（秒）")
+    parser.add_argument("--concurrency", default="8,32,128,256", help="并发测试的并发数列表，逗号分隔")
+    parser.add_argument("--json", help="将结果以 JSON 格式写入指定文件")
+    args = parser.parse_args()
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+
+    os.chdir(ROOT_DIR)
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
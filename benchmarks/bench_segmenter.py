@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+文本分段基准测试
+对比原 FileParser 的分段实现与流式分段器 TextSegmenter：
+1. 吞吐量：在多 MB 的中文/英文长篇文本上的处理速度，以及文本增大时耗时是否线性增长
+2. 分段质量：超过 max_length 的分段数量、最长分段长度
+
+用法:
+    python benchmarks/bench_segmenter.py --sizes 1,2,4 --max-length 500
+    python benchmarks/bench_segmenter.py --file novel.txt --json result.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from text_segmenter import iter_segments  # noqa: E402
+
+MODES = ("paragraph", "sentence", "chapter")
+CHUNK_SIZE = 64 * 1024
+
+
+def legacy_parse(content: str, split_by: str, max_length: int):
+    """原 FileParser.parse_text_file 的实现（作为对照）"""
+    def split_long_text(text):
+        if len(text) <= max_length:
+            return [text]
+        segments = []
+        current_segment = ""
+        for word in text.split():
+            if len(current_segment + " " + word) <= max_length:
+                current_segment += (" " + word) if current_segment else word
+            else:
+                if current_segment:
+                    segments.append(current_segment)
+                current_segment = word
+        if current_segment:
+            segments.append(current_segment)
+        return segments
+
+    segments = []
+    if split_by == "paragraph":
+        for para in re.split(r'\n\s*\n', content.strip()):
+            para = para.strip()
+            if para:
+                segments.extend(split_long_text(para))
+    elif split_by == "sentence":
+        current_segment = ""
+        for sentence in re.split(r'[。！？.!?]\s*', content):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if len(current_segment + sentence) <= max_length:
+                current_segment += sentence + "。"
+            else:
+                if current_segment:
+                    segments.append(current_segment.strip())
+                current_segment = sentence + "。"
+        if current_segment:
+            segments.append(current_segment.strip())
+    elif split_by == "chapter":
+        for chapter in re.split(r'\n#+\s+', content):
+            chapter = chapter.strip()
+            if chapter:
+                segments.extend(split_long_text(chapter))
+    return [seg for seg in segments if seg.strip()]
+
+
+def streaming_parse(content: str, split_by: str, max_length: int):
+    """以 64KB 数据块输入流式分段器"""
+    chunks = (content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE))
+    return list(iter_segments(chunks, split_by, max_length))
+
+
+def generate_novel(size_bytes: int, language: str, seed: int = 42) -> str:
+    """生成指定大小（UTF-8 字节数）的模拟长篇小说，包含章节标题、普通段落和无换行的超长段落"""
+    rng = random.Random(seed)
+    if language == "zh":
+        words = ["他", "她", "我们", "天空", "城市", "慢慢地", "走过", "看见", "远处的", "灯光", "河流", "记忆", "那一年", "风"]
+        clause_marks, sentence_marks = ["，", "，", "、", "；"], ["。", "。", "！", "？", "……"]
+        joiner = ""
+    else:
+        words = ["he", "she", "walked", "through", "the", "city", "and", "saw", "distant", "lights", "river", "memory", "wind"]
+        clause_marks, sentence_marks = [",", ",", ";"], [".", ".", "!", "?"]
+        joiner = " "
+
+    def sentence():
+        clauses = [
+            joiner.join(rng.choice(words) for _ in range(rng.randint(3, 8)))
+            for _ in range(rng.randint(1, 4))
+        ]
+        text = clauses[0]
+        for clause in clauses[1:]:
+            text += rng.choice(clause_marks) + joiner + clause
+        return text + rng.choice(sentence_marks)
+
+    parts, size, chapter = [], 0, 0
+    while size < size_bytes:
+        if rng.random() < 0.02:
+            chapter += 1
+            part = f"# 第{chapter}章\n\n" if language == "zh" else f"# Chapter {chapter}\n\n"
+        else:
+            # 约 5% 的段落是数千字、中间没有换行的长段落
+            count = rng.randint(80, 200) if rng.random() < 0.05 else rng.randint(2, 8)
+            part = joiner.join(sentence() for _ in range(count)) + "\n\n"
+        parts.append(part)
+        size += len(part.encode("utf-8"))
+    return "".join(parts)
+
+
+def measure(parse, content: str, split_by: str, max_length: int) -> dict:
+    start = time.perf_counter()
+    segments = parse(content, split_by, max_length)
+    elapsed = time.perf_counter() - start
+    size_mb = len(content.encode("utf-8")) / (1024 * 1024)
+    return {
+        "elapsed_s": elapsed,
+        "throughput_mb_s": size_mb / elapsed if elapsed else float("inf"),
+        "segments": len(segments),
+        "max_segment_length": max((len(seg) for seg in segments), default=0),
+        "oversized_segments": sum(1 for seg in segments if len(seg) > max_length)
+    }
+
+
+def run_benchmark(args) -> dict:
+    corpora = []
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            corpora.append((os.path.basename(args.file), f.read()))
+    else:
+        for language in ("zh", "en"):
+            for size in args.sizes:
+                corpora.append((f"{language}-{size}MB", generate_novel(int(size * 1024 * 1024), language)))
+
+    results = {"config": {"max_length": args.max_length}, "runs": []}
+    for name, content in corpora:
+        for split_by in MODES:
+            results["runs"].append({
+                "corpus": name,
+                "split_by": split_by,
+                "legacy": measure(legacy_parse, content, split_by, args.max_length),
+                "streaming": measure(streaming_parse, content, split_by, args.max_length)
+            })
+    return results
+
+
+def print_report(results: dict):
+    print(f"max_length = {results['config']['max_length']}")
+    print(f"{'语料':<10} {'方式':<10} {'实现':<10} {'耗时(s)':>8} {'MB/s':>8} {'分段数':>8} {'最长':>8} {'超长分段':>8}")
+    for run in results["runs"]:
+        for impl in ("legacy", "streaming"):
+            stats = run[impl]
+            print(
+                f"{run['corpus']:<10} {run['split_by']:<10} {impl:<10} {stats['elapsed_s']:8.3f} "
+                f"{stats['throughput_mb_s']:8.1f} {stats['segments']:8d} {stats['max_segment_length']:8d} "
+                f"{stats['oversized_segments']:8d}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比原分段实现与流式分段器")
+    parser.add_argument("--sizes", default="1,2,4", help="生成的模拟文本大小（MB），逗号分隔")
+    parser.add_argument("--file", help="使用指定的 UTF-8 文本文件代替模拟文本")
+    parser.add_argument("--max-length", type=int, default=500, help="每段最大字符数")
+    parser.add_argument("--json", help="将结果以 JSON 格式写入指定文件")
+    args = parser.parse_args()
+    args.sizes = [float(value) for value in args.sizes.split(",")]
+
+    results = run_benchmark(args)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
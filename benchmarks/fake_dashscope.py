@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+本地模拟 DashScope Qwen-TTS 服务
+实现语音合成接口（普通 / SSE 流式）及音频下载地址，用于离线测试和压测。
+可配置延迟分布、错误率、限流（429）注入、流式中途出错或截断和音频大小，/stats 返回请求和注入错误的计数。
+
+用法:
+    python benchmarks/fake_dashscope.py --port 9000
+    python benchmarks/fake_dashscope.py --latency 0.3 --latency-dist lognormal --error-rate 0.02 --throttle-rate 0.05
+    python benchmarks/fake_dashscope.py --stream-error-rate 0.1 --stream-error-status 503
+    python benchmarks/fake_dashscope.py --stream-truncate-rate 0.1
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:9000/api/v1 python start.py
+"""
+import io
+import json
+import asyncio
+import math
+import uuid
+import wave
+import random
+import base64
+import struct
+import argparse
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+# 每个字符对应的音频时长（秒），用于生成与文本长度成比例的音频
+SECONDS_PER_CHAR = 0.05
+STREAM_CHUNK_SECONDS = 0.2
+# 合成接口的模拟延迟（秒）及其分布：fixed（固定）、uniform（0 ~ 2 倍均匀分布）、
+# exponential（指数分布）、lognormal（对数正态分布，长尾，LATENCY_SIGMA 控制尾部）
+LATENCY = 0.0
+LATENCY_DIST = "fixed"
+LATENCY_SIGMA = 0.5
+# 音频下载地址的模拟延迟（秒），使用相同的分布
+AUDIO_LATENCY = 0.0
+# 返回 500 InternalError 和 429 限流的概率
+ERROR_RATE = 0.0
+THROTTLE_RATE = 0.0
+RETRY_AFTER = 1  # 限流响应的 Retry-After（秒）
+# 流式响应在第一个音频块之后以 error 事件中断的概率及其状态码
+STREAM_ERROR_RATE = 0.0
+STREAM_ERROR_STATUS = 500
+# 流式响应在第一个音频块之后直接结束（不发送 finish_reason 为 stop 的结束事件）的概率
+STREAM_TRUNCATE_RATE = 0.0
+# 固定的音频 PCM 数据大小（字节），0 表示与文本长度成比例
+AUDIO_BYTES = 0
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+_random = random.Random()
+stats = Counter()
+
+app = FastAPI(title="Fake DashScope")
+
+
+# 400Hz 正弦波的一个周期（24000 / 400 = 60 个采样点）
+_SINE_PERIOD = b"".join(
+    struct.pack("<h", int(8000 * math.sin(2 * math.pi * i / 60)))
+    for i in range(60)
+)
+
+
+def sample_latency(mean: float) -> float:
+    """按配置的分布生成一次延迟（均值为 mean）"""
+    if mean <= 0:
+        return 0.0
+    if LATENCY_DIST == "uniform":
+        return _random.uniform(0, 2 * mean)
+    if LATENCY_DIST == "exponential":
+        return _random.expovariate(1 / mean)
+    if LATENCY_DIST == "lognormal":
+        # 使分布的均值等于 mean
+        return _random.lognormvariate(math.log(mean) - LATENCY_SIGMA ** 2 / 2, LATENCY_SIGMA)
+    return mean
+
+
+def make_pcm(text: str) -> bytes:
+    """生成与文本长度成比例（或固定为 AUDIO_BYTES 字节）的正弦波 PCM 数据"""
+    frames = max(1, int(len(text) * SECONDS_PER_CHAR * SAMPLE_RATE))
+    if AUDIO_BYTES:
+        frames = max(1, AUDIO_BYTES // SAMPLE_WIDTH)
+    repeats = frames // 60 + 1
+    return (_SINE_PERIOD * repeats)[:frames * SAMPLE_WIDTH]
+
+
+def make_wav(pcm: bytes) -> bytes:
+    """将 PCM 数据封装为 WAV"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def sse_event(event_id: int, payload: dict, event: str = "result", status: int = 200) -> str:
+    return f"id:{event_id}\nevent:{event}\n:HTTP_STATUS/{status}\ndata:{json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/v1/services/aigc/multimodal-generation/generation")
+async def generation(request: Request):
+    """Qwen-TTS 语音合成接口"""
+    if not request.headers.get("Authorization"):
+        return JSONResponse(status_code=401, content={"code": "InvalidApiKey", "message": "No API-key provided."})
+
+    body = await request.json()
+    text = body.get("input", {}).get("text", "")
+    stats["requests"] += 1
+    if LATENCY:
+        await asyncio.sleep(sample_latency(LATENCY))
+
+    roll = _random.random()
+    if roll < THROTTLE_RATE:
+        stats["throttled"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(RETRY_AFTER)},
+            content={"code": "Throttling.RateQuota", "message": "Requests rate limit exceeded."}
+        )
+    if roll < THROTTLE_RATE + ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"code": "InternalError", "message": "Injected error."})
+
+    request_id = str(uuid.uuid4())
+    audio_id = f"audio_{uuid.uuid4().hex}"
+    audio_url = f"{request.base_url}audio/{audio_id}.wav?chars={len(text)}"
+    usage = {"input_tokens": len(text), "output_tokens": len(text) * 2}
+
+    if request.headers.get("X-DashScope-SSE") != "enable":
+        return {
+            "output": {
+                "finish_reason": "stop",
+                "audio": {"id": audio_id, "url": audio_url, "data": "", "expires_at": 0}
+            },
+            "usage": usage,
+            "request_id": request_id
+        }
+
+    pcm = make_pcm(text)
+    chunk_bytes = int(STREAM_CHUNK_SECONDS * SAMPLE_RATE) * SAMPLE_WIDTH
+    stream_error = _random.random() < STREAM_ERROR_RATE
+    stream_truncated = not stream_error and _random.random() < STREAM_TRUNCATE_RATE
+
+    def events():
+        event_id = 1
+        for offset in range(0, len(pcm), chunk_bytes):
+            data = base64.b64encode(pcm[offset:offset + chunk_bytes]).decode("ascii")
+            yield sse_event(event_id, {
+                "output": {"finish_reason": "null", "audio": {"id": audio_id, "data": data}},
+                "usage": usage,
+                "request_id": request_id
+            })
+            event_id += 1
+            if stream_error:
+                stats["stream_errors"] += 1
+                yield sse_event(event_id, {
+                    "code": "Throttling" if STREAM_ERROR_STATUS == 429 else "InternalError",
+                    "message": "Injected stream error.",
+                    "request_id": request_id
+                }, event="error", status=STREAM_ERROR_STATUS)
+                return
+            if stream_truncated:
+                stats["stream_truncated"] += 1
+                return
+        yield sse_event(event_id, {
+            "output": {"finish_reason": "stop", "audio": {"id": audio_id, "url": audio_url, "data": ""}},
+            "usage": usage,
+            "request_id": request_id
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/audio/{audio_name}")
+async def audio(audio_name: str, chars: int = 10):
+    """合成结果的音频下载地址"""
+    stats["downloads"] += 1
+    if AUDIO_LATENCY:
+        await asyncio.sleep(sample_latency(AUDIO_LATENCY))
+    return Response(content=make_wav(make_pcm("x" * chars)), media_type="audio/wav")
+
+
+@app.get("/stats")
+async def get_stats():
+    """收到的合成请求、下载请求和注入的错误数"""
+    return {key: stats[key] for key in ("requests", "downloads", "errors", "throttled", "stream_errors", "stream_truncated")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 DashScope Qwen-TTS 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="合成接口的平均模拟延迟（秒）")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed", help="延迟分布")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal 分布的 sigma，越大尾部越长")
+    parser.add_argument("--audio-latency", type=float, default=0.0, help="音频下载的平均模拟延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 错误的概率")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 限流的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="限流响应的 Retry-After（秒）")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="流式响应中途返回 error 事件的概率")
+    parser.add_argument("--stream-error-status", type=int, default=500, help="流式 error 事件的状态码")
+    parser.add_argument("--stream-truncate-rate", type=float, default=0.0, help="流式响应在结束事件之前中断的概率")
+    parser.add_argument("--audio-bytes", type=int, default=0, help="固定的音频数据大小（字节），默认与文本长度成比例")
+    parser.add_argument("--seed", type=int, help="随机数种子")
+    args = parser.parse_args()
+
+    global LATENCY, LATENCY_DIST, LATENCY_SIGMA, AUDIO_LATENCY, ERROR_RATE, THROTTLE_RATE, RETRY_AFTER, AUDIO_BYTES
+    global STREAM_ERROR_RATE, STREAM_ERROR_STATUS, STREAM_TRUNCATE_RATE
+    LATENCY = args.latency
+    LATENCY_DIST = args.latency_dist
+    LATENCY_SIGMA = args.latency_sigma
+    AUDIO_LATENCY = args.audio_latency
+    ERROR_RATE = args.error_rate
+    THROTTLE_RATE = args.throttle_rate
+    RETRY_AFTER = args.retry_after
+    STREAM_ERROR_RATE = args.stream_error_rate
+    STREAM_ERROR_STATUS = args.stream_error_status
+    STREAM_TRUNCATE_RATE = args.stream_truncate_rate
+    AUDIO_BYTES = args.audio_bytes
+    _random.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+服务压测
+在独立进程中启动本地模拟 DashScope 服务和 Qwen-TTS 服务（使用临时工作目录，不影响项目数据），
+按目标并发驱动 /api/synthesize 和 /api/batch/upload，统计：
+1. 吞吐量（req/s、分段/s）和延迟分位数
+2. 服务进程的峰值内存（RSS）
+3. 事件循环延迟（来自服务的 /metrics）
+4. 模拟服务收到的上游请求数和注入的错误数
+结果可以 JSON 格式输出，用于回归对比。
+
+用法:
+    python benchmarks/load_test.py --requests 500 --concurrency 32 --latency 0.2 --json result.json
+    python benchmarks/load_test.py --scenario batch --batch-jobs 4 --batch-segments 200 \\
+        --latency-dist lognormal --error-rate 0.02 --throttle-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from collections import Counter
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_client import free_port, percentile  # noqa: E402
+
+SCENARIOS = ("synthesize", "batch")
+LAG_METRIC = "qwen_tts_event_loop_lag_seconds"
+
+
+def wait_for_port(process: subprocess.Popen, port: int, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程启动失败（退出码 {process.returncode}）")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("进程启动超时")
+
+
+def start_fake_server(args) -> tuple:
+    """启动模拟服务，返回 (进程, 服务地址)"""
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_dashscope.py"),
+        "--port", str(port),
+        "--latency", str(args.latency),
+        "--latency-dist", args.latency_dist,
+        "--audio-latency", str(args.audio_latency),
+        "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate),
+        "--audio-bytes", str(args.audio_bytes),
+        "--seed", str(args.seed)
+    ]
+    process = subprocess.Popen(command)
+    wait_for_port(process, port)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def start_app(fake_url: str, workdir: str) -> tuple:
+    """在临时工作目录中启动 Qwen-TTS 服务（日志写入 server.log），返回 (进程, 服务地址)"""
+    port = free_port()
+    env = dict(os.environ)
+    env["DASHSCOPE_HTTP_BASE_URL"] = f"{fake_url}/api/v1"
+    env.setdefault("DASHSCOPE_API_KEY", "sk-benchmark")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", ROOT_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+        stdout=open(os.path.join(workdir, "server.log"), "w"),
+        stderr=subprocess.STDOUT
+    )
+    wait_for_port(process, port)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def peak_rss_mb(pid: int):
+    """进程的峰值常驻内存（MB），仅支持 Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def parse_histogram(text: str, name: str) -> dict:
+    """从 Prometheus 文本中解析无标签直方图：{"buckets": {上界: 累计数}, "sum": 总和, "count": 次数}"""
+    result = {"buckets": {}, "sum": 0.0, "count": 0}
+    for line in text.splitlines():
+        if line.startswith(f"{name}_bucket"):
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            result["buckets"][float("inf") if bound == "+Inf" else float(bound)] = int(float(line.rsplit(" ", 1)[1]))
+        elif line.startswith(f"{name}_sum"):
+            result["sum"] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(f"{name}_count"):
+            result["count"] = int(float(line.rsplit(" ", 1)[1]))
+    return result
+
+
+def histogram_summary(before: dict, after: dict) -> dict:
+    """两次采集之间的直方图增量：均值和分位数（取所在分桶的上界，单位毫秒）"""
+    count = after["count"] - before["count"]
+    if count <= 0:
+        return {"samples": 0}
+
+    deltas = sorted((bound, total - before["buckets"].get(bound, 0)) for bound, total in after["buckets"].items())
+
+    def quantile(q: float) -> float:
+        for bound, cumulative in deltas:
+            if cumulative >= q * count:
+                return bound * 1000
+        return float("inf")
+
+    return {
+        "samples": count,
+        "mean_ms": (after["sum"] - before["sum"]) / count * 1000,
+        "p50_ms_le": quantile(0.5),
+        "p99_ms_le": quantile(0.99)
+    }
+
+
+def latency_summary(latencies: list) -> dict:
+    if not latencies:
+        return {}
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 0.5),
+        "p90_ms": percentile(latencies, 0.9),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies)
+    }
+
+
+def make_text(index: int, args) -> str:
+    # 文本按 --unique-texts 取模，重复的文本会命中缓存或合并为一次上游调用
+    return f"压测文本第 {index % args.unique_texts} 条，用于测量语音合成服务的吞吐量和延迟。"
+
+
+async def run_synthesize(client: httpx.AsyncClient, args) -> dict:
+    """concurrency 个协程持续发送请求，直到完成 requests 个"""
+    latencies = []
+    statuses = Counter()
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < args.requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/synthesize", json={"text": make_text(index, args), "voice": "Cherry"})
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": args.requests / elapsed,
+        "latency": latency_summary(latencies),
+        "status_counts": dict(statuses)
+    }
+
+
+async def run_batch(client: httpx.AsyncClient, args) -> dict:
+    """同时提交 batch_jobs 个批量任务，轮询直到全部结束"""
+    async def job(job_index: int) -> dict:
+        # 与 /api/synthesize 场景的文本错开，避免直接命中缓存
+        first = args.requests + job_index * args.batch_segments
+        paragraphs = [make_text(first + i, args) for i in range(args.batch_segments)]
+        content = "\n\n".join(paragraphs).encode("utf-8")
+
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/batch/upload",
+            files={"file": ("load_test.txt", content, "text/plain")},
+            data={"voice": "Cherry"}
+        )
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+
+        while True:
+            await asyncio.sleep(args.poll_interval)
+            task = (await client.get(f"/api/batch/status/{task_id}")).json()
+            if task["status"] in ("completed", "failed"):
+                break
+
+        return {
+            "elapsed_s": time.perf_counter() - start,
+            "status": task["status"],
+            "segments": task["total_segments"],
+            "completed": task["completed_segments"],
+            "failed": task["failed_segments"]
+        }
+
+    start = time.perf_counter()
+    jobs = await asyncio.gather(*(job(i) for i in range(args.batch_jobs)))
+    elapsed = time.perf_counter() - start
+    segments = sum(j["segments"] for j in jobs)
+
+    return {
+        "jobs": args.batch_jobs,
+        "segments_per_job": args.batch_segments,
+        "elapsed_s": elapsed,
+        "segments_per_s": segments / elapsed,
+        "job_latency": latency_summary([j["elapsed_s"] * 1000 for j in jobs]),
+        "completed_segments": sum(j["completed"] for j in jobs),
+        "failed_segments": sum(j["failed"] for j in jobs),
+        "status_counts": dict(Counter(j["status"] for j in jobs))
+    }
+
+
+async def run_load_test(args, app_url: str, fake_url: str, app_pid: int) -> dict:
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "scenarios": {}
+    }
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.batch_jobs) * 2)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        lag_before = parse_histogram((await client.get("/metrics")).text, LAG_METRIC)
+
+        if "synthesize" in args.scenario:
+            results["scenarios"]["synthesize"] = await run_synthesize(client, args)
+        if "batch" in args.scenario:
+            results["scenarios"]["batch"] = await run_batch(client, args)
+
+        lag_after = parse_histogram((await client.get("/metrics")).text, LAG_METRIC)
+
+    async with httpx.AsyncClient(base_url=fake_url) as client:
+        results["upstream"] = (await client.get("/stats")).json()
+
+    results["server"] = {
+        "peak_rss_mb": peak_rss_mb(app_pid),
+        "event_loop_lag": histogram_summary(lag_before, lag_after)
+    }
+    return results
+
+
+def print_report(results: dict):
+    config = results["config"]
+    print(
+        f"模拟上游: 延迟 {config['latency']} s ({config['latency_dist']})，错误率 {config['error_rate']}，"
+        f"限流率 {config['throttle_rate']}"
+    )
+
+    synthesize = results["scenarios"].get("synthesize")
+    if synthesize:
+        latency = synthesize["latency"]
+        print(
+            f"\n/api/synthesize  请求 {synthesize['requests']}  并发 {synthesize['concurrency']}  "
+            f"吞吐 {synthesize['throughput_rps']:.1f} req/s"
+        )
+        print(
+            f"  延迟 p50 {latency['p50_ms']:.1f} ms  p90 {latency['p90_ms']:.1f} ms  "
+            f"p99 {latency['p99_ms']:.1f} ms  max {latency['max_ms']:.1f} ms"
+        )
+        print(f"  状态码 {synthesize['status_counts']}")
+
+    batch = results["scenarios"].get("batch")
+    if batch:
+        print(
+            f"\n/api/batch/upload  任务 {batch['jobs']} × {batch['segments_per_job']} 段  "
+            f"耗时 {batch['elapsed_s']:.2f} s  吞吐 {batch['segments_per_s']:.1f} 段/s"
+        )
+        print(f"  成功 {batch['completed_segments']}  失败 {batch['failed_segments']}  任务状态 {batch['status_counts']}")
+
+    server = results["server"]
+    lag = server["event_loop_lag"]
+    rss = server["peak_rss_mb"]
+    print(f"\n服务进程峰值内存: {f'{rss:.1f} MB' if rss is not None else '未知'}")
+    if lag.get("samples"):
+        print(f"事件循环延迟: 平均 {lag['mean_ms']:.2f} ms  p50 ≤ {lag['p50_ms_le']:g} ms  p99 ≤ {lag['p99_ms_le']:g} ms")
+    print(f"上游统计: {results['upstream']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的 Qwen-TTS 服务压测")
+    parser.add_argument("--scenario", default="synthesize,batch", help="压测场景（synthesize、batch），逗号分隔")
+    parser.add_argument("--requests", type=int, default=500, help="/api/synthesize 的请求总数")
+    parser.add_argument("--concurrency", type=int, default=32, help="/api/synthesize 的并发数")
+    parser.add_argument("--unique-texts", type=int, default=10 ** 9, help="不同文本的数量，小于请求数时会出现重复文本")
+    parser.add_argument("--batch-jobs", type=int, default=2, help="同时提交的批量任务数")
+    parser.add_argument("--batch-segments", type=int, default=100, help="每个批量任务的分段数")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="批量任务状态的轮询间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求的超时（秒）")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟上游合成接口的平均延迟（秒）")
+    parser.add_argument("--latency-dist", default="fixed", help="延迟分布: fixed、uniform、exponential、lognormal")
+    parser.add_argument("--audio-latency", type=float, default=0.0, help="模拟音频下载的平均延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟上游返回 500 的概率")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="模拟上游返回 429 的概率")
+    parser.add_argument("--audio-bytes", type=int, default=0, help="固定的音频大小（字节），默认与文本长度成比例")
+    parser.add_argument("--seed", type=int, default=42, help="模拟服务的随机数种子")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留服务的临时工作目录（含 server.log）")
+    parser.add_argument("--json", help="将结果以 JSON 格式写入指定文件")
+    args = parser.parse_args()
+    args.scenario = [name for name in args.scenario.split(",") if name]
+    unknown = set(args.scenario) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"不支持的场景: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="qwen_tts_load_")
+    fake_process, fake_url = start_fake_server(args)
+    app_process = None
+    try:
+        app_process, app_url = start_app(fake_url, workdir)
+        results = asyncio.run(run_load_test(args, app_url, fake_url, app_process.pid))
+    finally:
+        if app_process:
+            app_process.terminate()
+            app_process.wait()
+        fake_process.kill()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Qwen-TTS 上游并发控制
+进程内全局的自适应并发限制器（AIMD），根据上游延迟和限流响应动态调整并发窗口；
+排队的请求按优先级分配槽位，同一优先级内按分组（如批量任务）轮转，避免单个大任务占满上游
+"""
+import time
+import asyncio
+from collections import deque, OrderedDict
+from typing import Optional, Dict, Any, Hashable
+
+# 请求结果类型
+OUTCOME_SUCCESS = "success"    # 成功
+OUTCOME_OVERLOAD = "overload"  # 上游过载（429、503、超时）
+OUTCOME_ERROR = "error"        # 其他错误，不影响并发窗口
+
+# 优先级（按分配顺序排列）
+PRIORITY_INTERACTIVE = "interactive"  # 单次合成、流式合成等有用户在等待的请求
+PRIORITY_BATCH = "batch"              # 批量任务的分段
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+
+class QueueTicket:
+    """排队凭据
+
+    记录一次上游调用（包括其重试）排队时使用的优先级和分组。多个调用者共享同一次执行时
+    （见 SingleFlight），用 promote() 把优先级提升到其中最高的一个；正在排队的请求
+    随即移到新优先级的队列末尾。
+    """
+
+    def __init__(self, priority: str = PRIORITY_INTERACTIVE, group: Hashable = None):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级: {priority}")
+        self.priority = priority
+        self.group = group
+        # 正在排队时所在的限制器和等待者
+        self._limiter: Optional["AdaptiveLimiter"] = None
+        self._waiter: Optional[asyncio.Future] = None
+
+    def promote(self, priority: str):
+        """提升到 priority（不低于当前优先级时不变）"""
+        if PRIORITY_CLASSES.index(priority) >= PRIORITY_CLASSES.index(self.priority):
+            return
+        previous, self.priority = self.priority, priority
+        if self._limiter is not None and not self._waiter.done():
+            self._limiter._requeue(self._waiter, previous, priority, self.group)
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制器
+
+    - 窗口已被占满且请求成功、延迟未明显升高时，窗口加性增长（每个窗口周期 +1）
+    - 收到过载信号时窗口乘性减小；延迟超过基线的 latency_tolerance 倍时小幅减小
+    - 同一冷却期内只减小一次，避免一批并发请求同时失败时窗口被连续腰斩
+
+    窗口已满时请求排队：高优先级的请求总是先于低优先级分配到槽位；
+    同一优先级内按 group 轮转（每个分组依次分配一个），分组内先到先得。
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.5,
+        cooldown: float = 1.0
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.cooldown = cooldown
+
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._in_flight = 0
+        # 优先级 -> 分组 -> 等待者队列（OrderedDict 的顺序即轮转顺序）
+        self._waiters: Dict[str, "OrderedDict[Hashable, deque]"] = {
+            priority: OrderedDict() for priority in PRIORITY_CLASSES
+        }
+        self._baseline_latency: Optional[float] = None
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self.queue_depths().values())
+
+    def queue_depths(self) -> Dict[str, int]:
+        """各优先级排队的请求数"""
+        return {
+            priority: sum(1 for queue in groups.values() for waiter in queue if not waiter.done())
+            for priority, groups in self._waiters.items()
+        }
+
+    async def acquire(
+        self,
+        priority: str = PRIORITY_INTERACTIVE,
+        group: Hashable = None,
+        ticket: Optional[QueueTicket] = None
+    ):
+        """获取一个并发槽位，窗口已满时按优先级和分组排队等待
+
+        传入 ticket 时使用它的优先级和分组（忽略 priority 和 group），排队期间可以提升优先级。
+        """
+        if ticket is None:
+            ticket = QueueTicket(priority, group)
+        if self._in_flight < self.limit and not any(self._waiters.values()):
+            self._in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[ticket.priority].setdefault(ticket.group, deque()).append(waiter)
+        ticket._limiter, ticket._waiter = self, waiter
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已分配到槽位但调用方被取消，归还槽位
+                self._in_flight -= 1
+                self._wake_waiters()
+            else:
+                self._remove_waiter(waiter, ticket.priority, ticket.group)
+            raise
+        finally:
+            ticket._limiter = ticket._waiter = None
+
+    def _remove_waiter(self, waiter: asyncio.Future, priority: str, group: Hashable):
+        groups = self._waiters[priority]
+        queue = groups.get(group)
+        if queue is not None:
+            try:
+                queue.remove(waiter)
+            except ValueError:
+                pass
+            if not queue:
+                del groups[group]
+
+    def _requeue(self, waiter: asyncio.Future, previous: str, priority: str, group: Hashable):
+        """把排队中的等待者从 previous 优先级移到 priority 优先级"""
+        self._remove_waiter(waiter, previous, group)
+        self._waiters[priority].setdefault(group, deque()).append(waiter)
+
+    def release(self, latency: Optional[float] = None, outcome: str = OUTCOME_SUCCESS):
+        """归还槽位，并根据本次请求的结果调整窗口"""
+        saturated = self._in_flight >= self.limit
+        self._in_flight -= 1
+
+        if outcome == OUTCOME_OVERLOAD:
+            self._decrease(self.backoff_ratio)
+        elif outcome == OUTCOME_SUCCESS and latency is not None:
+            if self._baseline_latency is None or latency < self._baseline_latency:
+                self._baseline_latency = latency
+            else:
+                # 基线缓慢上浮，以适应上游整体变慢的情况
+                self._baseline_latency *= 1.01
+
+            if latency > self._baseline_latency * self.latency_tolerance:
+                self._decrease(0.9)
+            elif saturated:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+        self._wake_waiters()
+
+    def _decrease(self, ratio: float):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * ratio)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """按优先级取下一个等待者；同一优先级内取轮转顺序中第一个分组的队首，并把该分组移到末尾"""
+        for groups in self._waiters.values():
+            while groups:
+                group, queue = next(iter(groups.items()))
+                waiter = queue.popleft()
+                if queue:
+                    groups.move_to_end(group)
+                else:
+                    del groups[group]
+                if not waiter.done():
+                    return waiter
+        return None
+
+    def _wake_waiters(self):
+        while self._in_flight < self.limit:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前并发状态"""
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_depth_by_priority": self.queue_depths(),
+            "baseline_latency": self._baseline_latency
+        }
@@ -11,6 +11,12 @@ load_dotenv(override=True)
 class Config:
     # API 配置
     DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+    # 多个 API Key（逗号分隔，每项为 key[:qps[:并发数]]），设置后替代 DASHSCOPE_API_KEY
+    DASHSCOPE_API_KEYS = os.getenv("DASHSCOPE_API_KEYS")
+    # 自定义 DashScope 接口地址，例如指向 benchmarks/fake_dashscope.py 启动的本地模拟服务
+    DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_HTTP_BASE_URL")
+    # 上游调用方式: native（原生异步客户端）或 sdk（DashScope SDK，在线程池中执行）
+    DASHSCOPE_CLIENT = os.getenv("DASHSCOPE_CLIENT", "native")
     
     # 服务器配置
     HOST = "0.0.0.0"
@@ -20,6 +26,8 @@ class Config:
     # TTS 模型配置
     DEFAULT_MODEL = "qwen-tts-latest"
     ALTERNATIVE_MODEL = "qwen-tts-2025-05-22"
+    # 允许使用的模型（请求中的 model 也用作指标标签，只接受这里列出的值）
+    MODELS = [DEFAULT_MODEL, ALTERNATIVE_MODEL]
     
     # 支持的音色配置
     VOICES: Dict[str, Dict] = {
@@ -69,19 +77,109 @@ class Config:
     
     # 文件配置
     AUDIO_OUTPUT_DIR = "audio_output"
-    MAX_TEXT_LENGTH = 1000
-    ALLOWED_AUDIO_FORMATS = ["wav", "mp3"]
+    AUDIO_SHARD_LEVELS = 2  # 按文件名哈希前缀分散到的子目录层数（每层 256 个目录）
+    MAX_TEXT_LENGTH = 1000  # 单次上游调用的文本长度上限，更长的文本自动分块合成
+
+    # 长文本自动分块：按句子边界切分后并行合成，交叉淡化拼接为一个 WAV
+    LONG_TEXT_MAX_LENGTH = 10000  # 单次合成请求的文本长度上限
+    LONG_TEXT_CHUNK_LENGTH = 300  # 每块的最大字符数
+    LONG_TEXT_FIRST_CHUNK_LENGTH = 60  # 第一块较短，尽快得到开头的音频
+    LONG_TEXT_CROSSFADE_MS = 30  # 相邻块之间的交叉淡化时长（毫秒）
+    ALLOWED_AUDIO_FORMATS = ["wav", "mp3", "opus"]
     DEFAULT_AUDIO_FORMAT = "wav"
+
+    # 音频转码（mp3 / opus 需要安装 ffmpeg）
+    FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+    TRANSCODE_MAX_WORKERS = os.cpu_count() or 2  # 同时运行的 ffmpeg 进程数
+    TRANSCODE_TIMEOUT = 120
+    TRANSCODE_DEFAULT_BITRATES = {"mp3": 64, "opus": 32}  # kbps
+    TRANSCODE_MIN_BITRATE = 16
+    TRANSCODE_MAX_BITRATE = 320
     
+    # 批量任务存储配置
+    DATA_DIR = "data"
+    TASK_DB_PATH = os.path.join(DATA_DIR, "tasks.db")
+    TASK_DB_BUSY_TIMEOUT = 30.0  # 任务库被其他进程锁定时等待的最长时间（秒）
+    UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")  # 上传文件暂存目录，分段完成后删除
+    AUDIO_INDEX_DB_PATH = os.path.join(DATA_DIR, "audio_index.db")  # 音频文件元数据（内容哈希等）
+
+    # 音频文件 HTTP 缓存（文件生成后不再修改，内容哈希作为 ETag）
+    AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+    # 音频文件后台回收（处理中的批量任务引用的文件不会被回收）
+    AUDIO_RETENTION_DAYS = 30  # 超过该天数未被访问的文件会被删除，0 表示不限
+    AUDIO_MAX_SIZE_MB = 10240  # 音频文件总容量上限，超出时按最近访问时间淘汰，0 表示不限
+    AUDIO_GC_INTERVAL = 600  # 回收间隔（秒）
+    AUDIO_GC_GRACE = 600  # 新生成的文件在该时间（秒）内不会被回收
+
+    # 批量任务流式处理
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    BATCH_WORKERS = 16  # 每个工作进程同时处理的分段数（上游并发仍由全局限制器控制）
+
+    # 批量任务队列（SQLite 分段表，Web 进程和 worker.py 工作进程共享）
+    BATCH_EMBEDDED_WORKER = os.getenv("BATCH_EMBEDDED_WORKER", "1") != "0"  # Web 进程内是否运行工作协程
+    BATCH_LEASE_SECONDS = 30  # 领取分段的租约时长，持有期间每 1/3 时长续租一次，进程崩溃后过期即可被重新领取
+    BATCH_POLL_INTERVAL = 1.0  # 队列为空时检查新任务的间隔（秒）
+    BATCH_MAX_CLAIMS = 3  # 分段被领取超过该次数仍未完成（处理进程反复崩溃）时标记为失败
+    BATCH_MERGE_COMMIT_SEGMENTS = 50  # 合并音频时每追加该数量的分段记录一次进度（每轮合并结束时也会记录）
+    BATCH_RESTART_DELAY = 5.0  # 领取循环意外退出后重新启动的等待时间（秒）
+
+    # 批量 JSON 合成（/api/synthesize/bulk）
+    BULK_MAX_ITEMS = 500  # 单次请求最多包含的条目数
+    BULK_CONCURRENCY = 16  # 单次请求同时合成的条目数（上游并发仍由全局限制器控制）
+
     # 请求超时配置
     REQUEST_TIMEOUT = 30
     DOWNLOAD_TIMEOUT = 60
 
+    # HTTP 连接池配置
+    HTTP_MAX_CONNECTIONS = 50
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+    HTTP_KEEPALIVE_EXPIRY = 30
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    STREAM_QUEUE_SIZE = 16  # 流式转发时缓冲的最大数据块数
+
+    # 上游并发控制（AIMD 自适应窗口）
+    UPSTREAM_CONCURRENCY_INITIAL = 4
+    UPSTREAM_CONCURRENCY_MIN = 1
+    UPSTREAM_CONCURRENCY_MAX = 32
+    UPSTREAM_LATENCY_TOLERANCE = 2.0  # 延迟超过基线的倍数时收缩窗口
+
+    # API Key 池（每个 Key 的预算，0 表示不限）
+    API_KEY_DEFAULT_QPS = 0
+    API_KEY_DEFAULT_CONCURRENCY = 0
+    API_KEY_THROTTLE_BENCH = 1.0  # Key 被限流（429）且没有 Retry-After 时暂停使用的时间（秒），只剩一个可用 Key 时不暂停
+    API_KEY_UNAUTHORIZED_BENCH = 300.0  # Key 鉴权失败（401/403）后暂停使用的时间（秒）
+
+    # 重试策略（指数退避 + 随机抖动）
+    RETRY_MAX_ATTEMPTS = 4
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 8.0
+    RETRY_DEADLINE = 60.0  # 单次合成（含重试）的总截止时间（秒）
+
+    # 流式合成输出格式（Qwen-TTS 返回 24kHz 16bit 单声道 PCM）
+    STREAM_SAMPLE_RATE = 24000
+    STREAM_SAMPLE_WIDTH = 2
+
+    # 批量任务进度推送（SSE）
+    PROGRESS_EVENT_QUEUE_SIZE = 256  # 每个订阅者缓冲的最大事件数，溢出时通知客户端重新同步
+    PROGRESS_HEARTBEAT_INTERVAL = 15  # 无事件时发送心跳的间隔（秒）
+    PROGRESS_POLL_INTERVAL = 0.5  # 从任务存储读取新进度的间隔（秒），分段可能由其他进程处理
+
+    # 运行指标
+    EVENT_LOOP_LAG_INTERVAL = 0.1  # 事件循环延迟的采样间隔（秒）
+
+    # 合成缓存配置
+    CACHE_ENABLED = True
+    CACHE_DIR = os.path.join(AUDIO_OUTPUT_DIR, "cache")
+    CACHE_MAX_SIZE_MB = 1024
+    CACHE_MAX_AGE_DAYS = 30
+
 # 创建配置实例
 config = Config()
 
 # 验证必要的环境变量
-if not config.DASHSCOPE_API_KEY:
+if not config.DASHSCOPE_API_KEY and not config.DASHSCOPE_API_KEYS:
     raise EnvironmentError(
-        "DASHSCOPE_API_KEY 环境变量未设置。请创建 .env 文件并设置您的 API Key。"
+        "DASHSCOPE_API_KEY 环境变量未设置。请创建 .env 文件并设置您的 API Key（多个 Key 使用 DASHSCOPE_API_KEYS）。"
     )
@@ -0,0 +1,150 @@
+"""
+Qwen-TTS 原生异步客户端
+直接在事件循环上通过共享的 httpx 连接池调用 DashScope 语音合成接口，无需线程池
+"""
+import json
+import base64
+from http import HTTPStatus
+from typing import Optional, Callable, AsyncIterator, Dict, Any
+
+import httpx
+
+from retry import parse_retry_after
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+GENERATION_PATH = "/services/aigc/multimodal-generation/generation"
+
+
+class UpstreamError(RuntimeError):
+    """DashScope 接口返回的错误响应"""
+
+    # 表示上游过载的状态码
+    OVERLOAD_STATUS_CODES = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE)
+
+    def __init__(
+        self,
+        status_code: int,
+        code: Optional[str],
+        message: Optional[str],
+        retry_after: Optional[float] = None
+    ):
+        self.status_code = status_code
+        self.code = code
+        self.retry_after = retry_after
+        super().__init__(f"{status_code} {code}: {message}")
+
+    @classmethod
+    def from_response(cls, response) -> "UpstreamError":
+        """由 SDK 响应构造"""
+        headers = getattr(response, "headers", None) or {}
+        retry_after = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+        return cls(response.status_code, response.code, response.message, parse_retry_after(retry_after))
+
+    @property
+    def is_overload(self) -> bool:
+        return self.status_code in self.OVERLOAD_STATUS_CODES
+
+    @property
+    def is_retryable(self) -> bool:
+        return (
+            self.status_code in (HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS)
+            or self.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+        )
+
+
+class IncompleteStreamError(UpstreamError):
+    """流式响应在收到 finish_reason 为 stop 的结束事件之前中断（按 502 处理，可重试）"""
+
+    def __init__(self, message: str = "流式响应在完成前中断"):
+        super().__init__(HTTPStatus.BAD_GATEWAY, "IncompleteStream", message)
+
+
+class DashScopeTTSClient:
+    """DashScope Qwen-TTS 异步客户端"""
+
+    def __init__(self, base_url: Optional[str], get_http_client: Callable[[], httpx.AsyncClient], timeout: float):
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.get_http_client = get_http_client
+        self.timeout = timeout
+
+    def _build_request(self, text: str, voice: str, model: str, api_key: str, stream: bool) -> Dict[str, Any]:
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+            headers["X-DashScope-SSE"] = "enable"
+
+        return {
+            "url": self.base_url + GENERATION_PATH,
+            "headers": headers,
+            "json": {"model": model, "input": {"text": text, "voice": voice}},
+            "timeout": self.timeout
+        }
+
+    @staticmethod
+    async def _raise_for_error(response: httpx.Response):
+        if response.status_code == HTTPStatus.OK:
+            return
+
+        await response.aread()
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"message": response.text}
+        raise UpstreamError(
+            response.status_code,
+            body.get("code"),
+            body.get("message"),
+            parse_retry_after(response.headers.get("Retry-After"))
+        )
+
+    async def synthesize(self, text: str, voice: str, model: str, api_key: str) -> str:
+        """合成语音，返回音频下载地址"""
+        client = self.get_http_client()
+        async with client.stream("POST", **self._build_request(text, voice, model, api_key, stream=False)) as response:
+            await self._raise_for_error(response)
+            await response.aread()
+            body = response.json()
+
+        audio = (body.get("output") or {}).get("audio")
+        if not audio or not audio.get("url"):
+            raise RuntimeError("API call failed: response.output.audio is None or missing")
+        return audio["url"]
+
+    async def stream(self, text: str, voice: str, model: str, api_key: str) -> AsyncIterator[bytes]:
+        """流式合成语音，逐块产出解码后的 PCM 数据
+
+        只有收到 finish_reason 为 stop 的事件才算正常结束，否则抛出 IncompleteStreamError。
+        """
+        client = self.get_http_client()
+        async with client.stream("POST", **self._build_request(text, voice, model, api_key, stream=True)) as response:
+            await self._raise_for_error(response)
+
+            # 每个事件的状态码以注释行 ":HTTP_STATUS/<code>" 给出
+            is_error = False
+            status_code = HTTPStatus.BAD_REQUEST
+            finished = False
+            async for line in response.aiter_lines():
+                if not line:
+                    is_error = False
+                    status_code = HTTPStatus.BAD_REQUEST
+                elif line.startswith("event:error"):
+                    is_error = True
+                elif line.startswith(":HTTP_STATUS/"):
+                    status_code = int(line[len(":HTTP_STATUS/"):].strip())
+                elif line.startswith("data:"):
+                    message = json.loads(line[len("data:"):])
+                    if is_error:
+                        raise UpstreamError(status_code, message.get("code"), message.get("message"))
+
+                    output = message.get("output") or {}
+                    audio = output.get("audio") or {}
+                    if audio.get("data"):
+                        yield base64.b64decode(audio["data"])
+                    if output.get("finish_reason") == "stop":
+                        finished = True
+
+            if not finished:
+                raise IncompleteStreamError()
@@ -0,0 +1,195 @@
+"""
+Qwen-TTS 多 API Key 调度
+为每个 Key 分别维护 QPS（令牌桶）和并发预算，按剩余容量选择 Key；
+收到限流（429）或鉴权失败（401/403）的 Key 会被暂时停用，到期后自动恢复；
+限流只短暂停用（其他 Key 仍可用时），整体退避由并发限制器和重试策略负责
+"""
+import time
+import asyncio
+from http import HTTPStatus
+from typing import List, Optional, Dict, Any, Tuple
+
+# 调用结果类型
+KEY_OK = "ok"
+KEY_THROTTLED = "throttled"        # 429，按 Retry-After 或默认时长暂停
+KEY_UNAUTHORIZED = "unauthorized"  # 401 / 403，较长时间停用
+
+
+class NoAvailableKeyError(RuntimeError):
+    """所有 API Key 均因鉴权失败被停用"""
+
+    MESSAGE = "所有 API Key 均鉴权失败，已暂时停用"
+
+    def __init__(self, message: str = MESSAGE):
+        super().__init__(message)
+
+
+def parse_key_specs(spec: str, default_qps: float, default_concurrency: int) -> List[Tuple[str, float, int]]:
+    """解析 Key 配置：逗号分隔，每项为 key[:qps[:并发数]]，省略的部分使用默认值（0 表示不限）"""
+    keys = []
+    for item in spec.split(","):
+        parts = [part.strip() for part in item.strip().split(":")]
+        if not parts[0]:
+            continue
+        qps = float(parts[1]) if len(parts) > 1 and parts[1] else default_qps
+        concurrency = int(parts[2]) if len(parts) > 2 and parts[2] else default_concurrency
+        keys.append((parts[0], qps, concurrency))
+    return keys
+
+
+def classify_key_outcome(status_code: Optional[int]) -> str:
+    """根据上游响应状态码判断 Key 的调用结果"""
+    if status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        return KEY_THROTTLED
+    if status_code in (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN):
+        return KEY_UNAUTHORIZED
+    return KEY_OK
+
+
+class ApiKey:
+    """单个 API Key 的预算和统计"""
+
+    def __init__(self, key: str, qps: float, max_concurrency: int):
+        self.key = key
+        self.name = f"{key[:3]}***{key[-4:]}" if len(key) > 8 else "***"
+        self.qps = qps
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.benched_until = 0.0
+        self.bench_reason: Optional[str] = None
+        self.requests = 0
+        self.throttled = 0
+        self.unauthorized = 0
+        # 令牌桶：容量为 1 秒的配额（至少 1 个）
+        self._burst = max(1.0, qps)
+        self._tokens = self._burst
+        self._refilled_at = time.monotonic()
+        self._last_used = 0.0
+
+    def _refill(self, now: float):
+        if self.qps:
+            self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self.qps)
+        self._refilled_at = now
+
+    def benched(self, now: float) -> bool:
+        return now < self.benched_until
+
+    def capacity(self, now: float) -> float:
+        """剩余容量（0 ~ 1），取并发余量和令牌余量中较小的比例；为 0 时当前不可用"""
+        if self.benched(now):
+            return 0.0
+        self._refill(now)
+        if self.qps and self._tokens < 1:
+            return 0.0
+        concurrency_ratio = 1.0
+        if self.max_concurrency:
+            concurrency_ratio = (self.max_concurrency - self.in_flight) / self.max_concurrency
+        token_ratio = self._tokens / self._burst if self.qps else 1.0
+        return max(0.0, min(concurrency_ratio, token_ratio))
+
+    def ready_in(self, now: float) -> Optional[float]:
+        """预计多少秒后可用；只能等待其他调用结束时返回 None"""
+        if self.benched(now):
+            return self.benched_until - now
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return None
+        if self.qps and self._tokens < 1:
+            return (1 - self._tokens) / self.qps
+        return 0.0
+
+    def take(self, now: float):
+        if self.qps:
+            self._tokens -= 1
+        self.in_flight += 1
+        self.requests += 1
+        self._last_used = now
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        self._refill(now)
+        return {
+            "key": self.name,
+            "qps": self.qps,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "utilization": self.in_flight / self.max_concurrency if self.max_concurrency else None,
+            "benched": self.benched(now),
+            "bench_reason": self.bench_reason if self.benched(now) else None,
+            "bench_remaining": max(0.0, self.benched_until - now),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "unauthorized": self.unauthorized
+        }
+
+
+class KeyPool:
+    """API Key 池
+
+    acquire() 返回当前剩余容量最大的 Key（相同时选择最久未使用的），没有可用 Key 时排队等待；
+    调用结束后必须通过 release() 归还并报告结果。
+    """
+
+    def __init__(
+        self,
+        keys: List[Tuple[str, float, int]],
+        throttle_bench: float = 1.0,
+        unauthorized_bench: float = 300.0
+    ):
+        if not keys:
+            raise ValueError("至少需要配置一个 API Key")
+        self.keys = [ApiKey(key, qps, concurrency) for key, qps, concurrency in keys]
+        self.throttle_bench = throttle_bench
+        self.unauthorized_bench = unauthorized_bench
+        self._changed = asyncio.Event()
+
+    async def acquire(self) -> ApiKey:
+        """获取一个 Key；所有 Key 均因鉴权失败停用时抛出 NoAvailableKeyError"""
+        while True:
+            now = time.monotonic()
+            best, best_capacity = None, 0.0
+            for api_key in self.keys:
+                capacity = api_key.capacity(now)
+                if capacity > best_capacity or (
+                    capacity and capacity == best_capacity and api_key._last_used < best._last_used
+                ):
+                    best, best_capacity = api_key, capacity
+            if best is not None:
+                best.take(now)
+                return best
+
+            if all(api_key.benched(now) and api_key.bench_reason == KEY_UNAUTHORIZED for api_key in self.keys):
+                raise NoAvailableKeyError()
+
+            # 等待令牌补充、停用到期或其他调用归还 Key
+            delays = [delay for delay in (api_key.ready_in(now) for api_key in self.keys) if delay is not None]
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), min(delays) if delays else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, api_key: ApiKey, outcome: str = KEY_OK, retry_after: Optional[float] = None):
+        """归还 Key；限流或鉴权失败时暂时停用
+
+        限流时按 Retry-After（没有时为 throttle_bench）停用，但不会停用最后一个可用的 Key。
+        """
+        api_key.in_flight -= 1
+        now = time.monotonic()
+        if outcome == KEY_THROTTLED:
+            api_key.throttled += 1
+            if any(other is not api_key and not other.benched(now) for other in self.keys):
+                self._bench(api_key, now, retry_after if retry_after is not None else self.throttle_bench, outcome)
+        elif outcome == KEY_UNAUTHORIZED:
+            api_key.unauthorized += 1
+            self._bench(api_key, now, self.unauthorized_bench, outcome)
+        self._changed.set()
+
+    def _bench(self, api_key: ApiKey, now: float, duration: float, reason: str):
+        if now + duration > api_key.benched_until:
+            api_key.benched_until = now + duration
+            api_key.bench_reason = reason
+            print(f"API Key {api_key.name} 暂停使用 {duration:.1f} 秒（{reason}）")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """各 Key 的使用情况"""
+        now = time.monotonic()
+        return [api_key.snapshot(now) for api_key in self.keys]
@@ -5,26 +5,77 @@ Qwen-TTS FastAPI 应用主文件
 import os
 import uuid
 import asyncio
-import re
+import functools
 import json
-import zipfile
-import tempfile
+import time
+import wave
+import base64
+import codecs
+import hashlib
+import socket
+import sqlite3
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from typing import Optional, Dict, Any, List, Set, Tuple, AsyncIterator
 from pathlib import Path
 from enum import Enum
 
 import aiofiles
+import httpx
 import requests
 import dashscope
-from pydub import AudioSegment
-from fastapi import FastAPI, HTTPException, Request, Form, File, UploadFile, BackgroundTasks
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Request, Query, Form, File, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, field_validator
 
 from config import config
+from audio_cache import AudioCache, make_cache_key, link_or_copy
+from audio_index import AudioIndex
+from audio_storage import AudioStorage, AudioCollector
+from task_store import TaskStore
+from audio_merge import MergedAudioWriter
+from audio_stitch import CrossfadeStitcher, streaming_wav_header
+from zip_stream import iter_zip
+from transcoder import Transcoder, TranscodeError, TranscoderUnavailable, FORMATS as AUDIO_FORMATS
+from text_segmenter import (
+    TextSegmenter, EncodingDetector, split_text, split_for_synthesis, detect_encoding, SPLIT_MODES
+)
+from concurrency import (
+    AdaptiveLimiter, QueueTicket, OUTCOME_SUCCESS, OUTCOME_OVERLOAD, OUTCOME_ERROR,
+    PRIORITY_INTERACTIVE, PRIORITY_BATCH
+)
+from retry import RetryPolicy
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from dashscope_client import DashScopeTTSClient, UpstreamError, IncompleteStreamError
+from single_flight import SingleFlight
+from key_pool import KeyPool, ApiKey, NoAvailableKeyError, parse_key_specs, classify_key_outcome
+
+if config.DASHSCOPE_BASE_URL:
+    dashscope.base_http_api_url = config.DASHSCOPE_BASE_URL
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动内置的批量任务工作协程（会继续处理未完成的任务）、进度推送和音频回收，
+    关闭时归还任务租约并释放共享连接池"""
+    if batch_worker:
+        batch_worker.start()
+    events_task = asyncio.create_task(batch_manager.run_event_poller())
+    gc_task = asyncio.create_task(run_audio_gc())
+    lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+    yield
+
+    if batch_worker:
+        await batch_worker.stop()
+    events_task.cancel()
+    gc_task.cancel()
+    lag_task.cancel()
+    await tts_service.close()
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -32,17 +83,16 @@ app = FastAPI(
     description="基于 Qwen-TTS 的功能丰富的语音合成 API 服务",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 创建必要的目录
-os.makedirs(config.AUDIO_OUTPUT_DIR, exist_ok=True)
 os.makedirs("static", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
 
 # 静态文件和模板配置
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/audio", StaticFiles(directory=config.AUDIO_OUTPUT_DIR), name="audio")
 templates = Jinja2Templates(directory="templates")
 
 # 枚举类型
@@ -52,12 +102,23 @@ class TaskStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+def check_model(model: str) -> str:
+    """验证模型版本（只接受 config.MODELS 中列出的模型）"""
+    if model not in config.MODELS:
+        raise ValueError(f"不支持的模型: {model}")
+    return model
+
 # Pydantic 模型
 class TTSRequest(BaseModel):
-    text: str = Field(..., min_length=1, max_length=config.MAX_TEXT_LENGTH, description="要合成的文本")
+    text: str = Field(..., min_length=1, max_length=config.LONG_TEXT_MAX_LENGTH, description="要合成的文本（过长时自动分块合成）")
     voice: str = Field(default="Cherry", description="音色选择")
     model: str = Field(default=config.DEFAULT_MODEL, description="模型版本")
 
+    @field_validator("model")
+    @classmethod
+    def validate_model(cls, value: str) -> str:
+        return check_model(value)
+
 class TTSResponse(BaseModel):
     success: bool
     message: str
@@ -65,12 +126,48 @@ class TTSResponse(BaseModel):
     file_path: Optional[str] = None
     voice_info: Optional[Dict[str, Any]] = None
     duration: Optional[float] = None
+    cache_hit: Optional[bool] = None
+    deduplicated: Optional[bool] = None
+    attempts: Optional[int] = None
+    chunks: Optional[int] = None
+
+class BulkSynthesisItem(BaseModel):
+    id: Optional[str] = Field(default=None, description="调用方自定义的标识，原样返回")
+    text: str = Field(..., min_length=1, max_length=config.MAX_TEXT_LENGTH, description="要合成的文本")
+    voice: str = Field(default="Cherry", description="音色选择")
+    model: str = Field(default=config.DEFAULT_MODEL, description="模型版本")
+
+    @field_validator("model")
+    @classmethod
+    def validate_model(cls, value: str) -> str:
+        return check_model(value)
+
+class BulkSynthesisRequest(BaseModel):
+    items: List[BulkSynthesisItem] = Field(..., min_length=1, max_length=config.BULK_MAX_ITEMS, description="合成条目")
+    stream: bool = Field(default=True, description="是否按完成顺序逐行（NDJSON）返回每个条目的结果")
+
+class BulkSynthesisResponse(BaseModel):
+    success: bool
+    message: str
+    total: int
+    completed: int
+    failed: int
+    duration: float
+    results: List[Dict[str, Any]] = []
 
 class BatchTaskRequest(BaseModel):
     voice: str = Field(default="Cherry", description="音色选择")
     model: str = Field(default=config.DEFAULT_MODEL, description="模型版本")
     split_by: str = Field(default="paragraph", description="分割方式: paragraph, sentence, chapter")
     max_length: int = Field(default=500, description="每段最大字符数")
+    merge_output: bool = Field(default=False, description="是否额外生成合并后的单个音频文件")
+    merge_silence_ms: int = Field(default=500, ge=0, le=10000, description="合并音频中分段之间的静音时长（毫秒）")
+    chapter_markers: bool = Field(default=True, description="合并音频中是否写入章节标记")
+
+    @field_validator("model")
+    @classmethod
+    def validate_model(cls, value: str) -> str:
+        return check_model(value)
 
 class BatchTaskResponse(BaseModel):
     success: bool
@@ -85,53 +182,192 @@ class TaskProgress(BaseModel):
     completed_segments: int
     failed_segments: int
     progress_percentage: float
+    cache_hits: int = 0
+    cache_misses: int = 0
+    dedup_hits: int = 0
+    upstream_calls_saved: int = 0
     created_at: datetime
     updated_at: datetime
     results: List[Dict[str, Any]] = []
+    merge_output: bool = False
+    merged_segments: int = 0
+    merged_audio_url: Optional[str] = None
+    merged_filename: Optional[str] = None
+    chapters: List[Dict[str, Any]] = []
+    ingest_done: bool = True
+    error: Optional[str] = None
+
+# 异常类型
+class DownloadError(RuntimeError):
+    """音频下载失败"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        self.status_code = status_code
+        super().__init__(message)
+
+    @property
+    def url_expired(self) -> bool:
+        """音频地址本身不可用（如已过期），需要重新合成才能获取新地址"""
+        return (
+            self.status_code is not None
+            and self.status_code < HTTPStatus.INTERNAL_SERVER_ERROR
+            and self.status_code not in (HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS)
+        )
+
+def download_failure(error: Exception) -> DownloadError:
+    """把下载过程中的异常转换为 DownloadError（保留 HTTP 状态码，原始异常作为 __cause__），并记录上游错误指标"""
+    status_code = error.response.status_code if isinstance(error, httpx.HTTPStatusError) else None
+    failure = DownloadError(f"音频下载失败: {error}", status_code)
+    failure.__cause__ = error
+    upstream_errors.inc(stage="download", **upstream_error_labels(failure if status_code else error))
+    return failure
+
+def classify_upstream_outcome(error: Exception) -> str:
+    """根据异常判断上游调用结果，用于调整并发窗口"""
+    if isinstance(error, UpstreamError) and error.is_overload:
+        return OUTCOME_OVERLOAD
+    if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException, asyncio.TimeoutError)):
+        return OUTCOME_OVERLOAD
+    return OUTCOME_ERROR
+
+def release_api_key(api_key: ApiKey, error: Optional[BaseException] = None):
+    """归还 API Key，上游返回限流或鉴权失败时暂停使用该 Key"""
+    if isinstance(error, UpstreamError):
+        key_pool.release(api_key, classify_key_outcome(error.status_code), error.retry_after)
+    else:
+        key_pool.release(api_key)
+
+def upstream_error_labels(error: Exception) -> Dict[str, str]:
+    """上游错误的指标标签：HTTP 状态码和 DashScope 错误码，超时和网络错误单独归类"""
+    if isinstance(error, UpstreamError):
+        return {"status": str(error.status_code), "code": error.code or ""}
+    if isinstance(error, DownloadError) and error.status_code is not None:
+        return {"status": str(error.status_code), "code": ""}
+    if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException, asyncio.TimeoutError)):
+        return {"status": "timeout", "code": ""}
+    if isinstance(error, (requests.exceptions.ConnectionError, httpx.TransportError)):
+        return {"status": "network", "code": ""}
+    return {"status": "error", "code": type(error).__name__}
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断错误是否为可重试的临时错误（限流、5xx、超时、网络及下载错误）"""
+    if isinstance(error, UpstreamError):
+        return error.is_retryable
+    if isinstance(error, DownloadError):
+        return True
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        httpx.TransportError,
+        asyncio.TimeoutError
+    ))
+
+async def index_audio_file(file_path: str, sha256: Optional[str] = None, task_id: Optional[str] = None):
+    """将新生成的音频文件登记到元数据索引（失败时只记录日志，提供文件时会重新登记）"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, audio_index.register, file_path, sha256, task_id)
+    except (OSError, sqlite3.Error) as e:
+        print(f"登记音频元数据失败: {e}")
+
+def discard_audio_file(file_path: str):
+    """删除音频文件及其元数据记录"""
+    try:
+        audio_index.remove(file_path)
+    except sqlite3.Error as e:
+        print(f"删除音频元数据失败: {e}")
+    try:
+        os.unlink(file_path)
+    except OSError:
+        pass
+
+async def run_blocking(function, *args, **kwargs):
+    """在线程池中执行阻塞调用（如 SQLite 写事务，可能需要等待其他进程释放写锁），不阻塞事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(function, *args, **kwargs))
 
 # TTS 服务类
 class QwenTTSService:
     def __init__(self):
-        self.api_key = config.DASHSCOPE_API_KEY
-        
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_loop = None
+        self._background_tasks = set()
+        # 正在合成中的请求（按缓存键），相同内容的并发请求共享一次上游调用
+        self.single_flight = SingleFlight()
+        self.dashscope_client = DashScopeTTSClient(
+            config.DASHSCOPE_BASE_URL,
+            lambda: self.http_client,
+            timeout=config.REQUEST_TIMEOUT
+        )
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """共享的异步 HTTP 连接池（keep-alive 复用连接）"""
+        loop = asyncio.get_running_loop()
+        if self._http_client is None or self._http_client.is_closed or self._http_client_loop is not loop:
+            # 连接池绑定在创建它的事件循环上
+            self._http_client_loop = loop
+            self._http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(config.DOWNLOAD_TIMEOUT, connect=config.REQUEST_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=config.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+                ),
+                follow_redirects=True
+            )
+        return self._http_client
+
+    async def close(self):
+        """关闭共享连接池"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
     async def synthesize_speech(
         self,
         text: str,
         voice: str = "Cherry",
         model: str = config.DEFAULT_MODEL,
+        priority: str = PRIORITY_INTERACTIVE,
+        group: Optional[str] = None,
+        ticket: Optional[QueueTicket] = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """异步语音合成"""
+        """异步语音合成
+
+        priority 和 group 决定排队时的调度顺序（见 AdaptiveLimiter），批量任务以任务 ID 为分组。
+        传入 ticket 时按 ticket 排队（排队期间优先级可能被提升）。
+        """
+        if ticket is None:
+            ticket = QueueTicket(priority, group)
         try:
             # 验证音色
             if voice not in config.VOICES:
                 raise ValueError(f"不支持的音色: {voice}")
-
-            # 调用 Qwen-TTS API - 使用官方支持的参数
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: dashscope.audio.qwen_tts.SpeechSynthesizer.call(
-                    model=model,
-                    api_key=self.api_key,
-                    text=text,
-                    voice=voice,
-                )
-            )
-
-            # 检查响应是否为空
-            if response is None:
-                raise RuntimeError("API call returned None response")
-
-            # 检查 response.output 是否为空
-            if response.output is None:
-                raise RuntimeError("API call failed: response.output is None")
-
-            # 检查 response.output.audio 是否存在
-            if not hasattr(response.output, 'audio') or response.output.audio is None:
-                raise RuntimeError("API call failed: response.output.audio is None or missing")
-
-            # 获取音频 URL
-            audio_url = response.output.audio["url"]
+            check_model(model)
+
+            # 经过全局并发限制器和 API Key 池调用上游
+            with stage_duration.time(stage="queue_wait", voice=voice, model=model):
+                with queue_wait_duration.time(priority=ticket.priority):
+                    await upstream_limiter.acquire(ticket=ticket)
+                    api_key = await self.acquire_api_key()
+            start_time = time.monotonic()
+            outcome = OUTCOME_ERROR
+            error = None
+            try:
+                with stage_duration.time(stage="upstream_request", voice=voice, model=model):
+                    if config.DASHSCOPE_CLIENT == "sdk":
+                        audio_url = await self.request_audio_url_sdk(text, voice, model, api_key.key)
+                    else:
+                        audio_url = await self.request_audio_url_native(text, voice, model, api_key.key)
+                outcome = OUTCOME_SUCCESS
+            except Exception as e:
+                error = e
+                outcome = classify_upstream_outcome(e)
+                upstream_errors.inc(stage="synthesize", **upstream_error_labels(e))
+                raise
+            finally:
+                release_api_key(api_key, error)
+                upstream_limiter.release(time.monotonic() - start_time, outcome)
 
             return {
                 "success": True,
@@ -143,146 +379,1130 @@ class QwenTTSService:
             print(f"语音合成错误: {e}")
             return {
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "retryable": is_retryable_error(e),
+                "retry_after": getattr(e, "retry_after", None)
             }
     
-    async def download_audio(self, audio_url: str, filename: str) -> str:
-        """异步下载音频文件"""
+    async def acquire_api_key(self) -> ApiKey:
+        """在已占用全局并发槽位的情况下获取 API Key，失败时归还槽位"""
         try:
-            file_path = os.path.join(config.AUDIO_OUTPUT_DIR, filename)
-            
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: requests.get(audio_url, timeout=config.DOWNLOAD_TIMEOUT)
+            return await key_pool.acquire()
+        except BaseException:
+            upstream_limiter.release(None, OUTCOME_ERROR)
+            raise
+
+    async def request_audio_url_native(self, text: str, voice: str, model: str, api_key: str) -> str:
+        """通过原生异步客户端调用 Qwen-TTS API，返回音频地址"""
+        return await self.dashscope_client.synthesize(text, voice, model, api_key)
+
+    async def request_audio_url_sdk(self, text: str, voice: str, model: str, api_key: str) -> str:
+        """通过 DashScope SDK（线程池中执行）调用 Qwen-TTS API，返回音频地址"""
+        # 调用 Qwen-TTS API - 使用官方支持的参数
+        response = await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: dashscope.audio.qwen_tts.SpeechSynthesizer.call(
+                model=model,
+                api_key=api_key,
+                text=text,
+                voice=voice,
             )
-            response.raise_for_status()
-            
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(response.content)
-            
+        )
+
+        # 检查响应是否为空
+        if response is None:
+            raise RuntimeError("API call returned None response")
+
+        # 检查响应状态
+        if response.status_code != HTTPStatus.OK:
+            raise UpstreamError.from_response(response)
+
+        # 检查 response.output 是否为空
+        if response.output is None:
+            raise RuntimeError("API call failed: response.output is None")
+
+        # 检查 response.output.audio 是否存在
+        if not hasattr(response.output, 'audio') or response.output.audio is None:
+            raise RuntimeError("API call failed: response.output.audio is None or missing")
+
+        # 获取音频 URL
+        return response.output.audio["url"]
+
+    async def download_audio(self, audio_url: str, filename: str, voice: str = "", model: str = "") -> str:
+        """异步下载音频文件（分块流式写入临时文件，完成后原子重命名）
+
+        分别记录首字节、传输和写盘的耗时（voice / model 仅用作指标标签）。
+        """
+        file_path = audio_storage.path(filename, create=True)
+        temp_path = f"{file_path}.part"
+        labels = {"voice": voice, "model": model}
+        finished = False
+
+        try:
+            digest = hashlib.sha256()
+            write_time = 0.0
+            size = 0
+            start_time = time.perf_counter()
+            async with self.http_client.stream("GET", audio_url) as response:
+                response.raise_for_status()
+                body_start = time.perf_counter()
+                stage_duration.observe(body_start - start_time, stage="download_first_byte", **labels)
+                async with aiofiles.open(temp_path, 'wb') as f:
+                    async for chunk in response.aiter_bytes(config.DOWNLOAD_CHUNK_SIZE):
+                        write_start = time.perf_counter()
+                        await f.write(chunk)
+                        write_time += time.perf_counter() - write_start
+                        digest.update(chunk)
+                        size += len(chunk)
+
+            write_start = time.perf_counter()
+            os.replace(temp_path, file_path)
+            finished = True
+            write_time += time.perf_counter() - write_start
+            stage_duration.observe(write_start - body_start - write_time, stage="download_body", **labels)
+            stage_duration.observe(write_time, stage="disk_write", **labels)
+            audio_bytes_written.inc(size, source="download")
+
+            await index_audio_file(file_path, digest.hexdigest())
             return file_path
-            
+
+        except Exception as e:
+            raise download_failure(e) from e
+
+        finally:
+            # 出错或被取消（如长文本的其他分块失败）时删除未完成的临时文件
+            if not finished:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+    async def tee_download(
+        self,
+        audio_url: str,
+        filename: str,
+        cache_key: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        """边下载边转发音频
+
+        下载在独立任务中进行并写入本地文件，同时将相同的数据块通过有界队列交给调用方。
+        调用方提前断开时下载仍会完成，文件照常落盘并写入缓存。
+        """
+        file_path = audio_storage.path(filename, create=True)
+        temp_path = f"{file_path}.part"
+        queue: asyncio.Queue = asyncio.Queue(maxsize=config.STREAM_QUEUE_SIZE)
+        consumer_alive = True
+        end_of_stream = object()
+
+        async def produce():
+            outcome = end_of_stream
+            finished = False
+            try:
+                digest = hashlib.sha256()
+                async with self.http_client.stream("GET", audio_url) as response:
+                    response.raise_for_status()
+                    async with aiofiles.open(temp_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes(config.DOWNLOAD_CHUNK_SIZE):
+                            await f.write(chunk)
+                            digest.update(chunk)
+                            audio_bytes_written.inc(len(chunk), source="download")
+                            if consumer_alive:
+                                await queue.put(chunk)
+
+                os.replace(temp_path, file_path)
+                finished = True
+                await index_audio_file(file_path, digest.hexdigest())
+                if audio_cache and cache_key:
+                    audio_cache.put(cache_key, file_path)
+
+            except Exception as e:
+                outcome = download_failure(e)
+
+            finally:
+                if not finished:
+                    try:
+                        os.unlink(temp_path)
+                    except OSError:
+                        pass
+
+            if consumer_alive:
+                await queue.put(outcome)
+
+        task = asyncio.create_task(produce())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is end_of_stream:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # 客户端断开后不再转发，清空队列以免阻塞下载任务
+            consumer_alive = False
+            while not queue.empty():
+                queue.get_nowait()
+
+    async def stream_speech(
+        self,
+        text: str,
+        voice: str,
+        model: str,
+        filename: str
+    ) -> AsyncIterator[bytes]:
+        """流式语音合成
+
+        逐块产出上游增量返回的 PCM 数据（16bit 单声道），同时将完整音频拼装为 WAV 文件，
+        合成完成后可通过 /audio 或 /api/download 访问。超过 MAX_TEXT_LENGTH 的文本分块合成。
+        """
+        if voice not in config.VOICES:
+            raise ValueError(f"不支持的音色: {voice}")
+        check_model(model)
+
+        if len(text) > config.MAX_TEXT_LENGTH:
+            async for pcm in self.stream_long_text(text, voice, model, filename):
+                yield pcm
+            return
+
+        file_path = audio_storage.path(filename, create=True)
+        cache_key = make_cache_key(text, voice, model)
+
+        cached_path = audio_cache.get(cache_key) if audio_cache else None
+        if cached_path:
+            with wave.open(cached_path, 'rb') as wav:
+                cache_usable = (
+                    wav.getframerate() == config.STREAM_SAMPLE_RATE
+                    and wav.getsampwidth() == config.STREAM_SAMPLE_WIDTH
+                    and wav.getnchannels() == 1
+                )
+            if cache_usable:
+                link_or_copy(cached_path, file_path)
+                await index_audio_file(file_path)
+                frames_per_chunk = config.DOWNLOAD_CHUNK_SIZE // config.STREAM_SAMPLE_WIDTH
+                with wave.open(file_path, 'rb') as wav:
+                    while True:
+                        pcm = wav.readframes(frames_per_chunk)
+                        if not pcm:
+                            break
+                        yield pcm
+                return
+
+        temp_path = f"{file_path}.part"
+        finished = False
+        limiter_outcome = OUTCOME_ERROR
+        error = None
+
+        with stage_duration.time(stage="queue_wait", voice=voice, model=model):
+            with queue_wait_duration.time(priority=PRIORITY_INTERACTIVE):
+                await upstream_limiter.acquire(PRIORITY_INTERACTIVE)
+                api_key = await self.acquire_api_key()
+        start_time = time.perf_counter()
+        first_chunk = True
+        if config.DASHSCOPE_CLIENT == "sdk":
+            chunks = self.stream_pcm_sdk(text, voice, model, api_key.key)
+        else:
+            chunks = self.dashscope_client.stream(text, voice, model, api_key.key)
+
+        try:
+            pending = b""
+            frames = 0
+            with wave.open(temp_path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(config.STREAM_SAMPLE_WIDTH)
+                wav.setframerate(config.STREAM_SAMPLE_RATE)
+
+                async for data in chunks:
+                    # 保证每个数据块都是完整的采样点
+                    pcm = pending + data
+                    usable = len(pcm) - len(pcm) % config.STREAM_SAMPLE_WIDTH
+                    pcm, pending = pcm[:usable], pcm[usable:]
+                    if pcm:
+                        if first_chunk:
+                            first_chunk = False
+                            stage_duration.observe(
+                                time.perf_counter() - start_time, stage="stream_first_chunk", voice=voice, model=model
+                            )
+                        wav.writeframes(pcm)
+                        frames += len(pcm) // config.STREAM_SAMPLE_WIDTH
+                        audio_bytes_written.inc(len(pcm), source="stream")
+                        yield pcm
+
+            # 上游已确认结束（见 dashscope_client.stream / stream_pcm_sdk），但没有任何音频时同样不保存
+            if frames == 0:
+                raise IncompleteStreamError("流式响应不含音频数据")
+            os.replace(temp_path, file_path)
+            finished = True
+            limiter_outcome = OUTCOME_SUCCESS
+            await index_audio_file(file_path)
+            if audio_cache:
+                audio_cache.put(cache_key, file_path)
+
+        except Exception as e:
+            error = e
+            limiter_outcome = classify_upstream_outcome(e)
+            upstream_errors.inc(stage="stream", **upstream_error_labels(e))
+            raise
+
+        finally:
+            await chunks.aclose()
+            if not finished:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+            # 流式调用耗时取决于音频长度，不参与延迟基线的计算
+            release_api_key(api_key, error)
+            upstream_limiter.release(None, limiter_outcome)
+
+    async def stream_pcm_sdk(self, text: str, voice: str, model: str, api_key: str) -> AsyncIterator[bytes]:
+        """通过 DashScope SDK 流式合成（在线程中消费 SDK 的生成器），逐块产出 PCM 数据
+
+        与 dashscope_client.stream 一样，没有收到 finish_reason 为 stop 的响应时抛出 IncompleteStreamError。
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        end_of_stream = object()
+
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+        def run():
+            outcome = end_of_stream
+            try:
+                responses = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
+                    model=model,
+                    api_key=api_key,
+                    text=text,
+                    voice=voice,
+                    stream=True
+                )
+                finished = False
+                for response in responses:
+                    if response.status_code != HTTPStatus.OK:
+                        raise UpstreamError.from_response(response)
+                    audio = response.output.audio if response.output else None
+                    if audio and audio.get("data"):
+                        emit(base64.b64decode(audio["data"]))
+                    if response.output and response.output.get("finish_reason") == "stop":
+                        finished = True
+                if not finished:
+                    raise IncompleteStreamError()
+            except Exception as e:
+                outcome = e
+            emit(outcome)
+
+        loop.run_in_executor(None, run)
+
+        while True:
+            item = await queue.get()
+            if item is end_of_stream:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def stream_long_text(
+        self,
+        text: str,
+        voice: str,
+        model: str,
+        filename: str,
+        results: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[bytes]:
+        """长文本分块合成
+
+        按句子边界切分（第一块较短），各块通过 synthesize_to_file 并行合成（使用缓存和去重）。
+        第一块与单次请求一样排队，其余块作为同一分组与其他请求轮流获得上游并发。
+        按顺序产出交叉淡化拼接后的 PCM 数据（第一块完成即开始产出），同时拼装为完整的 WAV 文件；
+        各块的合成结果依次追加到 results。任一块失败时抛出异常，未完成的块被取消。
+        """
+        if voice not in config.VOICES:
+            raise ValueError(f"不支持的音色: {voice}")
+        check_model(model)
+
+        chunks = split_for_synthesis(text, config.LONG_TEXT_CHUNK_LENGTH, config.LONG_TEXT_FIRST_CHUNK_LENGTH)
+        file_path = audio_storage.path(filename, create=True)
+        temp_path = f"{file_path}.part"
+        stem = os.path.splitext(filename)[0]
+        group = f"long:{stem}"
+        start_time = time.perf_counter()
+
+        tasks = [
+            asyncio.create_task(self.synthesize_to_file(
+                chunk, voice, model, f"{stem}_part{index:03d}.wav", group=None if index == 0 else group
+            ))
+            for index, chunk in enumerate(chunks)
+        ]
+        finished = False
+        try:
+            stitcher = CrossfadeStitcher(config.STREAM_SAMPLE_RATE, config.LONG_TEXT_CROSSFADE_MS)
+            with wave.open(temp_path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(config.STREAM_SAMPLE_WIDTH)
+                wav.setframerate(config.STREAM_SAMPLE_RATE)
+
+                for index, task in enumerate(tasks):
+                    result = await task
+                    if results is not None:
+                        results.append(result)
+                    if not result["success"]:
+                        raise RuntimeError(result["error"])
+
+                    with wave.open(result["file_path"], 'rb') as chunk_wav:
+                        if (
+                            chunk_wav.getframerate() != config.STREAM_SAMPLE_RATE
+                            or chunk_wav.getsampwidth() != config.STREAM_SAMPLE_WIDTH
+                            or chunk_wav.getnchannels() != 1
+                        ):
+                            raise ValueError(f"第 {index + 1} 块音频格式与预期不一致")
+                        pcm = stitcher.add(chunk_wav.readframes(chunk_wav.getnframes()))
+
+                    if index == 0:
+                        stage_duration.observe(
+                            time.perf_counter() - start_time, stage="long_text_first_chunk", voice=voice, model=model
+                        )
+                    wav.writeframes(pcm)
+                    yield pcm
+
+                pcm = stitcher.finish()
+                wav.writeframes(pcm)
+                yield pcm
+
+            os.replace(temp_path, file_path)
+            finished = True
+            await index_audio_file(file_path)
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not finished:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+            # 各块的文件只用于拼接
+            for task in tasks:
+                if task.done() and not task.cancelled() and not task.exception() and task.result()["success"]:
+                    discard_audio_file(task.result()["file_path"])
+
+    async def synthesize_long_text_to_file(self, text: str, voice: str, model: str, filename: str) -> Dict[str, Any]:
+        """长文本分块合成并保存为指定文件，结果格式与 synthesize_to_file 相同（另含块数 chunks）"""
+        results: List[Dict[str, Any]] = []
+        try:
+            async for _ in self.stream_long_text(text, voice, model, filename, results):
+                pass
         except Exception as e:
-            raise RuntimeError(f"音频下载失败: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "attempts": sum(result.get("attempts", 0) for result in results)
+            }
+
+        return {
+            "success": True,
+            "file_path": audio_storage.path(filename),
+            "voice_info": config.VOICES[voice],
+            "cache_hit": all(result["cache_hit"] for result in results),
+            "deduplicated": all(result.get("deduplicated", False) for result in results),
+            "attempts": sum(result["attempts"] for result in results),
+            "chunks": len(results)
+        }
+
+    async def synthesize_to_file(
+        self,
+        text: str,
+        voice: str,
+        model: str,
+        filename: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        group: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """合成语音并保存为指定文件
+
+        优先使用缓存；相同内容（归一化文本、音色、模型）正在合成时，等待其完成后
+        通过硬链接复用其文件（结果中 deduplicated 为 True），不再重复调用上游。
+        发起合成的请求被取消时，只要还有其他请求在等待，合成就会继续。
+        共享的合成按发起者的 priority 和 group 排队，更高优先级的请求加入时提升为其优先级。超过 MAX_TEXT_LENGTH 的文本分块合成后拼接。
+        """
+        if len(text) > config.MAX_TEXT_LENGTH:
+            return await self.synthesize_long_text_to_file(text, voice, model, filename)
+
+        file_path = audio_storage.path(filename, create=True)
+        cache_key = make_cache_key(text, voice, model)
+
+        if audio_cache and voice in config.VOICES:
+            cached_path = audio_cache.get(cache_key)
+            if cached_path:
+                link_or_copy(cached_path, file_path)
+                await index_audio_file(file_path)
+                return {
+                    "success": True,
+                    "file_path": file_path,
+                    "voice_info": config.VOICES[voice],
+                    "cache_hit": True,
+                    "attempts": 0
+                }
+
+        ticket = QueueTicket(priority, group)
+        result, shared = await self.single_flight.do(
+            cache_key,
+            lambda: self._synthesize_with_retry(text, voice, model, filename, cache_key, ticket),
+            ticket
+        )
+        result = dict(result)
+        if shared:
+            if result["success"]:
+                link_or_copy(result["file_path"], file_path)
+                await index_audio_file(file_path)
+                result["file_path"] = file_path
+            result["deduplicated"] = True
+            result["attempts"] = 0
+        return result
+
+    async def _synthesize_with_retry(
+        self,
+        text: str,
+        voice: str,
+        model: str,
+        filename: str,
+        cache_key: str,
+        ticket: QueueTicket
+    ) -> Dict[str, Any]:
+        """调用上游合成并下载到指定文件，临时错误按重试策略退避重试（各次尝试按同一 ticket 排队）"""
+        file_path = audio_storage.path(filename)
+
+        # 合成和下载的临时错误按重试策略退避重试
+        deadline = retry_policy.start()
+        attempt = 0
+        result = None
+        while True:
+            attempt += 1
+
+            if result is None:
+                result = await self.synthesize_speech(text=text, voice=voice, model=model, ticket=ticket)
+                if not result["success"]:
+                    delay = None
+                    if result.get("retryable"):
+                        delay = retry_policy.next_delay(attempt, deadline, result.get("retry_after"))
+                    if delay is None:
+                        result["attempts"] = attempt
+                        return result
+                    print(f"语音合成第 {attempt} 次尝试失败，{delay:.2f} 秒后重试: {result['error']}")
+                    result = None
+                    await asyncio.sleep(delay)
+                    continue
+
+            try:
+                await self.download_audio(result["audio_url"], filename, voice, model)
+                break
+            except DownloadError as e:
+                delay = retry_policy.next_delay(attempt, deadline)
+                if delay is None:
+                    return {"success": False, "error": str(e), "attempts": attempt}
+                print(f"音频下载第 {attempt} 次尝试失败，{delay:.2f} 秒后重试: {e}")
+                if e.url_expired:
+                    # 音频地址不可用，下次尝试重新合成
+                    result = None
+                await asyncio.sleep(delay)
+
+        if audio_cache:
+            audio_cache.put(cache_key, file_path)
+
+        result["file_path"] = file_path
+        result["cache_hit"] = False
+        result["attempts"] = attempt
+        return result
 
 # 批量处理管理器
 class BatchTaskManager:
-    def __init__(self):
-        self.tasks: Dict[str, TaskProgress] = {}
-        self.max_concurrent_tasks = 3  # 最大并发任务数
+    def __init__(self, store: TaskStore):
+        self.store = store
+        self._merge_locks: Dict[str, asyncio.Lock] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # 已推送给订阅者的进度（任务 ID -> (事件序号, 状态)）
+        self._cursors: Dict[str, Tuple[int, str]] = {}
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """订阅任务的进度事件"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=config.PROGRESS_EVENT_QUEUE_SIZE)
+        if task_id not in self._subscribers:
+            row = self.store.get_task(task_id)
+            self._cursors[task_id] = (row["event_seq"], row["status"])
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        """取消订阅"""
+        subscribers = self._subscribers.get(task_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[task_id]
+                self._cursors.pop(task_id, None)
+
+    def _publish(self, task_id: str, event: str, data: Dict[str, Any]):
+        """向订阅者推送事件；订阅者消费过慢导致队列溢出时，丢弃积压事件并要求其重新同步"""
+        for queue in self._subscribers.get(task_id, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", {}))
 
-    def create_task(self, segments: List[str], voice: str, model: str) -> str:
-        """创建批量任务"""
-        task_id = str(uuid.uuid4())
-        task = TaskProgress(
-            task_id=task_id,
-            status=TaskStatus.PENDING,
-            total_segments=len(segments),
-            completed_segments=0,
-            failed_segments=0,
-            progress_percentage=0.0,
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
-            results=[]
+    def create_task(
+        self,
+        segments: List[str],
+        voice: str,
+        model: str,
+        merge_output: bool = False,
+        merge_silence_ms: int = 0,
+        chapter_markers: bool = True,
+        split_by: Optional[str] = None,
+        max_length: Optional[int] = None,
+        ingest_done: bool = True,
+        task_id: Optional[str] = None,
+        encoding: Optional[str] = None
+    ) -> str:
+        """创建批量任务（ingest_done 为 False 时分段由后台任务陆续写入）"""
+        task_id = task_id or str(uuid.uuid4())
+        self.store.create_task(
+            task_id, segments, voice, model, TaskStatus.PENDING.value,
+            merge_output=merge_output,
+            merge_silence_ms=merge_silence_ms,
+            merge_chapter_markers=chapter_markers,
+            ingest_done=ingest_done,
+            split_by=split_by,
+            max_length=max_length,
+            encoding=encoding
         )
-        self.tasks[task_id] = task
         return task_id
 
     def get_task(self, task_id: str) -> Optional[TaskProgress]:
-        """获取任务状态"""
-        return self.tasks.get(task_id)
+        """获取任务状态（含全部分段结果）"""
+        task = self.get_task_summary(task_id)
+        if task:
+            task.results = self.store.get_results(task_id)
+            if task.merge_output:
+                task.chapters = self.store.get_chapters(task_id)
+        return task
+
+    def get_task_summary(self, task_id: str) -> Optional[TaskProgress]:
+        """获取任务状态（不含分段结果和章节）"""
+        row = self.store.get_task(task_id)
+        if not row:
+            return None
+
+        total = row["total_segments"]
+        processed = row["completed_segments"] + row["failed_segments"]
+        return TaskProgress(
+            task_id=task_id,
+            status=TaskStatus(row["status"]),
+            total_segments=total,
+            completed_segments=row["completed_segments"],
+            failed_segments=row["failed_segments"],
+            progress_percentage=processed / total * 100 if total else 0.0,
+            cache_hits=row["cache_hits"],
+            cache_misses=row["cache_misses"],
+            dedup_hits=row["dedup_hits"],
+            upstream_calls_saved=row["cache_hits"] + row["dedup_hits"],
+            created_at=datetime.fromisoformat(row["created_at"]),
+            updated_at=datetime.fromisoformat(row["updated_at"]),
+            merge_output=bool(row["merge_output"]),
+            merged_segments=row["merged_next_index"],
+            merged_audio_url=f"/audio/{row['merged_filename']}" if row["merged_filename"] else None,
+            merged_filename=row["merged_filename"] or None,
+            ingest_done=bool(row["ingest_done"]),
+            error=row["error"]
+        )
 
-    def update_task_progress(self, task_id: str, completed: int, failed: int, result: Dict[str, Any] = None):
-        """更新任务进度"""
-        if task_id not in self.tasks:
+    def refresh_status(self, task_id: str):
+        """根据分段计数和合并进度更新任务状态"""
+        row = self.store.get_task(task_id)
+        status = self.store.refresh_status(task_id)
+        if row and status != row["status"] and status in (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value):
+            print(f"批量任务 {task_id} 完成: 成功 {row['completed_segments']}, 失败 {row['failed_segments']}")
+
+    def poll_events(self, task_id: str):
+        """读取任务自上次推送以来完成的分段和状态变化，推送给订阅者
+
+        分段可能由其他进程（worker.py）处理，进度统一从存储中读取。
+        """
+        cursor = self._cursors.get(task_id)
+        row = self.store.get_task(task_id)
+        if cursor is None or row is None:
             return
 
-        task = self.tasks[task_id]
-        task.completed_segments = completed
-        task.failed_segments = failed
-        task.progress_percentage = (completed + failed) / task.total_segments * 100
-        task.updated_at = datetime.now()
+        seq, status = cursor
+        if row["event_seq"] > seq:
+            total = row["total_segments"]
+            processed = row["completed_segments"] + row["failed_segments"]
+            counts = {
+                "total_segments": total,
+                "completed_segments": row["completed_segments"],
+                "failed_segments": row["failed_segments"],
+                "progress_percentage": processed / total * 100 if total else 0.0
+            }
+            for seq, result in self.store.get_segment_events(task_id, seq):
+                self._publish(task_id, "segment", {"result": result, **counts})
+        if row["status"] != status:
+            task = self.get_task_summary(task_id)
+            if task.merge_output and task.merged_filename:
+                # 合并完成后章节不再变化，随状态一起推送
+                task.chapters = self.store.get_chapters(task_id)
+            self._publish(task_id, "status", jsonable_encoder(task, exclude={"results"}))
+        self._cursors[task_id] = (max(seq, row["event_seq"]), row["status"])
+
+    async def run_event_poller(self):
+        """定期为有订阅者的任务推送进度事件"""
+        while True:
+            await asyncio.sleep(config.PROGRESS_POLL_INTERVAL)
+            for task_id in list(self._subscribers):
+                try:
+                    self.poll_events(task_id)
+                except sqlite3.Error as e:
+                    print(f"读取批量任务 {task_id} 进度失败: {e}")
+
+    async def advance_merge(self, task_id: str, owner: str):
+        """将已完成的连续分段追加到合并音频
+
+        同一任务的合并操作在进程内由锁、跨进程由租约串行执行。租约被其他进程持有时直接返回，
+        由持有者在归还租约后再检查一次，期间完成的分段不会被遗漏。
+        """
+        if not await run_blocking(self._merge_ready, task_id):
+            return
 
-        if result:
-            task.results.append(result)
+        name = f"merge:{task_id}"
+        lock = self._merge_locks.setdefault(task_id, asyncio.Lock())
+        async with lock:
+            while True:
+                if not await run_blocking(self.store.acquire_lease, name, owner, config.BATCH_LEASE_SECONDS):
+                    return
+                try:
+                    finished = await run_blocking(self._advance_merge_sync, task_id)
+                finally:
+                    await run_blocking(self.store.release_lease, name, owner)
+                if finished or not await run_blocking(self._merge_ready, task_id):
+                    break
+
+        if finished:
+            self._merge_locks.pop(task_id, None)
+            await run_blocking(self.refresh_status, task_id)
+
+    def _merge_ready(self, task_id: str) -> bool:
+        """是否有可以继续合并的分段"""
+        row = self.store.get_task(task_id)
+        if not row or not row["merge_output"] or row["merged_filename"] is not None:
+            return False
+        segment = self.store.get_segment(task_id, row["merged_next_index"])
+        if segment is None:
+            return bool(row["ingest_done"]) and row["merged_next_index"] >= row["total_segments"]
+        return segment["status"] != "pending"
+
+    def _advance_merge_sync(self, task_id: str) -> bool:
+        """按分段顺序合并，遇到尚未完成的分段即停止；全部合并完成时返回 True"""
+        row = self.store.get_task(task_id)
+        if not row or not row["merge_output"] or row["merged_filename"] is not None:
+            return False
+
+        merged_filename = f"batch_{task_id}_merged.wav"
+        merged_path = audio_storage.path(merged_filename, create=True)
+        writer = MergedAudioWriter(
+            f"{merged_path}.part",
+            row["merge_silence_ms"],
+            frames_written=row["merged_frames"],
+            params=tuple(json.loads(row["merged_params"])) if row["merged_params"] else None
+        )
+        chapters = []  # 本次新增、尚未记录的章节
+        next_index = row["merged_next_index"]
+        total = row["total_segments"]
+        recorded_index = next_index
+
+        while next_index < total:
+            segment = self.store.get_segment(task_id, next_index)
+            if segment is None or segment["status"] == "pending":
+                break
+
+            if segment["status"] == "success":
+                try:
+                    start = writer.append(audio_storage.path(segment["filename"]))
+                    title = segment["text"].strip().splitlines()[0]
+                    chapters.append({
+                        "index": next_index,
+                        "title": title[:50] + "..." if len(title) > 50 else title,
+                        "start": round(start, 3),
+                        "end": round(writer.position_seconds, 3)
+                    })
+                except (OSError, EOFError, wave.Error, ValueError) as e:
+                    print(f"批量任务 {task_id} 合并分段 {next_index} 失败，已跳过: {e}")
+
+            next_index += 1
+            # 进度按批记录，进程中断时从上次记录处截断并重新追加
+            if next_index - recorded_index >= config.BATCH_MERGE_COMMIT_SEGMENTS:
+                self.store.update_merge_progress(task_id, next_index, writer.frames_written, writer.params, chapters)
+                chapters, recorded_index = [], next_index
+
+        if next_index < total or not row["ingest_done"]:
+            if next_index > recorded_index:
+                self.store.update_merge_progress(task_id, next_index, writer.frames_written, writer.params, chapters)
+            return False
+
+        if writer.params is None:
+            # 没有可合并的音频
+            self.store.update_merge_progress(task_id, next_index, 0, None, chapters, merged_filename="")
+            return True
+
+        self.store.update_merge_progress(task_id, next_index, writer.frames_written, writer.params, chapters)
+        writer.finalize(self.store.get_chapters(task_id) if row["merge_chapter_markers"] else [])
+        os.replace(writer.path, merged_path)
+        try:
+            audio_index.register(merged_path, task_id=task_id)
+        except (OSError, sqlite3.Error) as e:
+            print(f"登记合并音频元数据失败: {e}")
+        self.store.update_merge_progress(
+            task_id, next_index, writer.frames_written, writer.params, [], merged_filename=merged_filename
+        )
+        print(f"批量任务 {task_id} 合并音频完成: {merged_filename}")
+        return True
+
+# 批量任务工作协程
+class BatchWorker:
+    """从共享的任务队列（TaskStore 的分段表）领取批量任务的分段并合成
+
+    上传文件的分段过程、每个分段和合并音频都通过租约领取，持有期间定期续租；
+    进程崩溃后租约过期，其他工作进程（或重启后的本进程）会重新领取。
+    Web 进程默认内置一个工作协程（BATCH_EMBEDDED_WORKER），也可以通过 worker.py 在独立进程中运行任意多个。
+    """
+
+    def __init__(self, manager: BatchTaskManager, concurrency: int):
+        self.manager = manager
+        self.store = manager.store
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._segments: Set[asyncio.Task] = set()
+        self._ingests: Set[asyncio.Task] = set()
+        self._last_sweep = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    def notify(self):
+        """有新的分段或空闲槽位时唤醒领取循环"""
+        self._wakeup.set()
+
+    def start(self) -> asyncio.Task:
+        """在后台运行领取循环；循环意外退出时记录原因，BATCH_RESTART_DELAY 秒后重新启动"""
+        self._stopped = False
+        self._task = asyncio.create_task(self.run())
+        self._task.add_done_callback(self._on_exit)
+        return self._task
+
+    async def stop(self):
+        """停止领取循环，取消处理中的分段并归还租约"""
+        self._stopped = True
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _on_exit(self, task: asyncio.Task):
+        if self._stopped or task.cancelled():
+            return
+        print(f"批量任务工作协程异常退出，{config.BATCH_RESTART_DELAY} 秒后重启: {task.exception()!r}")
+        asyncio.get_running_loop().call_later(config.BATCH_RESTART_DELAY, self._restart)
 
-        if completed + failed >= task.total_segments:
-            task.status = TaskStatus.COMPLETED if failed == 0 else TaskStatus.FAILED
-        else:
-            task.status = TaskStatus.PROCESSING
+    def _restart(self):
+        if not self._stopped:
+            self.start()
 
-# 文件解析器
-class FileParser:
-    @staticmethod
-    def parse_text_file(content: str, split_by: str = "paragraph", max_length: int = 500) -> List[str]:
-        """解析文本文件内容"""
-        segments = []
-
-        if split_by == "paragraph":
-            # 按段落分割
-            paragraphs = re.split(r'\n\s*\n', content.strip())
-            for para in paragraphs:
-                para = para.strip()
-                if para:
-                    segments.extend(FileParser._split_long_text(para, max_length))
-
-        elif split_by == "sentence":
-            # 按句子分割
-            sentences = re.split(r'[。！？.!?]\s*', content)
-            current_segment = ""
-            for sentence in sentences:
-                sentence = sentence.strip()
-                if not sentence:
+    async def run(self):
+        """领取循环：保持最多 concurrency 个分段在处理中，队列为空时定期轮询（其他进程可能写入新任务）
+
+        单次循环出错（如数据库被其他进程长时间锁定）时记录日志并退避重试，不中断工作协程。
+        """
+        heartbeat = asyncio.create_task(self._renew_leases())
+        print(f"批量任务工作协程已启动: {self.worker_id}")
+        failures = 0
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    ingest = await run_blocking(self.store.claim_ingest, self.worker_id, config.BATCH_LEASE_SECONDS)
+                    if ingest:
+                        self._spawn(self._ingests, ingest_upload(
+                            ingest["task_id"], ingest["split_by"], ingest["max_length"], self, ingest["encoding"]
+                        ))
+
+                    free = self.concurrency - len(self._segments)
+                    if free > 0:
+                        claimed = await run_blocking(
+                            self.store.claim_segments, self.worker_id, config.BATCH_LEASE_SECONDS, free
+                        )
+                        for segment in claimed:
+                            self._spawn(self._segments, self._process_segment(segment))
+
+                    if not ingest and (
+                        not self._segments or time.monotonic() - self._last_sweep > config.BATCH_LEASE_SECONDS
+                    ):
+                        self._last_sweep = time.monotonic()
+                        await self._finish_settled_tasks()
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    delay = min(config.BATCH_POLL_INTERVAL * 2 ** (failures - 1), config.BATCH_LEASE_SECONDS / 3)
+                    print(f"批量任务领取循环出错（第 {failures} 次），{delay:.1f} 秒后重试: {e!r}")
+                    await asyncio.sleep(delay)
                     continue
 
-                if len(current_segment + sentence) <= max_length:
-                    current_segment += sentence + "。"
-                else:
-                    if current_segment:
-                        segments.append(current_segment.strip())
-                    current_segment = sentence + "。"
+                if ingest:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), config.BATCH_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            heartbeat.cancel()
+            running = self._segments | self._ingests
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            try:
+                await run_blocking(self.store.release_leases, self.worker_id)
+            except sqlite3.Error as e:
+                print(f"归还租约失败（到期后由其他进程领取）: {e}")
 
-            if current_segment:
-                segments.append(current_segment.strip())
+    def _spawn(self, tasks: Set[asyncio.Task], coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
 
-        elif split_by == "chapter":
-            # 按章节分割（基于标题）
-            chapters = re.split(r'\n#+\s+', content)
-            for chapter in chapters:
-                chapter = chapter.strip()
-                if chapter:
-                    segments.extend(FileParser._split_long_text(chapter, max_length))
+        def done(task: asyncio.Task):
+            tasks.discard(task)
+            self.notify()
+            if not task.cancelled() and task.exception():
+                print(f"批量任务处理异常: {task.exception()}")
 
-        return [seg for seg in segments if seg.strip()]
+        task.add_done_callback(done)
 
-    @staticmethod
-    def _split_long_text(text: str, max_length: int) -> List[str]:
-        """分割过长的文本"""
-        if len(text) <= max_length:
-            return [text]
-
-        segments = []
-        words = text.split()
-        current_segment = ""
-
-        for word in words:
-            if len(current_segment + " " + word) <= max_length:
-                current_segment += (" " + word) if current_segment else word
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(config.BATCH_LEASE_SECONDS / 3)
+            try:
+                await run_blocking(self.store.renew_leases, self.worker_id, config.BATCH_LEASE_SECONDS)
+            except sqlite3.Error as e:
+                print(f"续租失败: {e}")
+
+    async def _finish_settled_tasks(self):
+        """推进分段已全部处理但尚未结束的任务（合并音频的进程崩溃等情况）"""
+        for task_id in await run_blocking(self.store.get_settled_task_ids):
+            await self.manager.advance_merge(task_id, self.worker_id)
+            await run_blocking(self.manager.refresh_status, task_id)
+
+    async def _process_segment(self, segment: Dict[str, Any]):
+        """处理单个文本段"""
+        task_id = segment["task_id"]
+        index = segment["segment_index"]
+        text = segment["text"]
+        task = await run_blocking(self.store.get_task, task_id)
+        voice = task["voice"]
+        model = task["model"]
+        cache_key = make_cache_key(text, voice, model)
+        short_text = text[:100] + "..." if len(text) > 100 else text
+
+        try:
+            if segment["claims"] > config.BATCH_MAX_CLAIMS:
+                raise RuntimeError(f"分段已被领取 {segment['claims'] - 1} 次仍未完成（处理进程多次中断），已放弃")
+
+            # 生成文件名
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"batch_{task_id}_{index:03d}_{voice}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+
+            # 本任务中已合成过相同内容时直接硬链接，否则调用TTS服务（命中缓存或相同内容正在合成时不请求上游）
+            produced = await run_blocking(self.store.find_produced, task_id, cache_key)
+            source_path = audio_storage.path(produced) if produced else None
+            if source_path and os.path.exists(source_path):
+                file_path = audio_storage.path(filename, create=True)
+                link_or_copy(source_path, file_path)
+                result = {"success": True, "file_path": file_path, "cache_hit": False, "deduplicated": True, "attempts": 0}
             else:
-                if current_segment:
-                    segments.append(current_segment)
-                current_segment = word
+                result = await tts_service.synthesize_to_file(
+                    text=text,
+                    voice=voice,
+                    model=model,
+                    filename=filename,
+                    priority=PRIORITY_BATCH,
+                    group=task_id
+                )
 
-        if current_segment:
-            segments.append(current_segment)
+            if result["success"]:
+                # 登记文件所属的任务，任务处理期间不会被后台回收
+                await index_audio_file(result["file_path"], task_id=task_id)
 
-        return segments
+                # 记录成功结果
+                segment_result = {
+                    "index": index,
+                    "text": short_text,
+                    "filename": filename,
+                    "audio_url": f"/audio/{filename}",
+                    "status": "success",
+                    "voice": voice,
+                    "cache_hit": result["cache_hit"],
+                    "deduplicated": result.get("deduplicated", False),
+                    "attempts": result["attempts"]
+                }
+            else:
+                # 记录失败结果
+                segment_result = {
+                    "index": index,
+                    "text": short_text,
+                    "status": "failed",
+                    "error": result.get("error", "未知错误"),
+                    "attempts": result.get("attempts", 1)
+                }
+
+        except asyncio.CancelledError:
+            # 进程退出，归还分段供其他进程领取
+            self.store.release_segment(task_id, index, self.worker_id)
+            raise
+        except Exception as e:
+            segment_result = {
+                "index": index,
+                "text": short_text,
+                "status": "failed",
+                "error": str(e)
+            }
+
+        # 更新进度（同时更新任务状态）
+        try:
+            status = await run_blocking(self.store.complete_segment, task_id, self.worker_id, segment_result, cache_key)
+        except sqlite3.Error as e:
+            # 归还分段，稍后重新处理（已生成的音频通过缓存复用）
+            print(f"批量任务 {task_id} 分段 {index} 的结果保存失败，归还分段稍后重试: {e}")
+            await run_blocking(self.store.release_segment, task_id, index, self.worker_id)
+            raise
+        if status is None:
+            print(f"批量任务 {task_id} 分段 {index} 的租约已被其他进程接管，结果已丢弃")
+            return
+        if status in (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value):
+            row = await run_blocking(self.store.get_task, task_id)
+            print(f"批量任务 {task_id} 完成: 成功 {row['completed_segments']}, 失败 {row['failed_segments']}")
+
+        # 将已完成的连续分段追加到合并音频
+        await self.manager.advance_merge(task_id, self.worker_id)
+
+# 文件解析器
+class FileParser:
+    @staticmethod
+    def parse_text_file(content: str, split_by: str = "paragraph", max_length: int = 500) -> List[str]:
+        """解析文本文件内容（按标点层级切分过长文本，保留原文标点）"""
+        return split_text(content, split_by, max_length)
 
 # 创建实例
+retry_policy = RetryPolicy(
+    max_attempts=config.RETRY_MAX_ATTEMPTS,
+    base_delay=config.RETRY_BASE_DELAY,
+    max_delay=config.RETRY_MAX_DELAY,
+    deadline=config.RETRY_DEADLINE
+)
+upstream_limiter = AdaptiveLimiter(
+    initial_limit=config.UPSTREAM_CONCURRENCY_INITIAL,
+    min_limit=config.UPSTREAM_CONCURRENCY_MIN,
+    max_limit=config.UPSTREAM_CONCURRENCY_MAX,
+    latency_tolerance=config.UPSTREAM_LATENCY_TOLERANCE
+)
+key_pool = KeyPool(
+    parse_key_specs(config.DASHSCOPE_API_KEYS, config.API_KEY_DEFAULT_QPS, config.API_KEY_DEFAULT_CONCURRENCY)
+    if config.DASHSCOPE_API_KEYS
+    else [(config.DASHSCOPE_API_KEY, config.API_KEY_DEFAULT_QPS, config.API_KEY_DEFAULT_CONCURRENCY)],
+    throttle_bench=config.API_KEY_THROTTLE_BENCH,
+    unauthorized_bench=config.API_KEY_UNAUTHORIZED_BENCH
+)
+audio_cache = AudioCache(
+    config.CACHE_DIR,
+    max_bytes=config.CACHE_MAX_SIZE_MB * 1024 * 1024,
+    max_age=config.CACHE_MAX_AGE_DAYS * 86400
+) if config.CACHE_ENABLED else None
+audio_storage = AudioStorage(config.AUDIO_OUTPUT_DIR, levels=config.AUDIO_SHARD_LEVELS)
+audio_index = AudioIndex(config.AUDIO_INDEX_DB_PATH, config.AUDIO_OUTPUT_DIR)
 tts_service = QwenTTSService()
-batch_manager = BatchTaskManager()
+transcoder = Transcoder(
+    config.FFMPEG_PATH,
+    max_workers=config.TRANSCODE_MAX_WORKERS,
+    timeout=config.TRANSCODE_TIMEOUT
+)
+batch_manager = BatchTaskManager(TaskStore(config.TASK_DB_PATH, busy_timeout=config.TASK_DB_BUSY_TIMEOUT))
+batch_worker = BatchWorker(batch_manager, config.BATCH_WORKERS) if config.BATCH_EMBEDDED_WORKER else None
+audio_collector = AudioCollector(
+    audio_index,
+    max_age=config.AUDIO_RETENTION_DAYS * 86400,
+    max_bytes=config.AUDIO_MAX_SIZE_MB * 1024 * 1024,
+    grace=config.AUDIO_GC_GRACE,
+    protected_tasks=batch_manager.store.get_unfinished_task_ids
+)
 file_parser = FileParser()
 
+# 运行指标（/metrics）
+metrics_registry = Registry()
+stage_duration = metrics_registry.histogram(
+    "qwen_tts_stage_duration_seconds",
+    "合成各阶段耗时（queue_wait、upstream_request、download_first_byte、download_body、disk_write、stream_first_chunk）",
+    ("stage", "voice", "model")
+)
+upstream_errors = metrics_registry.counter(
+    "qwen_tts_upstream_errors_total",
+    "上游调用失败次数（按阶段、HTTP 状态码和错误码）",
+    ("stage", "status", "code")
+)
+audio_bytes_written = metrics_registry.counter(
+    "qwen_tts_audio_bytes_written_total",
+    "写入磁盘的音频字节数",
+    ("source",)
+)
+queue_wait_duration = metrics_registry.histogram(
+    "qwen_tts_upstream_queue_wait_seconds",
+    "等待上游并发槽位和 API Key 的时间（按优先级：interactive、batch）",
+    ("priority",)
+)
+event_loop_lag = metrics_registry.histogram(
+    "qwen_tts_event_loop_lag_seconds",
+    "事件循环延迟（定时器计划唤醒与实际唤醒的时间差）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+metrics_registry.gauge("qwen_tts_upstream_in_flight", "正在进行的上游调用数", lambda: upstream_limiter.in_flight)
+metrics_registry.gauge("qwen_tts_upstream_concurrency_limit", "当前的上游并发窗口", lambda: upstream_limiter.limit)
+metrics_registry.gauge("qwen_tts_upstream_queue_depth", "等待上游并发槽位的请求数", lambda: upstream_limiter.queue_depth)
+metrics_registry.gauge("qwen_tts_upstream_queue_depth_by_priority", "各优先级等待上游并发槽位的请求数",
+                       lambda: {(priority,): depth for priority, depth in upstream_limiter.queue_depths().items()},
+                       ("priority",))
+metrics_registry.gauge("qwen_tts_synthesis_inflight_keys", "正在合成的不同内容数（相同内容共享一次调用）",
+                       lambda: len(tts_service.single_flight))
+metrics_registry.counter_function("qwen_tts_synthesis_coalesced_total", "合并到正在进行的相同合成的请求数",
+                                  lambda: tts_service.single_flight.shared_calls)
+metrics_registry.gauge("qwen_tts_batch_queue_depth", "批量任务中已分段、尚未完成的分段数（所有工作进程共享的队列）",
+                       batch_manager.store.count_pending_segments)
+metrics_registry.gauge("qwen_tts_api_key_in_flight", "各 API Key 正在进行的上游调用数",
+                       lambda: {(api_key.name,): api_key.in_flight for api_key in key_pool.keys}, ("key",))
+metrics_registry.gauge("qwen_tts_api_key_utilization", "各 API Key 的并发预算使用率（未限制并发的 Key 不输出）",
+                       lambda: {(api_key.name,): api_key.snapshot(time.monotonic())["utilization"]
+                                for api_key in key_pool.keys}, ("key",))
+metrics_registry.gauge("qwen_tts_api_key_benched", "各 API Key 是否因限流或鉴权失败暂停使用",
+                       lambda: {(api_key.name,): int(api_key.benched(time.monotonic())) for api_key in key_pool.keys},
+                       ("key",))
+metrics_registry.counter_function("qwen_tts_api_key_requests_total", "各 API Key 的上游调用次数",
+                                  lambda: {(api_key.name,): api_key.requests for api_key in key_pool.keys}, ("key",))
+metrics_registry.counter_function("qwen_tts_api_key_throttled_total", "各 API Key 被限流（429）的次数",
+                                  lambda: {(api_key.name,): api_key.throttled for api_key in key_pool.keys}, ("key",))
+if audio_cache:
+    metrics_registry.counter_function("qwen_tts_cache_hits_total", "合成缓存命中次数", lambda: audio_cache.hits)
+    metrics_registry.counter_function("qwen_tts_cache_misses_total", "合成缓存未命中次数", lambda: audio_cache.misses)
+    metrics_registry.gauge("qwen_tts_cache_hit_ratio", "合成缓存命中率", lambda: audio_cache.stats()["hit_ratio"])
+    metrics_registry.gauge("qwen_tts_cache_size_bytes", "合成缓存占用空间", lambda: audio_cache.stats()["size_bytes"])
+
 # API 路由
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -298,40 +1518,50 @@ async def get_voices():
     """获取支持的音色列表"""
     return {"voices": config.VOICES}
 
+def format_synthesis_error(error_msg: str) -> str:
+    """将上游错误转换为用户可读的提示"""
+    # 特殊处理 API Key 错误
+    if NoAvailableKeyError.MESSAGE in error_msg:
+        return (
+            f"API Key 鉴权失败：所有配置的 API Key 均被拒绝（401/403），已暂停使用 {config.API_KEY_UNAUTHORIZED_BENCH:.0f} 秒。"
+            "请检查 DASHSCOPE_API_KEY / DASHSCOPE_API_KEYS 是否正确、是否有访问 Qwen-TTS 服务的权限。"
+        )
+    if "401" in error_msg or "InvalidApiKey" in error_msg:
+        return "API Key 无效。请检查您的 DashScope API Key 是否正确配置。API Key 应该是以 'sk-' 开头的格式。"
+    elif "403" in error_msg:
+        return "API Key 权限不足。请确保您的 API Key 有访问 Qwen-TTS 服务的权限。"
+    elif "429" in error_msg:
+        return "请求频率过高，请稍后再试。"
+    elif "500" in error_msg:
+        return "服务器内部错误，请稍后再试。"
+    return error_msg
+
+def synthesis_http_error(error_msg: str) -> HTTPException:
+    """合成失败对应的 HTTP 错误：没有可用的 API Key 时返回 503，其余返回 500"""
+    if NoAvailableKeyError.MESSAGE in error_msg:
+        return HTTPException(status_code=503, detail=format_synthesis_error(error_msg))
+    return HTTPException(status_code=500, detail=format_synthesis_error(error_msg))
+
 @app.post("/api/synthesize", response_model=TTSResponse)
 async def synthesize_text(request: TTSRequest):
     """文本转语音 API"""
     start_time = datetime.now()
 
     try:
-        # 调用 TTS 服务
-        result = await tts_service.synthesize_speech(
+        # 生成唯一文件名
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"tts_{request.voice}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+
+        # 调用 TTS 服务（命中缓存时不请求上游）
+        result = await tts_service.synthesize_to_file(
             text=request.text,
             voice=request.voice,
-            model=request.model
+            model=request.model,
+            filename=filename
         )
 
         if not result["success"]:
-            error_msg = result["error"]
-
-            # 特殊处理 API Key 错误
-            if "401" in error_msg or "InvalidApiKey" in error_msg:
-                error_msg = "API Key 无效。请检查您的 DashScope API Key 是否正确配置。API Key 应该是以 'sk-' 开头的格式。"
-            elif "403" in error_msg:
-                error_msg = "API Key 权限不足。请确保您的 API Key 有访问 Qwen-TTS 服务的权限。"
-            elif "429" in error_msg:
-                error_msg = "请求频率过高，请稍后再试。"
-            elif "500" in error_msg:
-                error_msg = "服务器内部错误，请稍后再试。"
-
-            raise HTTPException(status_code=500, detail=error_msg)
-
-        # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"tts_{request.voice}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
-
-        # 下载音频文件
-        file_path = await tts_service.download_audio(result["audio_url"], filename)
+            raise synthesis_http_error(result["error"])
 
         # 计算处理时间
         duration = (datetime.now() - start_time).total_seconds()
@@ -340,9 +1570,13 @@ async def synthesize_text(request: TTSRequest):
             success=True,
             message="语音合成成功",
             audio_url=f"/audio/{filename}",
-            file_path=file_path,
+            file_path=result["file_path"],
             voice_info=result["voice_info"],
-            duration=duration
+            duration=duration,
+            cache_hit=result["cache_hit"],
+            deduplicated=result.get("deduplicated", False),
+            attempts=result["attempts"],
+            chunks=result.get("chunks")
         )
 
     except HTTPException:
@@ -350,28 +1584,370 @@ async def synthesize_text(request: TTSRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语音合成失败: {str(e)}")
 
-@app.get("/api/download/{filename}")
-async def download_audio_file(filename: str):
-    """下载音频文件"""
-    file_path = os.path.join(config.AUDIO_OUTPUT_DIR, filename)
-    
-    if not os.path.exists(file_path):
+async def synthesize_bulk_item(index: int, item: BulkSynthesisItem, group: str) -> Dict[str, Any]:
+    """合成批量 JSON 请求中的一个条目，失败时返回错误信息而不是抛出异常"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"tts_{item.voice}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+    try:
+        result = await tts_service.synthesize_to_file(
+            text=item.text,
+            voice=item.voice,
+            model=item.model,
+            filename=filename,
+            group=group
+        )
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+
+    if not result["success"]:
+        return {"index": index, "id": item.id, "success": False, "error": format_synthesis_error(result["error"])}
+    return {
+        "index": index,
+        "id": item.id,
+        "success": True,
+        "audio_url": f"/audio/{filename}",
+        "voice": item.voice,
+        "cache_hit": result["cache_hit"],
+        "deduplicated": result.get("deduplicated", False),
+        "attempts": result["attempts"]
+    }
+
+async def run_bulk_synthesis(items: List[BulkSynthesisItem]) -> AsyncIterator[Dict[str, Any]]:
+    """并发合成所有条目，按完成顺序逐个产出结果
+
+    每个请求作为上游限制器中的一个分组，与其他请求轮流获得上游并发；
+    迭代提前结束（如客户端断开）时取消尚未完成的条目。
+    """
+    group = f"bulk:{uuid.uuid4().hex}"
+    semaphore = asyncio.Semaphore(config.BULK_CONCURRENCY)
+
+    async def run(index: int, item: BulkSynthesisItem) -> Dict[str, Any]:
+        async with semaphore:
+            return await synthesize_bulk_item(index, item, group)
+
+    tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@app.post("/api/synthesize/bulk")
+async def synthesize_bulk(request: BulkSynthesisRequest):
+    """批量 JSON 合成 API
+
+    一次提交多个 {id, text, voice, model} 条目，在服务的并发限制下同时合成。
+    stream 为 true（默认）时以 NDJSON 逐行返回：每个条目完成时输出一行 item 结果
+    （附带最新的完成 / 失败计数），最后输出一行 done 汇总；
+    为 false 时等待全部完成后按提交顺序返回所有结果。单个条目失败不影响其他条目。
+    """
+    start_time = time.perf_counter()
+    total = len(request.items)
+
+    if not request.stream:
+        results = [result async for result in run_bulk_synthesis(request.items)]
+        results.sort(key=lambda result: result["index"])
+        failed = sum(1 for result in results if not result["success"])
+        return BulkSynthesisResponse(
+            success=failed == 0,
+            message="批量合成完成" if failed == 0 else f"批量合成完成，{failed} 个条目失败",
+            total=total,
+            completed=total - failed,
+            failed=failed,
+            duration=time.perf_counter() - start_time,
+            results=results
+        )
+
+    def format_line(data: Dict[str, Any]) -> str:
+        return json.dumps(data, ensure_ascii=False) + "\n"
+
+    async def lines():
+        completed = failed = 0
+        async for result in run_bulk_synthesis(request.items):
+            if result["success"]:
+                completed += 1
+            else:
+                failed += 1
+            yield format_line({
+                "type": "item",
+                **result,
+                "completed": completed,
+                "failed": failed,
+                "total": total,
+                "progress_percentage": (completed + failed) / total * 100
+            })
+        yield format_line({
+            "type": "done",
+            "success": failed == 0,
+            "completed": completed,
+            "failed": failed,
+            "total": total,
+            "duration": time.perf_counter() - start_time
+        })
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/synthesize/stream")
+async def synthesize_text_stream(request: TTSRequest):
+    """文本转语音 API（流式返回音频）
+
+    音频边从上游下载边转发给客户端，同时保存到本地，
+    保存后的地址通过 X-Audio-Url 响应头返回。
+    超过 MAX_TEXT_LENGTH 的文本分块并行合成，第一块完成后即开始返回（WAV 头中的长度未知），
+    后续各块按顺序交叉淡化拼接后返回。
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"tts_{request.voice}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+    headers = {
+        "X-Audio-Url": f"/audio/{filename}",
+        "Content-Disposition": f'inline; filename="{filename}"'
+    }
+
+    if len(request.text) > config.MAX_TEXT_LENGTH:
+        pcm_chunks = tts_service.stream_long_text(request.text, request.voice, request.model, filename)
+        try:
+            first_pcm = await pcm_chunks.__anext__()
+        except StopAsyncIteration:
+            first_pcm = b""
+        except Exception as e:
+            raise synthesis_http_error(str(e))
+
+        async def long_body():
+            try:
+                yield streaming_wav_header(config.STREAM_SAMPLE_RATE, 1, config.STREAM_SAMPLE_WIDTH) + first_pcm
+                async for pcm in pcm_chunks:
+                    yield pcm
+            finally:
+                await pcm_chunks.aclose()
+
+        headers["X-Cache-Hit"] = "false"
+        return StreamingResponse(long_body(), media_type="audio/wav", headers=headers)
+
+    cache_key = make_cache_key(request.text, request.voice, request.model)
+    if audio_cache and request.voice in config.VOICES:
+        cached_path = audio_cache.get(cache_key)
+        if cached_path:
+            file_path = audio_storage.path(filename, create=True)
+            link_or_copy(cached_path, file_path)
+            await index_audio_file(file_path)
+            headers["X-Cache-Hit"] = "true"
+            return FileResponse(path=file_path, media_type="audio/wav", headers=headers)
+
+    result = await tts_service.synthesize_speech(
+        text=request.text,
+        voice=request.voice,
+        model=request.model
+    )
+    if not result["success"]:
+        raise synthesis_http_error(result["error"])
+
+    # 先取到第一个数据块再开始响应，以便下载失败时仍能返回错误状态码
+    chunks = tts_service.tee_download(result["audio_url"], filename, cache_key)
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"语音合成失败: {str(e)}")
+
+    async def body():
+        try:
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    headers["X-Cache-Hit"] = "false"
+    return StreamingResponse(body(), media_type="audio/wav", headers=headers)
+
+@app.websocket("/ws/synthesize")
+async def synthesize_websocket(websocket: WebSocket):
+    """流式语音合成 WebSocket
+
+    客户端发送 JSON 请求 {"text", "voice", "model"}，服务端依次返回：
+    {"type": "start"} 描述 PCM 格式，随后是若干二进制 PCM 数据帧，
+    最后是 {"type": "done"}（包含保存后的音频地址）或 {"type": "error"}。
+    同一连接可以连续发送多个请求。
+    """
+    await websocket.accept()
+
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                request = TTSRequest(**json.loads(message))
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "message": f"请求参数错误: {e.errors()[0]['msg']}"})
+                continue
+            except ValueError:
+                await websocket.send_json({"type": "error", "message": "请求格式错误，请发送 JSON"})
+                continue
+
+            start_time = datetime.now()
+            timestamp = start_time.strftime("%Y%m%d_%H%M%S")
+            filename = f"tts_{request.voice}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+
+            await websocket.send_json({
+                "type": "start",
+                "format": "pcm_s16le",
+                "sample_rate": config.STREAM_SAMPLE_RATE,
+                "channels": 1
+            })
+
+            try:
+                async for pcm in tts_service.stream_speech(
+                    text=request.text,
+                    voice=request.voice,
+                    model=request.model,
+                    filename=filename
+                ):
+                    await websocket.send_bytes(pcm)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "message": format_synthesis_error(str(e))})
+                continue
+
+            await websocket.send_json({
+                "type": "done",
+                "audio_url": f"/audio/{filename}",
+                "filename": filename,
+                "voice_info": config.VOICES[request.voice],
+                "duration": (datetime.now() - start_time).total_seconds()
+            })
+
+    except WebSocketDisconnect:
+        pass
+
+def audio_file_path(filename: str) -> str:
+    """音频输出目录中的文件路径（不允许包含路径）"""
+    if not filename or filename.startswith(".") or os.path.basename(filename) != filename:
         raise HTTPException(status_code=404, detail="文件不存在")
-    
+    return audio_storage.path(filename)
+
+async def prepare_audio_file(
+    filename: str,
+    audio_format: Optional[str],
+    bitrate: Optional[int]
+) -> Tuple[str, str, str]:
+    """按请求的格式准备音频文件，需要时转码，返回 (文件路径, MIME 类型, 下载文件名)"""
+    file_path = audio_file_path(filename)
+    base, ext = os.path.splitext(filename)
+    source_format = ext.lstrip(".").lower()
+
+    if audio_format is None or audio_format == source_format:
+        media_type = AUDIO_FORMATS[source_format]["media_type"] if source_format in AUDIO_FORMATS else None
+        return file_path, media_type or "application/octet-stream", filename
+
+    if audio_format not in config.ALLOWED_AUDIO_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的音频格式: {audio_format}")
+    if source_format != "wav":
+        raise HTTPException(status_code=400, detail="只能从 WAV 文件转码")
+
+    bitrate = bitrate or config.TRANSCODE_DEFAULT_BITRATES[audio_format]
+    if not config.TRANSCODE_MIN_BITRATE <= bitrate <= config.TRANSCODE_MAX_BITRATE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"码率应在 {config.TRANSCODE_MIN_BITRATE}-{config.TRANSCODE_MAX_BITRATE} kbps 之间"
+        )
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    try:
+        variant_path = await transcoder.get_variant(file_path, audio_format, bitrate)
+    except TranscoderUnavailable:
+        raise HTTPException(status_code=503, detail="服务器未安装 ffmpeg，暂不支持转码")
+    except TranscodeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    format_info = AUDIO_FORMATS[audio_format]
+    return variant_path, format_info["media_type"], f"{base}.{format_info['ext']}"
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """判断条件请求是否可以返回 304（If-None-Match 优先于 If-Modified-Since）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def audio_file_response(
+    request: Request,
+    file_path: str,
+    media_type: str,
+    download_name: Optional[str] = None
+) -> Response:
+    """返回音频文件：内容哈希作为 ETag，支持条件请求（304）和 Range 请求（206）
+
+    文件生成后不再修改，允许浏览器和 CDN 长期缓存。
+    """
+    try:
+        metadata = await asyncio.get_running_loop().run_in_executor(None, audio_index.describe, file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    stat_result = metadata["stat"]
+    headers = {
+        "ETag": f'"{metadata["sha256"]}"',
+        "Cache-Control": config.AUDIO_CACHE_CONTROL
+    }
+    if is_not_modified(request, headers["ETag"], stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    # Range / If-Range 由 FileResponse 处理，If-Range 使用上面的 ETag 比较
     return FileResponse(
         path=file_path,
-        filename=filename,
-        media_type="audio/wav"
+        media_type=media_type,
+        filename=download_name,
+        headers=headers,
+        stat_result=stat_result
     )
 
+@app.api_route("/audio/{filename}", methods=["GET", "HEAD"])
+async def serve_audio_file(
+    request: Request,
+    filename: str,
+    audio_format: Optional[str] = Query(default=None, alias="format", description="输出格式: wav, mp3, opus"),
+    bitrate: Optional[int] = Query(default=None, description="转码码率（kbps）")
+):
+    """在线播放音频文件（可按需转码）"""
+    file_path, media_type, _ = await prepare_audio_file(filename, audio_format, bitrate)
+    return await audio_file_response(request, file_path, media_type)
+
+@app.api_route("/api/download/{filename}", methods=["GET", "HEAD"])
+async def download_audio_file(
+    request: Request,
+    filename: str,
+    audio_format: Optional[str] = Query(default=None, alias="format", description="输出格式: wav, mp3, opus"),
+    bitrate: Optional[int] = Query(default=None, description="转码码率（kbps）")
+):
+    """下载音频文件（可按需转码）"""
+    file_path, media_type, download_name = await prepare_audio_file(filename, audio_format, bitrate)
+    return await audio_file_response(request, file_path, media_type, download_name)
+
 @app.post("/api/batch/upload", response_model=BatchTaskResponse)
 async def upload_batch_file(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     voice: str = Form(default="Cherry"),
     model: str = Form(default=config.DEFAULT_MODEL),
     split_by: str = Form(default="paragraph"),
-    max_length: int = Form(default=500)
+    max_length: int = Form(default=500),
+    merge_output: bool = Form(default=False),
+    merge_silence_ms: int = Form(default=500, ge=0, le=10000),
+    chapter_markers: bool = Form(default=True)
 ):
     """批量文件上传和处理"""
     try:
@@ -383,36 +1959,64 @@ async def upload_batch_file(
         if voice not in config.VOICES:
             raise HTTPException(status_code=400, detail=f"不支持的音色: {voice}")
 
-        # 读取文件内容
-        content = await file.read()
+        # 验证模型
+        if model not in config.MODELS:
+            raise HTTPException(status_code=400, detail=f"不支持的模型: {model}")
+
+        # 验证分割方式
+        if split_by not in SPLIT_MODES:
+            raise HTTPException(status_code=400, detail=f"不支持的分割方式: {split_by}")
+
+        # 分块写入暂存文件，同时验证整个文件的编码（创建任务前即可拒绝无法解码的文件）；
+        # 分段和合成在后台流式进行
+        task_id = str(uuid.uuid4())
+        spool_path = upload_path(task_id)
+        detector = EncodingDetector()
+        size = 0
         try:
-            text_content = content.decode('utf-8')
+            async with aiofiles.open(spool_path, 'wb') as f:
+                while True:
+                    chunk = await file.read(config.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    detector.feed(chunk)
+                    size += len(chunk)
+                    await f.write(chunk)
+            encoding = detector.close()
         except UnicodeDecodeError:
-            try:
-                text_content = content.decode('gbk')
-            except UnicodeDecodeError:
-                raise HTTPException(status_code=400, detail="文件编码不支持，请使用UTF-8或GBK编码")
+            os.unlink(spool_path)
+            raise HTTPException(status_code=400, detail="文件编码不支持，请使用UTF-8或GBK编码")
 
-        # 解析文件内容
-        segments = file_parser.parse_text_file(text_content, split_by, max_length)
-
-        if not segments:
+        if size == 0:
+            os.unlink(spool_path)
             raise HTTPException(status_code=400, detail="文件内容为空或无法解析")
 
-        if len(segments) > 100:  # 限制最大段落数
-            raise HTTPException(status_code=400, detail="文件内容过多，请分割后再上传（最多100段）")
-
-        # 创建批量任务
-        task_id = batch_manager.create_task(segments, voice, model)
+        # 创建批量任务（分段由领取到该任务的工作进程陆续写入）
+        try:
+            await run_blocking(
+                batch_manager.create_task,
+                [], voice, model,
+                merge_output=merge_output,
+                merge_silence_ms=merge_silence_ms,
+                chapter_markers=chapter_markers,
+                split_by=split_by,
+                max_length=max_length,
+                ingest_done=False,
+                task_id=task_id,
+                encoding=encoding
+            )
+        except sqlite3.Error:
+            os.unlink(spool_path)
+            raise
 
-        # 启动后台处理
-        background_tasks.add_task(process_batch_task, task_id, segments, voice, model)
+        # 任务已写入共享队列，由任意工作进程领取；内置工作协程立即开始处理
+        if batch_worker:
+            batch_worker.notify()
 
         return BatchTaskResponse(
             success=True,
-            message="批量任务已创建，正在处理中",
-            task_id=task_id,
-            total_segments=len(segments)
+            message="批量任务已创建，正在分段并处理中",
+            task_id=task_id
         )
 
     except HTTPException:
@@ -429,9 +2033,57 @@ async def get_batch_status(task_id: str):
 
     return task
 
+@app.get("/api/batch/events/{task_id}")
+async def batch_progress_events(task_id: str):
+    """批量任务进度推送（Server-Sent Events）
+
+    连接后先推送一次 snapshot（完整任务状态），之后只推送增量事件：
+    segment（单个分段结果及最新计数）、status（状态变化，不含分段结果）、
+    resync（事件积压被丢弃，客户端应重新获取完整状态）。任务结束后关闭连接。
+    """
+    if not batch_manager.store.get_task(task_id):
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    def format_event(event: str, data: Any) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    finished_statuses = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value)
+
+    async def events():
+        # 先订阅再读取快照，避免遗漏两者之间发生的事件（重复的事件由客户端按序号去重）
+        queue = batch_manager.subscribe(task_id)
+        try:
+            task = batch_manager.get_task(task_id)
+            yield format_event("snapshot", jsonable_encoder(task))
+            if task.status.value in finished_statuses:
+                return
+
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), config.PROGRESS_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                yield format_event(event, data)
+                if event == "status" and data["status"] in finished_statuses:
+                    return
+        finally:
+            batch_manager.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/batch/download/{task_id}")
 async def download_batch_results(task_id: str):
-    """下载批量任务的所有音频文件（ZIP打包下载）"""
+    """下载批量任务的所有音频文件（流式 ZIP 打包下载）
+
+    音频以不压缩（stored）方式边读边写入压缩包，另附 manifest.json 记录每段的序号、文本和文件名，
+    不生成临时文件。
+    """
     task = batch_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
@@ -440,48 +2092,45 @@ async def download_batch_results(task_id: str):
         raise HTTPException(status_code=400, detail="任务尚未完成")
 
     # 获取成功的音频文件
-    success_results = [r for r in task.results if r['status'] == 'success']
-
-    if not success_results:
+    files = []
+    manifest = []
+    for segment in batch_manager.store.get_segments(task_id):
+        if segment["status"] != "success":
+            continue
+        file_path = audio_storage.path(segment["filename"])
+        if not os.path.exists(file_path):
+            continue
+        files.append((file_path, segment["filename"]))
+        manifest.append({
+            "index": segment["segment_index"],
+            "text": segment["text"],
+            "filename": segment["filename"]
+        })
+
+    if not files:
         raise HTTPException(status_code=404, detail="没有可下载的音频文件")
 
-    try:
-        # 创建临时ZIP文件
-        temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-        temp_zip.close()
-
-        with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for result in success_results:
-                file_path = os.path.join(config.AUDIO_OUTPUT_DIR, result['filename'])
-                if os.path.exists(file_path):
-                    # 添加文件到ZIP，使用原始文件名
-                    zip_file.write(file_path, result['filename'])
-
-        # 生成下载文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_filename = f"batch_audio_{task_id[:8]}_{timestamp}.zip"
-
-        # 返回ZIP文件
-        def cleanup_temp_file():
-            try:
-                os.unlink(temp_zip.name)
-            except:
-                pass
-
-        return FileResponse(
-            path=temp_zip.name,
-            filename=zip_filename,
-            media_type="application/zip",
-            background=BackgroundTasks([cleanup_temp_file])
-        )
-
-    except Exception as e:
-        # 清理临时文件
-        try:
-            os.unlink(temp_zip.name)
-        except:
-            pass
-        raise HTTPException(status_code=500, detail=f"创建ZIP文件失败: {str(e)}")
+    if task.merged_filename:
+        merged_path = audio_storage.path(task.merged_filename)
+        if os.path.exists(merged_path):
+            files.append((merged_path, task.merged_filename))
+
+    manifest_json = json.dumps({
+        "task_id": task_id,
+        "segments": manifest,
+        "merged_filename": task.merged_filename,
+        "chapters": task.chapters
+    }, ensure_ascii=False, indent=2).encode("utf-8")
+
+    # 生成下载文件名
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_filename = f"batch_audio_{task_id[:8]}_{timestamp}.zip"
+
+    return StreamingResponse(
+        iter_zip(files, extra=[("manifest.json", manifest_json)]),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{zip_filename}"'}
+    )
 
 @app.get("/api/health")
 async def health_check():
@@ -490,85 +2139,133 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "version": "1.0.0",
-        "api_key_configured": bool(config.DASHSCOPE_API_KEY)
+        "api_key_configured": bool(config.DASHSCOPE_API_KEY or config.DASHSCOPE_API_KEYS),
+        "api_keys": key_pool.snapshot(),
+        "cache": audio_cache.stats() if audio_cache else None,
+        "storage": audio_collector.stats(),
+        "concurrency": upstream_limiter.snapshot()
     }
 
-# 批量处理后台任务
-async def process_batch_task(task_id: str, segments: List[str], voice: str, model: str):
-    """处理批量任务"""
-    completed = 0
-    failed = 0
-
-    # 更新任务状态为处理中
-    batch_manager.update_task_progress(task_id, completed, failed)
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 格式的运行指标"""
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
-    # 创建信号量来控制并发数
-    semaphore = asyncio.Semaphore(batch_manager.max_concurrent_tasks)
-
-    async def process_single_segment(index: int, text: str):
-        """处理单个文本段"""
-        nonlocal completed, failed
+async def run_audio_gc():
+    """后台音频回收：启动时整理一次存储目录，之后定期回收（均在线程池中执行，不阻塞请求）"""
+    loop = asyncio.get_running_loop()
+    try:
+        # 未完成任务的合并进度文件（batch_{task_id}_merged.wav.part）需要保留
+        keep_prefixes = tuple(f"batch_{task_id}_" for task_id in batch_manager.store.get_unfinished_task_ids())
+        counts = await loop.run_in_executor(None, audio_storage.reconcile, audio_index, keep_prefixes)
+        if any(counts.values()):
+            print(f"音频存储整理完成: 迁移 {counts['migrated']} 个，登记 {counts['registered']} 个，"
+                  f"清理临时文件 {counts['temp_removed']} 个")
+    except Exception as e:
+        print(f"音频存储整理失败: {e}")
 
-        async with semaphore:
-            try:
-                # 调用TTS服务
-                result = await tts_service.synthesize_speech(
-                    text=text,
-                    voice=voice,
-                    model=model
-                )
+    while True:
+        try:
+            result = await loop.run_in_executor(None, audio_collector.collect)
+            if result["removed"]:
+                print(f"音频回收: 删除 {result['removed']} 个文件，释放 {result['freed_bytes'] / 1024 / 1024:.1f} MB")
+        except Exception as e:
+            print(f"音频回收失败: {e}")
+        await asyncio.sleep(config.AUDIO_GC_INTERVAL)
+
+async def monitor_event_loop_lag():
+    """定期测量事件循环延迟，阻塞事件循环的同步操作会使其明显升高"""
+    loop = asyncio.get_running_loop()
+    interval = config.EVENT_LOOP_LAG_INTERVAL
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - start - interval))
+
+def upload_path(task_id: str) -> str:
+    """批量任务上传文件的暂存路径"""
+    os.makedirs(config.UPLOAD_DIR, exist_ok=True)
+    return os.path.join(config.UPLOAD_DIR, f"{task_id}.txt")
+
+async def ingest_upload(
+    task_id: str,
+    split_by: str,
+    max_length: int,
+    worker: "BatchWorker",
+    encoding: Optional[str] = None
+):
+    """流式读取上传文件：按上传时验证的编码增量解码、分段，每读取一块就把产生的分段写入任务队列
+
+    分段写入后即可被工作进程领取，无需等待整个文件分段完成。恢复任务时重新分段，已记录的分段不会重复写入。
+    没有记录编码的任务（升级前创建）根据第一个数据块判断编码。
+    租约已被其他进程接管时不再标记分段完成，由接管者负责。
+    """
+    spool_path = upload_path(task_id)
+    lease_name = f"ingest:{task_id}"
+    segmenter = TextSegmenter(split_by, max_length)
+    decoder = None
+    index = 0
+    error = None
 
-                if result["success"]:
-                    # 生成文件名
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"batch_{task_id}_{index:03d}_{voice}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
-
-                    # 下载音频文件
-                    file_path = await tts_service.download_audio(result["audio_url"], filename)
-
-                    # 记录成功结果
-                    segment_result = {
-                        "index": index,
-                        "text": text[:100] + "..." if len(text) > 100 else text,
-                        "filename": filename,
-                        "audio_url": f"/audio/{filename}",
-                        "status": "success",
-                        "voice": voice
-                    }
-                    completed += 1
-                else:
-                    # 记录失败结果
-                    segment_result = {
-                        "index": index,
-                        "text": text[:100] + "..." if len(text) > 100 else text,
-                        "status": "failed",
-                        "error": result.get("error", "未知错误")
-                    }
-                    failed += 1
-
-                # 更新进度
-                batch_manager.update_task_progress(task_id, completed, failed, segment_result)
+    try:
+        async with aiofiles.open(spool_path, 'rb') as f:
+            while True:
+                chunk = await f.read(config.UPLOAD_CHUNK_SIZE)
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(encoding or detect_encoding(chunk))()
+
+                text = decoder.decode(chunk, final=not chunk)
+                segments = list(segmenter.feed(text))
+                if not chunk:
+                    segments.extend(segmenter.close())
+
+                if await run_blocking(batch_manager.store.add_segments, task_id, list(enumerate(segments, index))):
+                    worker.notify()
+                index += len(segments)
+
+                if not chunk:
+                    break
+
+        if index == 0:
+            error = "文件内容为空或无法解析"
+
+    except UnicodeDecodeError:
+        error = "文件编码不支持，请使用UTF-8或GBK编码"
+    except sqlite3.Error as e:
+        # 归还租约，由领取循环重新分段（已写入的分段不会重复写入）
+        print(f"批量任务 {task_id} 写入分段失败，归还租约稍后重试: {e}")
+        await run_blocking(batch_manager.store.release_lease, lease_name, worker.worker_id)
+        raise
+    except OSError as e:
+        error = f"文件读取失败: {e}"
 
-            except Exception as e:
-                failed += 1
-                segment_result = {
-                    "index": index,
-                    "text": text[:100] + "..." if len(text) > 100 else text,
-                    "status": "failed",
-                    "error": str(e)
-                }
-                batch_manager.update_task_progress(task_id, completed, failed, segment_result)
+    if not await run_blocking(batch_manager.store.holds_lease, lease_name, worker.worker_id):
+        print(f"批量任务 {task_id} 的分段已由其他进程接管")
+        return
 
-    # 创建所有任务
-    tasks = [
-        process_single_segment(i, segment)
-        for i, segment in enumerate(segments)
-    ]
+    if error:
+        print(f"批量任务 {task_id} 分段失败: {error}")
+    await run_blocking(batch_manager.store.finish_ingest, task_id, error)
+    await run_blocking(batch_manager.store.release_lease, lease_name, worker.worker_id)
+    try:
+        os.unlink(spool_path)
+    except OSError:
+        pass
 
-    # 并发执行所有任务
-    await asyncio.gather(*tasks, return_exceptions=True)
+    # 分段可能已在分段完成前全部处理完毕
+    await batch_manager.advance_merge(task_id, worker.worker_id)
+    await run_blocking(batch_manager.refresh_status, task_id)
 
-    print(f"批量任务 {task_id} 完成: 成功 {completed}, 失败 {failed}")
+async def run_batch_worker_process():
+    """独立工作进程（worker.py）的入口：运行工作协程直到被取消，退出时归还租约并关闭连接池"""
+    worker = BatchWorker(batch_manager, config.BATCH_WORKERS)
+    try:
+        # 领取循环意外退出时由 start() 自动重启，这里一直等待到被取消
+        worker.start()
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+        await tts_service.close()
 
 if __name__ == "__main__":
     import uvicorn
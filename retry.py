@@ -0,0 +1,57 @@
+"""
+Qwen-TTS 重试策略
+指数退避 + 随机抖动（full jitter），支持 Retry-After 和单次操作的总截止时间
+"""
+import time
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回需要等待的秒数"""
+    if not value:
+        return None
+
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """重试策略"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, deadline: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def start(self) -> float:
+        """开始一次操作，返回该操作的截止时间（monotonic）"""
+        return time.monotonic() + self.deadline
+
+    def next_delay(self, attempt: int, deadline: float, retry_after: Optional[float] = None) -> Optional[float]:
+        """计算第 attempt 次尝试失败后的等待时间，不应再重试时返回 None"""
+        if attempt >= self.max_attempts:
+            return None
+
+        backoff = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        if time.monotonic() + delay > deadline:
+            return None
+        return delay
@@ -0,0 +1,72 @@
+"""
+Qwen-TTS 并发请求合并
+相同键的并发调用共享一次执行（single-flight），执行在独立任务中进行，
+发起者断开连接不会中断其他仍在等待的调用者
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from concurrency import QueueTicket
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task, ticket: Optional[QueueTicket]):
+        self.task = task
+        self.ticket = ticket
+        self.waiters = 0
+
+
+class SingleFlight:
+    """并发请求合并
+
+    do() 对同一个键只执行一次 factory()，执行期间到达的调用者等待同一结果。
+    某个调用者被取消时只退出等待；所有调用者都已取消时才取消底层任务。
+    执行结束后立即移除该键，之后的调用会重新执行（结果的复用由缓存负责）。
+    发起者的 ticket 是这次执行排队用的凭据；更高优先级的调用者加入时随之提升，
+    避免交互请求合并到批量请求后仍按批量优先级排队。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.shared_calls = 0  # 合并到已有执行的调用次数
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        ticket: Optional[QueueTicket] = None
+    ) -> Tuple[Any, bool]:
+        """返回 (结果, 是否复用了其他调用者发起的执行)；执行抛出的异常会传给所有调用者
+
+        ticket 为调用者的排队凭据：发起执行时由 factory 使用，合并到已有执行时用它的优先级提升该执行的凭据。
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()), ticket)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.shared_calls += 1
+            if ticket is not None and call.ticket is not None:
+                call.ticket.promote(ticket.priority)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 没有调用者在等待，放弃执行；新到达的调用会重新发起
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -4,6 +4,7 @@ Qwen-TTS FastAPI 应用启动脚本
 """
 import os
 import sys
+import shutil
 import uvicorn
 from pathlib import Path
 
@@ -17,6 +18,7 @@ def check_dependencies():
         "uvicorn": "uvicorn",
         "dashscope": "dashscope",
         "requests": "requests",
+        "httpx": "httpx",
         "jinja2": "jinja2",
         "aiofiles": "aiofiles",
         "pydantic": "pydantic",
@@ -36,6 +38,10 @@ def check_dependencies():
         return False
 
     print("✅ 依赖包检查通过")
+
+    # ffmpeg 为可选依赖，仅用于 MP3 / Opus 转码
+    if not shutil.which(os.getenv("FFMPEG_PATH", "ffmpeg")):
+        print("⚠️  未找到 ffmpeg，MP3 / Opus 转码不可用（WAV 不受影响）")
     return True
 
 def check_environment():
@@ -53,7 +59,7 @@ def check_environment():
     from dotenv import load_dotenv
     load_dotenv()
 
-    api_key = os.getenv("DASHSCOPE_API_KEY")
+    api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("DASHSCOPE_API_KEYS")
     if not api_key:
         print("❌ DASHSCOPE_API_KEY 未配置")
         print("📝 请在 .env 文件中设置您的 API Key")
@@ -66,7 +72,7 @@ def create_directories():
     """创建必要的目录"""
     print("📁 创建必要目录...")
     
-    directories = ["audio_output", "static", "templates"]
+    directories = ["audio_output", "data", "static", "templates"]
     for directory in directories:
         Path(directory).mkdir(exist_ok=True)
     
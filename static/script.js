@@ -10,6 +10,7 @@ class QwenTTSApp {
         this.loadHistory();
         this.currentTaskId = null;
         this.progressInterval = null;
+        this.progressSource = null;
     }
 
     initializeElements() {
@@ -20,6 +21,7 @@ class QwenTTSApp {
         // 单个合成表单元素
         this.form = document.getElementById('ttsForm');
         this.textArea = document.getElementById('text');
+        this.streamPlayback = document.getElementById('streamPlayback');
         this.charCount = document.getElementById('charCount');
         this.synthesizeBtn = document.getElementById('synthesizeBtn');
         this.btnText = this.synthesizeBtn.querySelector('.btn-text');
@@ -125,14 +127,16 @@ class QwenTTSApp {
             return;
         }
 
-        if (data.text.length > 1000) {
-            this.showNotification('文本长度不能超过1000字符', 'error');
+        if (data.text.length > 10000) {
+            this.showNotification('文本长度不能超过10000字符', 'error');
             return;
         }
 
         try {
             this.setLoading(true);
-            const result = await this.synthesizeSpeech(data);
+            const result = this.streamPlayback && this.streamPlayback.checked
+                ? await this.synthesizeStreaming(data)
+                : await this.synthesizeSpeech(data);
             
             if (result.success) {
                 this.displayResult(result, data);
@@ -166,6 +170,81 @@ class QwenTTSApp {
         return await response.json();
     }
 
+    // 通过 WebSocket 流式合成，收到音频数据后立即播放
+    synthesizeStreaming(data) {
+        return new Promise((resolve, reject) => {
+            const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+            const socket = new WebSocket(`${protocol}://${window.location.host}/ws/synthesize`);
+            socket.binaryType = 'arraybuffer';
+
+            const AudioContextClass = window.AudioContext || window.webkitAudioContext;
+            const audioContext = new AudioContextClass();
+            let sampleRate = 24000;
+            let playhead = audioContext.currentTime;
+            let finished = false;
+
+            socket.onopen = () => socket.send(JSON.stringify(data));
+
+            socket.onmessage = (event) => {
+                if (typeof event.data !== 'string') {
+                    playhead = this.schedulePcmChunk(audioContext, event.data, sampleRate, playhead);
+                    return;
+                }
+
+                const message = JSON.parse(event.data);
+                if (message.type === 'start') {
+                    sampleRate = message.sample_rate;
+                    playhead = audioContext.currentTime;
+                } else if (message.type === 'done') {
+                    finished = true;
+                    socket.close();
+                    resolve({
+                        success: true,
+                        audio_url: message.audio_url,
+                        voice_info: message.voice_info,
+                        duration: message.duration
+                    });
+                } else if (message.type === 'error') {
+                    finished = true;
+                    socket.close();
+                    reject(new Error(message.message));
+                }
+            };
+
+            socket.onerror = () => {
+                if (!finished) {
+                    finished = true;
+                    reject(new Error('WebSocket 连接失败'));
+                }
+            };
+
+            socket.onclose = () => {
+                if (!finished) {
+                    finished = true;
+                    reject(new Error('连接已断开'));
+                }
+            };
+        });
+    }
+
+    // 将一段 16bit PCM 数据排入播放队列，返回下一段的开始时间
+    schedulePcmChunk(audioContext, arrayBuffer, sampleRate, playhead) {
+        const samples = new Int16Array(arrayBuffer);
+        const buffer = audioContext.createBuffer(1, samples.length, sampleRate);
+        const channel = buffer.getChannelData(0);
+        for (let i = 0; i < samples.length; i++) {
+            channel[i] = samples[i] / 32768;
+        }
+
+        const source = audioContext.createBufferSource();
+        source.buffer = buffer;
+        source.connect(audioContext.destination);
+
+        const startAt = Math.max(playhead, audioContext.currentTime);
+        source.start(startAt);
+        return startAt + buffer.duration;
+    }
+
     displayResult(result, requestData) {
         // 检查当前是否在批量处理模式
         const currentTab = document.querySelector('.tab-btn.active')?.dataset.tab;
@@ -434,6 +513,9 @@ class QwenTTSApp {
         e.preventDefault();
 
         const formData = new FormData(this.batchForm);
+        // 未勾选的复选框不会提交，显式传递布尔值
+        formData.set('merge_output', document.getElementById('mergeOutput').checked ? 'true' : 'false');
+        formData.set('chapter_markers', document.getElementById('chapterMarkers').checked ? 'true' : 'false');
 
         if (!this.fileInput.files[0]) {
             this.showNotification('请选择要上传的文件', 'error');
@@ -457,8 +539,8 @@ class QwenTTSApp {
 
             if (result.success) {
                 this.currentTaskId = result.task_id;
-                this.showBatchProgress(result.total_segments);
-                this.startProgressPolling();
+                this.showBatchProgress(result.total_segments || 0);
+                this.startProgressUpdates();
                 this.showNotification('文件上传成功，开始批量处理', 'success');
             } else {
                 throw new Error(result.message || '批量处理失败');
@@ -514,6 +596,81 @@ class QwenTTSApp {
     }
 
     // 开始进度轮询
+    // 订阅进度推送（SSE），不支持或连接失败时回退到轮询
+    startProgressUpdates() {
+        this.stopProgressUpdates();
+
+        if (!window.EventSource) {
+            this.startProgressPolling();
+            return;
+        }
+
+        const taskId = this.currentTaskId;
+        const source = new EventSource(`/api/batch/events/${taskId}`);
+        this.progressSource = source;
+        let task = null;
+        let results = new Map();
+
+        const finish = () => {
+            this.stopProgressUpdates();
+            task.results = Array.from(results.values()).sort((a, b) => a.index - b.index);
+            this.showBatchResults(task);
+        };
+
+        source.addEventListener('snapshot', (event) => {
+            task = JSON.parse(event.data);
+            results = new Map(task.results.map(result => [result.index, result]));
+            this.updateProgress(task);
+            if (task.status === 'completed' || task.status === 'failed') {
+                finish();
+            }
+        });
+
+        source.addEventListener('segment', (event) => {
+            const data = JSON.parse(event.data);
+            results.set(data.result.index, data.result);
+            Object.assign(task, {
+                total_segments: data.total_segments,
+                completed_segments: data.completed_segments,
+                failed_segments: data.failed_segments,
+                progress_percentage: data.progress_percentage
+            });
+            this.updateProgress(task);
+        });
+
+        source.addEventListener('status', (event) => {
+            Object.assign(task, JSON.parse(event.data));
+            this.updateProgress(task);
+            if (task.status === 'completed' || task.status === 'failed') {
+                finish();
+            }
+        });
+
+        source.addEventListener('resync', () => {
+            // 事件有丢失，重新连接以获取完整快照
+            this.startProgressUpdates();
+        });
+
+        source.onerror = () => {
+            // 浏览器会自动重连；连接被彻底关闭时回退到轮询
+            if (source.readyState === EventSource.CLOSED && this.progressSource === source) {
+                this.stopProgressUpdates();
+                this.startProgressPolling();
+            }
+        };
+    }
+
+    stopProgressUpdates() {
+        if (this.progressSource) {
+            this.progressSource.close();
+            this.progressSource = null;
+        }
+        if (this.progressInterval) {
+            clearInterval(this.progressInterval);
+            this.progressInterval = null;
+        }
+    }
+
     startProgressPolling() {
         if (this.progressInterval) {
             clearInterval(this.progressInterval);
@@ -539,13 +696,15 @@ class QwenTTSApp {
 
     // 更新进度显示
     updateProgress(task) {
+        // 大文件边分段边处理，总段数会逐渐增加
+        this.totalSegments.textContent = task.total_segments;
         this.completedSegments.textContent = task.completed_segments;
         this.failedSegments.textContent = task.failed_segments;
         this.progressFill.style.width = `${task.progress_percentage}%`;
         this.progressPercentage.textContent = `${Math.round(task.progress_percentage)}%`;
 
         if (task.status === 'processing') {
-            this.progressText.textContent = '正在处理...';
+            this.progressText.textContent = task.ingest_done === false ? '正在分段并处理...' : '正在处理...';
         } else if (task.status === 'completed') {
             this.progressText.textContent = '处理完成';
         } else if (task.status === 'failed') {
@@ -590,7 +749,7 @@ class QwenTTSApp {
             </div>
         `).join('');
 
-        this.batchResultsList.innerHTML = resultsHtml;
+        this.batchResultsList.innerHTML = this.renderMergedResult(task) + resultsHtml;
 
         // 平滑滚动到结果区域
         setTimeout(() => {
@@ -604,12 +763,56 @@ class QwenTTSApp {
         // 显示完成通知
         const successCount = task.completed_segments;
         const failedCount = task.failed_segments;
+        if (task.error) {
+            this.showNotification(`批量处理出错: ${task.error}`, 'error');
+            return;
+        }
+        const savedText = task.upstream_calls_saved ? `，复用已有音频 ${task.upstream_calls_saved} 段` : '';
         this.showNotification(
-            `批量处理完成！成功: ${successCount}, 失败: ${failedCount}`,
+            `批量处理完成！成功: ${successCount}, 失败: ${failedCount}${savedText}`,
             failedCount === 0 ? 'success' : 'warning'
         );
     }
 
+    // 合并音频及章节列表
+    renderMergedResult(task) {
+        if (!task.merged_audio_url) {
+            return '';
+        }
+
+        const chaptersHtml = task.chapters.map(chapter => `
+            <div class="chapter-item">
+                <span class="chapter-time">${this.formatTime(chapter.start)}</span>
+                <span class="chapter-title">${chapter.title}</span>
+            </div>
+        `).join('');
+
+        return `
+            <div class="batch-result-item success merged">
+                <div class="result-header">
+                    <div class="result-text">合并音频（${task.chapters.length} 段）</div>
+                </div>
+                <div class="result-actions">
+                    <button class="history-play-btn" onclick="app.playAudio('${task.merged_audio_url}')">
+                        <i class="fas fa-play"></i>
+                        播放
+                    </button>
+                    <a href="/api/download/${task.merged_filename}" class="download-btn btn-small" download>
+                        <i class="fas fa-download"></i>
+                        下载
+                    </a>
+                </div>
+                <div class="chapter-list">${chaptersHtml}</div>
+            </div>
+        `;
+    }
+
+    formatTime(seconds) {
+        const minutes = Math.floor(seconds / 60);
+        const secs = Math.floor(seconds % 60);
+        return `${minutes}:${secs.toString().padStart(2, '0')}`;
+    }
+
     // 播放音频
     playAudio(audioUrl) {
         const audio = new Audio(audioUrl);
@@ -0,0 +1,484 @@
+"""
+Qwen-TTS 批量任务持久化存储
+基于 SQLite（WAL 模式）记录任务、分段及每段的处理结果，服务重启后可继续未完成的任务；
+分段表同时作为多进程共享的任务队列，工作进程通过租约领取分段，进程崩溃后租约过期即可被重新领取
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    model TEXT NOT NULL,
+    total_segments INTEGER NOT NULL,
+    completed_segments INTEGER NOT NULL DEFAULT 0,
+    failed_segments INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    cache_misses INTEGER NOT NULL DEFAULT 0,
+    dedup_hits INTEGER NOT NULL DEFAULT 0,
+    merge_output INTEGER NOT NULL DEFAULT 0,
+    merge_silence_ms INTEGER NOT NULL DEFAULT 0,
+    merge_chapter_markers INTEGER NOT NULL DEFAULT 1,
+    merged_next_index INTEGER NOT NULL DEFAULT 0,
+    merged_frames INTEGER NOT NULL DEFAULT 0,
+    merged_params TEXT,
+    merged_chapters TEXT,
+    merged_filename TEXT,
+    ingest_done INTEGER NOT NULL DEFAULT 1,
+    split_by TEXT,
+    max_length INTEGER,
+    error TEXT,
+    event_seq INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS segments (
+    task_id TEXT NOT NULL,
+    segment_index INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    filename TEXT,
+    result TEXT,
+    cache_key TEXT,
+    lease_owner TEXT,
+    lease_expires REAL,
+    claims INTEGER NOT NULL DEFAULT 0,
+    event_seq INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    PRIMARY KEY (task_id, segment_index)
+);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+CREATE INDEX IF NOT EXISTS idx_segments_status ON segments (task_id, status);
+CREATE INDEX IF NOT EXISTS idx_segments_queue ON segments (status, segment_index);
+"""
+
+# 旧版本数据库缺少的列（表名, 列名, 列定义）
+_MIGRATIONS = [
+    ("tasks", "merge_output", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "merge_silence_ms", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "merge_chapter_markers", "INTEGER NOT NULL DEFAULT 1"),
+    ("tasks", "merged_next_index", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "merged_frames", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "merged_params", "TEXT"),
+    ("tasks", "merged_chapters", "TEXT"),
+    ("tasks", "merged_filename", "TEXT"),
+    ("tasks", "ingest_done", "INTEGER NOT NULL DEFAULT 1"),
+    ("tasks", "split_by", "TEXT"),
+    ("tasks", "max_length", "INTEGER"),
+    ("tasks", "error", "TEXT"),
+    ("tasks", "dedup_hits", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "event_seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("segments", "cache_key", "TEXT"),
+    ("segments", "lease_owner", "TEXT"),
+    ("segments", "lease_expires", "REAL"),
+    ("segments", "claims", "INTEGER NOT NULL DEFAULT 0"),
+    ("segments", "event_seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("tasks", "encoding", "TEXT"),
+    ("segments", "chapter_title", "TEXT"),
+    ("segments", "chapter_start", "REAL"),
+    ("segments", "chapter_end", "REAL"),
+]
+
+# 依赖新增列的索引，在补齐列之后创建
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_segments_cache_key ON segments (task_id, cache_key);
+CREATE INDEX IF NOT EXISTS idx_segments_lease_owner ON segments (lease_owner) WHERE lease_owner IS NOT NULL;
+"""
+
+# 尚未结束的任务状态
+UNFINISHED_STATUSES = ("pending", "processing")
+
+# 根据分段计数和合并进度计算任务状态：分段仍在产生、尚有分段未完成或需要合并音频而合并尚未完成时为 processing，
+# 否则全部成功为 completed，有失败分段或分段过程出错为 failed
+_REFRESH_STATUS = (
+    "UPDATE tasks SET status = CASE "
+    "WHEN ingest_done = 1 AND completed_segments + failed_segments >= total_segments "
+    "AND NOT (merge_output = 1 AND merged_filename IS NULL) THEN "
+    "CASE WHEN failed_segments = 0 AND error IS NULL THEN 'completed' ELSE 'failed' END "
+    "ELSE 'processing' END, updated_at = ? WHERE task_id = ?"
+)
+
+
+class TaskStore:
+    """批量任务存储"""
+
+    def __init__(self, db_path: str, busy_timeout: float = 30.0):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # 其他进程持有写锁时最多等待 busy_timeout 秒（调用方应在线程池中执行写操作）
+        self._conn = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """为旧版本数据库补齐新增的列"""
+        with self._conn:
+            for table, column, definition in _MIGRATIONS:
+                columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self._conn.executescript(_INDEXES)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def create_task(
+        self,
+        task_id: str,
+        segments: List[str],
+        voice: str,
+        model: str,
+        status: str,
+        merge_output: bool = False,
+        merge_silence_ms: int = 0,
+        merge_chapter_markers: bool = True,
+        ingest_done: bool = True,
+        split_by: Optional[str] = None,
+        max_length: Optional[int] = None,
+        encoding: Optional[str] = None
+    ):
+        """创建任务并写入分段
+
+        ingest_done 为 False 时表示分段仍在陆续产生（encoding 为上传文件的编码），
+        之后通过 add_segments 追加，全部产生后调用 finish_ingest。
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO tasks (task_id, status, voice, model, total_segments, merge_output, "
+                "merge_silence_ms, merge_chapter_markers, ingest_done, split_by, max_length, encoding, "
+                "created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (task_id, status, voice, model, len(segments), int(merge_output), merge_silence_ms,
+                 int(merge_chapter_markers), int(ingest_done), split_by, max_length, encoding, now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO segments (task_id, segment_index, text) VALUES (?, ?, ?)",
+                ((task_id, index, text) for index, text in enumerate(segments))
+            )
+
+    def add_segments(self, task_id: str, segments: List[Tuple[int, str]]) -> int:
+        """追加分段并更新分段总数；已存在的分段（恢复任务时重新分段）被忽略，返回新增的分段数"""
+        if not segments:
+            return 0
+        with self._lock, self._conn:
+            added = 0
+            for index, text in segments:
+                added += self._conn.execute(
+                    "INSERT OR IGNORE INTO segments (task_id, segment_index, text) VALUES (?, ?, ?)",
+                    (task_id, index, text)
+                ).rowcount
+            if added:
+                self._conn.execute(
+                    "UPDATE tasks SET total_segments = total_segments + ?, updated_at = ? WHERE task_id = ?",
+                    (added, datetime.now().isoformat(), task_id)
+                )
+        return added
+
+    def finish_ingest(self, task_id: str, error: Optional[str] = None):
+        """标记分段已全部产生（error 不为空表示分段过程出错）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET ingest_done = 1, error = ?, updated_at = ? WHERE task_id = ?",
+                (error, datetime.now().isoformat(), task_id)
+            )
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务记录"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_results(self, task_id: str) -> List[Dict[str, Any]]:
+        """获取已处理分段的结果（按分段顺序）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM segments WHERE task_id = ? AND status != 'pending' ORDER BY segment_index",
+                (task_id,)
+            ).fetchall()
+        return [json.loads(row["result"]) for row in rows]
+
+    def get_segment(self, task_id: str, index: int) -> Optional[Dict[str, Any]]:
+        """获取单个分段（含完整文本）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT segment_index, text, status, filename FROM segments "
+                "WHERE task_id = ? AND segment_index = ?",
+                (task_id, index)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_segments(self, task_id: str) -> List[Dict[str, Any]]:
+        """获取任务的全部分段（按分段顺序）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT segment_index, text, status, filename FROM segments WHERE task_id = ? "
+                "ORDER BY segment_index",
+                (task_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_unfinished_task_ids(self) -> List[str]:
+        """获取尚未结束的任务"""
+        placeholders = ", ".join("?" for _ in UNFINISHED_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT task_id FROM tasks WHERE status IN ({placeholders}) ORDER BY created_at",
+                UNFINISHED_STATUSES
+            ).fetchall()
+        return [row["task_id"] for row in rows]
+
+    def get_segment_events(self, task_id: str, after_seq: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """获取序号大于 after_seq 的分段结果（按完成顺序），用于推送进度事件"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT event_seq, result FROM segments WHERE task_id = ? AND event_seq > ? ORDER BY event_seq",
+                (task_id, after_seq)
+            ).fetchall()
+        return [(row["event_seq"], json.loads(row["result"])) for row in rows]
+
+    def count_pending_segments(self) -> int:
+        """所有任务中尚未完成的分段数"""
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) AS count FROM segments WHERE status = 'pending'").fetchone()
+        return row["count"]
+
+    def find_produced(self, task_id: str, cache_key: str) -> Optional[str]:
+        """本任务中已成功合成的相同内容（缓存键相同）的分段文件名"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename FROM segments WHERE task_id = ? AND cache_key = ? AND status = 'success' LIMIT 1",
+                (task_id, cache_key)
+            ).fetchone()
+        return row["filename"] if row else None
+
+    def claim_segments(self, owner: str, lease: float, limit: int) -> List[Dict[str, Any]]:
+        """领取最多 limit 个待处理的分段，租约 lease 秒内有效
+
+        按分段序号、任务创建时间排序，多个任务同时处理时轮流领取各任务的分段。
+        使用 BEGIN IMMEDIATE，多个进程同时领取时不会拿到同一个分段。
+        """
+        now = time.time()
+        placeholders = ", ".join("?" for _ in UNFINISHED_STATUSES)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT s.task_id, s.segment_index, s.text, s.claims FROM segments s "
+                "JOIN tasks t ON t.task_id = s.task_id "
+                "WHERE s.status = 'pending' AND (s.lease_expires IS NULL OR s.lease_expires < ?) "
+                f"AND t.status IN ({placeholders}) "
+                "ORDER BY s.segment_index, t.created_at LIMIT ?",
+                (now, *UNFINISHED_STATUSES, limit)
+            ).fetchall()
+            for row in rows:
+                self._conn.execute(
+                    "UPDATE segments SET lease_owner = ?, lease_expires = ?, claims = claims + 1 "
+                    "WHERE task_id = ? AND segment_index = ?",
+                    (owner, now + lease, row["task_id"], row["segment_index"])
+                )
+            for task_id in {row["task_id"] for row in rows}:
+                self._conn.execute(
+                    "UPDATE tasks SET status = 'processing', updated_at = ? WHERE task_id = ? AND status = 'pending'",
+                    (datetime.now().isoformat(), task_id)
+                )
+        return [{**dict(row), "claims": row["claims"] + 1} for row in rows]
+
+    def complete_segment(
+        self,
+        task_id: str,
+        owner: str,
+        result: Dict[str, Any],
+        cache_key: Optional[str] = None
+    ) -> Optional[str]:
+        """记录分段结果，并在同一事务中更新任务计数和状态，返回任务的最新状态；
+        租约已被其他进程接管时不记录并返回 None"""
+        now = datetime.now().isoformat()
+        success = result["status"] == "success"
+        cache_hit = result.get("cache_hit")
+        deduplicated = bool(result.get("deduplicated"))
+
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            cursor = self._conn.execute(
+                "UPDATE segments SET status = ?, filename = ?, result = ?, cache_key = ?, "
+                "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE task_id = ? AND segment_index = ? AND status = 'pending' AND lease_owner = ?",
+                (result["status"], result.get("filename"), json.dumps(result, ensure_ascii=False),
+                 cache_key if success else None, now, task_id, result["index"], owner)
+            )
+            if cursor.rowcount == 0:
+                return None
+
+            self._conn.execute(
+                "UPDATE tasks SET completed_segments = completed_segments + ?, failed_segments = failed_segments + ?, "
+                "cache_hits = cache_hits + ?, cache_misses = cache_misses + ?, dedup_hits = dedup_hits + ?, "
+                "event_seq = event_seq + 1, updated_at = ? WHERE task_id = ?",
+                (int(success), int(not success), int(cache_hit is True),
+                 int(cache_hit is False and not deduplicated), int(deduplicated), now, task_id)
+            )
+            self._conn.execute(
+                "UPDATE segments SET event_seq = (SELECT event_seq FROM tasks WHERE task_id = ?) "
+                "WHERE task_id = ? AND segment_index = ?",
+                (task_id, task_id, result["index"])
+            )
+            self._conn.execute(_REFRESH_STATUS, (now, task_id))
+            row = self._conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row["status"]
+
+    def refresh_status(self, task_id: str) -> Optional[str]:
+        """根据分段计数和合并进度更新任务状态并返回（单条语句，多个进程同时更新也不会写入过期的状态）"""
+        with self._lock, self._conn:
+            self._conn.execute(_REFRESH_STATUS, (datetime.now().isoformat(), task_id))
+            row = self._conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row["status"] if row else None
+
+    def get_settled_task_ids(self) -> List[str]:
+        """分段已全部处理但状态尚未结束的任务（如合并音频的进程崩溃），需要重新推进合并和状态"""
+        placeholders = ", ".join("?" for _ in UNFINISHED_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT task_id FROM tasks WHERE status IN ({placeholders}) AND ingest_done = 1 "
+                "AND completed_segments + failed_segments >= total_segments",
+                UNFINISHED_STATUSES
+            ).fetchall()
+        return [row["task_id"] for row in rows]
+
+    def claim_ingest(self, owner: str, lease: float) -> Optional[Dict[str, Any]]:
+        """领取一个分段尚未全部产生（ingest_done 为 0）且没有被其他进程处理的任务"""
+        now = time.time()
+        placeholders = ", ".join("?" for _ in UNFINISHED_STATUSES)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT t.task_id, t.split_by, t.max_length, t.encoding FROM tasks t "
+                "LEFT JOIN leases l ON l.name = 'ingest:' || t.task_id "
+                f"WHERE t.ingest_done = 0 AND t.status IN ({placeholders}) AND (l.expires IS NULL OR l.expires < ?) "
+                "ORDER BY t.created_at LIMIT 1",
+                (*UNFINISHED_STATUSES, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._acquire_lease(f"ingest:{row['task_id']}", owner, now, lease)
+        return dict(row)
+
+    def _acquire_lease(self, name: str, owner: str, now: float, lease: float) -> bool:
+        cursor = self._conn.execute(
+            "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE leases.expires < ? OR leases.owner = excluded.owner",
+            (name, owner, now + lease, now)
+        )
+        return cursor.rowcount > 0
+
+    def acquire_lease(self, name: str, owner: str, lease: float) -> bool:
+        """获取具名租约（如某个任务的合并操作）；已被其他进程持有且未过期时返回 False"""
+        with self._lock, self._conn:
+            return self._acquire_lease(name, owner, time.time(), lease)
+
+    def release_lease(self, name: str, owner: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def holds_lease(self, name: str, owner: str) -> bool:
+        """租约是否仍由 owner 持有且未过期"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM leases WHERE name = ? AND owner = ? AND expires >= ?", (name, owner, time.time())
+            ).fetchone()
+        return row is not None
+
+    def renew_leases(self, owner: str, lease: float):
+        """延长 owner 持有的全部租约（分段和具名租约）"""
+        expires = time.time() + lease
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE segments SET lease_expires = ? WHERE lease_owner = ? AND status = 'pending'",
+                (expires, owner)
+            )
+            self._conn.execute("UPDATE leases SET expires = ? WHERE owner = ?", (expires, owner))
+
+    def release_segment(self, task_id: str, index: int, owner: str):
+        """归还未处理完的分段（进程正常退出时），不计入领取次数，其他进程可立即领取"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE segments SET lease_owner = NULL, lease_expires = NULL, claims = MAX(claims - 1, 0) "
+                "WHERE task_id = ? AND segment_index = ? AND status = 'pending' AND lease_owner = ?",
+                (task_id, index, owner)
+            )
+
+    def release_leases(self, owner: str):
+        """归还 owner 持有的全部租约"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE segments SET lease_owner = NULL, lease_expires = NULL, claims = MAX(claims - 1, 0) "
+                "WHERE lease_owner = ? AND status = 'pending'",
+                (owner,)
+            )
+            self._conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+
+    def update_merge_progress(
+        self,
+        task_id: str,
+        next_index: int,
+        frames: int,
+        params: Optional[Tuple[int, int, int]],
+        chapters: List[Dict[str, Any]],
+        merged_filename: Optional[str] = None
+    ):
+        """记录合并音频的进度（下一个待合并的分段、已写入的帧数），chapters 为上次记录之后新增的章节
+
+        章节记录在各自的分段上，每次只写入新增部分。
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tasks SET merged_next_index = ?, merged_frames = ?, merged_params = ?, "
+                "merged_filename = ?, updated_at = ? WHERE task_id = ?",
+                (next_index, frames, json.dumps(params) if params else None, merged_filename,
+                 datetime.now().isoformat(), task_id)
+            )
+            self._conn.executemany(
+                "UPDATE segments SET chapter_title = ?, chapter_start = ?, chapter_end = ? "
+                "WHERE task_id = ? AND segment_index = ?",
+                ((chapter["title"], chapter["start"], chapter["end"], task_id, chapter["index"]) for chapter in chapters)
+            )
+
+    def get_chapters(self, task_id: str) -> List[Dict[str, Any]]:
+        """合并音频的章节（按分段顺序）；兼容旧版本记录在任务上的章节列表"""
+        with self._lock:
+            legacy = self._conn.execute("SELECT merged_chapters FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            rows = self._conn.execute(
+                "SELECT segment_index, chapter_title, chapter_start, chapter_end FROM segments "
+                "WHERE task_id = ? AND chapter_start IS NOT NULL ORDER BY segment_index",
+                (task_id,)
+            ).fetchall()
+        chapters = json.loads(legacy["merged_chapters"]) if legacy and legacy["merged_chapters"] else []
+        recorded = {chapter["index"] for chapter in chapters}
+        chapters.extend(
+            {"index": row["segment_index"], "title": row["chapter_title"], "start": row["chapter_start"],
+             "end": row["chapter_end"]}
+            for row in rows if row["segment_index"] not in recorded
+        )
+        return chapters
@@ -0,0 +1,222 @@
+"""
+Qwen-TTS 文本分段
+流式、线性时间的分段器：按段落/章节/句子划分，过长的文本按标点层级（换行、句末、分句、逗号、空白）
+在 max_length 以内切分，保留原文标点，同时适用于中文和拉丁文字
+"""
+import re
+import codecs
+from typing import Iterable, Iterator, List
+
+SPLIT_MODES = ("paragraph", "sentence", "chapter")
+
+# 上传文件支持的编码（按顺序尝试），utf-8-sig 会去掉 BOM
+SUPPORTED_ENCODINGS = ("utf-8-sig", "gbk")
+
+# 切分点字符（切分位置在字符之后，标点保留在前一段末尾）
+_SENTENCE_MARKS = "。！？!?…"
+_SENTENCE_DOTS = (". ", ".\n", ".\t", ".\u3000")  # 英文句点需后接空白，避免切开小数和缩写
+_CLAUSE_MARKS = "；;：:"
+_COMMA_MARKS = "，,、"
+_SPACES = (" ", "\t", "\u3000")
+# 句末标点之后仍属于同一句的字符（连续标点、后引号和右括号）
+_SENTENCE_TRAILERS = frozenset(_SENTENCE_MARKS + ".”’」』）)]\"'")
+
+# 各分割方式下块之间的分隔符
+_SEPARATORS = {
+    "paragraph": re.compile(r"\n[^\S\n]*\n\s*"),  # 空行
+    "chapter": re.compile(r"\n#{1,6}[^\S\n]+"),    # Markdown 标题（去掉 # 标记，保留标题文字）
+    "sentence": None                                # 句子模式不分块，整体按句子装填
+}
+
+# 块未结束时，末尾保留的字符数，避免在数据块边界处误切（如跨块的引号、省略号）
+_LOOKAHEAD = 16
+# 分隔符可能跨越数据块边界，重新查找时向前回退的字符数
+_SEPARATOR_LOOKBEHIND = 8
+
+
+class TextSegmenter:
+    """流式文本分段器
+
+    通过 feed() 逐块输入文本并产出已确定的分段，输入结束后调用 close() 产出剩余分段。
+    每个字符只会被扫描常数次，内存占用与输入总长度无关。
+    """
+
+    def __init__(self, split_by: str = "paragraph", max_length: int = 500):
+        if split_by not in SPLIT_MODES:
+            raise ValueError(f"不支持的分割方式: {split_by}")
+
+        self.split_by = split_by
+        self.max_length = max(1, max_length)
+        self._separator = _SEPARATORS[split_by]
+        # 章节模式下，文件开头的标题前没有换行
+        self._buffer = "\n" if split_by == "chapter" else ""
+        self._scan_from = 0
+
+    def feed(self, text: str) -> Iterator[str]:
+        """输入一段文本，产出已经可以确定的分段"""
+        self._buffer += text
+        yield from self._drain(final=False)
+
+    def close(self) -> Iterator[str]:
+        """输入结束，产出剩余的分段"""
+        yield from self._drain(final=True)
+
+    def _drain(self, final: bool) -> Iterator[str]:
+        buffer = self._buffer
+        start = 0
+
+        while True:
+            separator = self._separator.search(buffer, self._scan_from) if self._separator else None
+            if separator:
+                yield from self._split_block(buffer, start, separator.start())
+                start = self._scan_from = separator.end()
+                continue
+
+            if final:
+                yield from self._split_block(buffer, start, len(buffer))
+                start = len(buffer)
+                break
+
+            # 当前块尚未结束：只切出不会受后续输入影响的部分
+            while True:
+                next_start = self._skip_whitespace(buffer, start, len(buffer))
+                if len(buffer) - next_start <= self.max_length + _LOOKAHEAD:
+                    break
+                cut = self._find_cut(buffer, next_start, next_start + self.max_length)
+                yield from self._emit(buffer, next_start, cut)
+                start = cut
+            break
+
+        self._buffer = buffer[start:]
+
+        # 下次从末尾的空白（以及分隔符可能的前缀）处继续查找分隔符
+        scan_from = len(self._buffer)
+        while scan_from > 0 and self._buffer[scan_from - 1].isspace():
+            scan_from -= 1
+        self._scan_from = max(0, min(scan_from, len(self._buffer) - _SEPARATOR_LOOKBEHIND))
+
+    def _split_block(self, text: str, start: int, end: int) -> Iterator[str]:
+        """将 [start, end) 切分为不超过 max_length 的分段"""
+        start = self._skip_whitespace(text, start, end)
+        while end - start > self.max_length:
+            cut = self._find_cut(text, start, start + self.max_length)
+            yield from self._emit(text, start, cut)
+            start = self._skip_whitespace(text, cut, end)
+        yield from self._emit(text, start, end)
+
+    def cut_point(self, text: str) -> int:
+        """text 开头不超过 max_length 的部分中最合适的切分位置（规则同分段，text 不超过 max_length 时返回其长度）"""
+        if len(text) <= self.max_length:
+            return len(text)
+        return self._find_cut(text, 0, self.max_length)
+
+    def _find_cut(self, text: str, start: int, end: int) -> int:
+        """在 (start, end] 内选择切分位置
+
+        - 优先在最后一个换行或句末标点处切分，保证句子完整
+        - 否则依次尝试分句标点、逗号、空白，切分点需超过窗口的三分之一，避免产生过短的分段
+        - 都不满足时取最靠后的切分点，没有任何切分点时在 max_length 处硬切
+
+        各级切分点均通过 str.rfind 从窗口末尾反向查找，每个窗口的开销为 O(max_length)。
+        """
+        sentence = max(text.rfind(mark, start, end) for mark in _SENTENCE_MARKS + "\n")
+        sentence = max(sentence, max(text.rfind(dot, start, end) for dot in _SENTENCE_DOTS))
+        if sentence >= start:
+            cut = sentence + 1
+            while cut < end and text[cut] in _SENTENCE_TRAILERS:
+                cut += 1
+            return cut
+
+        candidates = [
+            max(text.rfind(mark, start, end) for mark in marks) + 1
+            for marks in (_CLAUSE_MARKS, _COMMA_MARKS, _SPACES)
+        ]
+        min_cut = start + max(1, self.max_length // 3)
+        for cut in candidates:
+            if cut >= min_cut:
+                return cut
+
+        best = max(candidates)
+        return best if best > start else end
+
+    @staticmethod
+    def _skip_whitespace(text: str, start: int, end: int) -> int:
+        while start < end and text[start].isspace():
+            start += 1
+        return start
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int) -> Iterator[str]:
+        segment = text[start:end].strip()
+        if segment:
+            yield segment
+
+
+def iter_segments(chunks: Iterable[str], split_by: str = "paragraph", max_length: int = 500) -> Iterator[str]:
+    """对逐块输入的文本进行分段"""
+    segmenter = TextSegmenter(split_by, max_length)
+    for chunk in chunks:
+        yield from segmenter.feed(chunk)
+    yield from segmenter.close()
+
+
+def split_text(text: str, split_by: str = "paragraph", max_length: int = 500) -> List[str]:
+    """对完整文本进行分段"""
+    return list(iter_segments([text], split_by, max_length))
+
+
+def detect_encoding(sample: bytes) -> str:
+    """根据文件开头的数据块判断编码，均无法解码时抛出 UnicodeDecodeError
+
+    使用增量解码器，数据块末尾被截断的多字节字符不会被误判为解码错误。
+    """
+    error = None
+    for encoding in SUPPORTED_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError as e:
+            error = e
+    raise error
+
+
+class EncodingDetector:
+    """逐块验证整个文件的编码
+
+    每种支持的编码各用一个增量解码器解码全部数据，出错的编码被排除，
+    避免文件开头恰好能按 UTF-8 解码（如纯 ASCII）而后文是 GBK 时误判。
+    """
+
+    def __init__(self):
+        self._decoders = {encoding: codecs.getincrementaldecoder(encoding)() for encoding in SUPPORTED_ENCODINGS}
+        self._error = None
+
+    def feed(self, chunk: bytes, final: bool = False):
+        """输入一块数据；所有编码均无法解码时抛出 UnicodeDecodeError"""
+        for encoding, decoder in list(self._decoders.items()):
+            try:
+                decoder.decode(chunk, final=final)
+            except UnicodeDecodeError as e:
+                self._error = e
+                del self._decoders[encoding]
+        if not self._decoders:
+            raise self._error
+
+    def close(self) -> str:
+        """输入结束，返回能解码完整数据的第一个编码（按 SUPPORTED_ENCODINGS 的顺序）"""
+        self.feed(b"", final=True)
+        return next(iter(self._decoders))
+
+
+def split_for_synthesis(text: str, max_length: int, first_length: int) -> List[str]:
+    """按句子边界切分长文本用于并行合成
+
+    第一段不超过 first_length（较短，尽快得到开头的音频），其余分段不超过 max_length。
+    """
+    text = text.strip()
+    if len(text) <= first_length:
+        return [text] if text else []
+
+    cut = TextSegmenter("sentence", first_length).cut_point(text)
+    first = text[:cut].strip()
+    return ([first] if first else []) + split_text(text[cut:], "sentence", max_length)
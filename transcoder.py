@@ -0,0 +1,95 @@
+"""
+Qwen-TTS 音频转码
+按需将 WAV 转码为 MP3 / Opus，转码结果作为变体保存在源文件旁边，之后直接复用；
+编码在独立的 ffmpeg 进程中进行（并发数受限），不阻塞事件循环，同一变体的并发请求共享一次转码
+"""
+import os
+import asyncio
+from typing import Dict, Optional
+
+# 支持的输出格式：扩展名、MIME 类型、ffmpeg 编码参数
+FORMATS = {
+    "wav": {"ext": "wav", "media_type": "audio/wav", "args": None},
+    "mp3": {"ext": "mp3", "media_type": "audio/mpeg", "args": ["-codec:a", "libmp3lame", "-f", "mp3"]},
+    "opus": {"ext": "opus", "media_type": "audio/ogg", "args": ["-codec:a", "libopus", "-f", "ogg"]},
+}
+
+
+class TranscodeError(RuntimeError):
+    """转码失败"""
+
+
+class TranscoderUnavailable(TranscodeError):
+    """未找到 ffmpeg"""
+
+
+class Transcoder:
+    """基于 ffmpeg 子进程池的转码器"""
+
+    def __init__(self, ffmpeg_path: str, max_workers: int, timeout: float):
+        self.ffmpeg_path = ffmpeg_path
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._jobs: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def variant_path(source_path: str, fmt: str, bitrate: int) -> str:
+        """变体文件路径，如 tts_xxx.wav -> tts_xxx.64k.mp3"""
+        base, _ = os.path.splitext(source_path)
+        return f"{base}.{bitrate}k.{FORMATS[fmt]['ext']}"
+
+    async def get_variant(self, source_path: str, fmt: str, bitrate: Optional[int]) -> str:
+        """返回指定格式的音频文件路径，变体不存在（或比源文件旧）时转码生成"""
+        if FORMATS[fmt]["args"] is None:
+            return source_path
+
+        target_path = self.variant_path(source_path, fmt, bitrate)
+        try:
+            if os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+                return target_path
+        except OSError:
+            pass
+
+        job = self._jobs.get(target_path)
+        if job is None:
+            job = asyncio.create_task(self._encode(source_path, target_path, fmt, bitrate))
+            self._jobs[target_path] = job
+            job.add_done_callback(lambda _: self._jobs.pop(target_path, None))
+
+        # 某个请求断开时不取消共享的转码任务
+        await asyncio.shield(job)
+        return target_path
+
+    async def _encode(self, source_path: str, target_path: str, fmt: str, bitrate: int):
+        temp_path = f"{target_path}.part"
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    self.ffmpeg_path, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                    "-i", source_path, *FORMATS[fmt]["args"], "-b:a", f"{bitrate}k", temp_path,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            except FileNotFoundError:
+                raise TranscoderUnavailable(f"未找到 ffmpeg: {self.ffmpeg_path}")
+
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self._discard(temp_path)
+                raise TranscodeError(f"转码超时（{self.timeout} 秒）")
+
+            if process.returncode != 0:
+                self._discard(temp_path)
+                raise TranscodeError(f"转码失败: {stderr.decode(errors='replace').strip()}")
+
+            os.replace(temp_path, target_path)
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Qwen-TTS 批量任务工作进程
+从共享的任务队列（data/tasks.db）领取批量任务的分段进行合成，可与 Web 服务分开运行多个进程。
+工作进程需要与 Web 服务共享 data/ 和 audio_output/ 目录（同一台机器或同一个本地卷）。
+
+    python worker.py              # 1 个工作进程
+    python worker.py -n 4         # 4 个工作进程
+
+只使用独立工作进程时，可为 Web 服务设置 BATCH_EMBEDDED_WORKER=0，Web 进程只负责接收任务和查询进度。
+"""
+import sys
+import signal
+import asyncio
+import argparse
+import multiprocessing
+
+
+async def serve():
+    """运行工作协程，收到 SIGINT / SIGTERM 时归还租约后退出"""
+    import main
+
+    task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+
+    try:
+        await main.run_batch_worker_process()
+    except asyncio.CancelledError:
+        pass
+
+
+def run_worker():
+    asyncio.run(serve())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qwen-TTS 批量任务工作进程")
+    parser.add_argument("-n", "--processes", type=int, default=1, help="工作进程数")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker()
+        return
+
+    processes = [multiprocessing.Process(target=run_worker, name=f"worker-{i}") for i in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # 子进程与父进程在同一进程组，已各自收到 SIGINT
+        for process in processes:
+            process.join()
+
+    sys.exit(1 if any(process.exitcode for process in processes) else 0)
+
+
+if __name__ == "__main__":
+    main()
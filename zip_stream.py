@@ -0,0 +1,66 @@
+"""
+Qwen-TTS 流式 ZIP 打包
+边读取文件边生成 ZIP 数据，不产生临时文件，首字节时间与文件数量和大小无关
+"""
+import zipfile
+from typing import Iterator, Iterable, Tuple
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer:
+    """仅追加、不可定位的输出缓冲区，ZipFile 写入的数据由生成器逐段取走"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(files: Iterable[Tuple[str, str]], extra: Iterable[Tuple[str, bytes]] = ()) -> Iterator[bytes]:
+    """流式生成 ZIP 数据
+
+    files 为 (磁盘路径, 压缩包内文件名)，按块读取并以 ZIP_STORED 方式写入（WAV 几乎无法压缩）；
+    extra 为 (压缩包内文件名, 内容)，用于清单等小文件，放在最前面。
+    输出不可定位，ZipFile 会为每个条目写入数据描述符（data descriptor）。
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zip_file:
+        for arcname, content in extra:
+            zip_file.writestr(arcname, content)
+            yield buffer.drain()
+
+        for path, arcname in files:
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = zipfile.ZIP_STORED
+            force_zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT
+            with open(path, "rb") as src, zip_file.open(zinfo, "w", force_zip64=force_zip64) as dest:
+                while True:
+                    chunk = src.read(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            # 数据描述符
+            yield buffer.drain()
+
+    # 中央目录
+    yield buffer.drain()